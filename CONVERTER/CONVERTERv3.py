@@ -1,56 +1,120 @@
-import re
-from typing import List, Tuple
+import functools
+import sys
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from rich.segment import Segment
+from rich.style import Style
+from textual import events
 from textual.app import App, ComposeResult
+from textual.geometry import Size
+from textual.message import Message
 from textual.reactive import reactive
-from textual.containers import Vertical
-from textual.widgets import Header, Footer, Static, Input
+from textual.containers import Horizontal, Vertical
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
+from textual.widgets import Header, Footer, Static, Input, ProgressBar
+from textual.worker import Worker, get_current_worker
 
-EQUATION_PATTERN = re.compile(r'\s*y\s*=\s*([^{]+)\s*(?:{([^}]+)})?')
+# everything but the TUI is in core.py; the names are still importable from here
+from core import FORMAT_VERSION, PROGRAM_NAME, PROGRAM_SIZE, EquationProcessor  # noqa: F401
+from core import GenerationCancelled, GenerationError
+
+import colorrules
+import eqindex
+import exprparse
+import journal
+import peephole
+
+# formatted previews the TUI keeps around
+PREVIEW_CACHE = 4096
+# generating problems listed in the notification, the rest are counted
+FAILURES_SHOWN = 5
+
+class EquationList(ScrollView, can_focus=True):
+    """Virtualized list of equations: only the rows on screen get rendered, so 100k rows cost
+    the same per keystroke as 10. Shows whichever rows (equation indexes) it's given."""
+
+    BINDINGS = [
+        ("up", "move(-1)", "Up"),
+        ("down", "move(1)", "Down"),
+        ("pageup", "page(-1)", "Page Up"),
+        ("pagedown", "page(1)", "Page Down"),
+        ("home", "move(-1000000000)", "First"),
+        ("end", "move(1000000000)", "Last"),
+    ]
+
+    class Highlighted(Message):
+        """The cursor moved onto equation `index`."""
+
+        def __init__(self, index: int) -> None:
+            super().__init__()
+            self.index = index
+
+    def __init__(self, processor: EquationProcessor, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.processor = processor
+        self.rows: Sequence[int] = range(len(processor.valid_equations))
+        self.cursor = 0
+        # colors rules would give, shown until they're applied or dropped
+        self.preview: Dict[int, str] = {}
+
+    def set_rows(self, rows: Sequence[int]) -> None:
+        self.rows = rows
+        self.cursor = 0
+        self.virtual_size = Size(self.size.width, len(rows))
+        self.scroll_to(y=0, animate=False)
+        self.refresh()
+        if rows:
+            self.post_message(self.Highlighted(rows[0]))
+
+    def on_resize(self) -> None:
+        self.virtual_size = Size(self.size.width, len(self.rows))
+
+    def render_line(self, y: int) -> Strip:
+        row = y + self.scroll_offset.y
+        width = self.size.width
+        if row >= len(self.rows):
+            return Strip.blank(width)
+        index = self.rows[row]
+        expr, constraints = self.processor.valid_equations[index]
+        color = self.processor.colors.get(index) or self.preview.get(index) or self.processor.color_of(index, "")
+        text = f"{index + 1:>7} {color:<8} {eqindex.display_text(expr, constraints)}"
+        style = Style(reverse=True) if row == self.cursor else Style()
+        return Strip([Segment(text[:width].ljust(width), style)], width)
+
+    def move_to(self, row: int) -> None:
+        if not self.rows:
+            return
+        self.cursor = max(0, min(row, len(self.rows) - 1))
+        top, height = self.scroll_offset.y, self.size.height
+        if self.cursor < top:
+            self.scroll_to(y=self.cursor, animate=False)
+        elif self.cursor >= top + height:
+            self.scroll_to(y=self.cursor - height + 1, animate=False)
+        self.refresh()
+        self.post_message(self.Highlighted(self.rows[self.cursor]))
+
+    def jump_to_index(self, index: int) -> bool:
+        """Move the cursor to equation `index` if it's in the list."""
+        if isinstance(self.rows, range):
+            row = index if index in self.rows else -1
+        else:
+            row = bisect_left(self.rows, index)
+            row = row if row < len(self.rows) and self.rows[row] == index else -1
+        if row >= 0:
+            self.move_to(row)
+        return row >= 0
+
+    def action_move(self, step: int) -> None:
+        self.move_to(self.cursor + step)
+
+    def action_page(self, direction: int) -> None:
+        self.move_to(self.cursor + direction * max(1, self.size.height - 1))
+
+    def on_click(self, event: events.Click) -> None:
+        self.move_to(event.y + self.scroll_offset.y)
 
-class EquationProcessor:
-    """Handles equation processing and TI-BASIC code generation."""
-    
-    def __init__(self, input_file: str = "input.txt") -> None:
-        self.input_file = input_file
-        self.valid_equations: List[Tuple[str, str]] = []
-        self.colors: dict[int, str] = {}
-        self._process_input()
-
-    def _process_input(self) -> None:
-        """Load and validate equations from input file."""
-        with open(self.input_file, "r") as file:
-            for idx, line in enumerate(file):
-                if not (line := line.strip()):
-                    continue
-                if match := EQUATION_PATTERN.match(line):
-                    expr, constraints = match.groups()
-                    self.valid_equations.append((expr.strip(), (constraints or "").strip()))
-                else:
-                    with open("badeqn.txt", "a") as bad_file:
-                        bad_file.write(line + "\n")
-
-    @staticmethod
-    def format_piecewise(expr: str, constraints: str, color: str, y_index: int) -> str:
-        """Format TI-BASIC piecewise function."""
-        expr = expr.replace("x", "X").replace("y", "Y")
-        constraints = re.sub(r'(-?\d*\.?\d*)\s*<=\s*([XY])\s*<=\s*(-?\d*\.?\d*)',
-                            r'\1<=\2 and \2<=\3', constraints or "")
-        return f'"piecewise({expr},{constraints})"->Y{y_index}\nGraphColor(Y{y_index},{color})'
-
-    def generate_programs(self) -> None:
-        """Generate program files with equations and colors."""
-        for prog_num, i in enumerate(range(0, len(self.valid_equations), 10), 1):
-            chunk = self.valid_equations[i:i+10]
-            lines = [
-                self.format_piecewise(expr, constr, self.colors.get(i+j, "BLACK"), j)
-                for j, (expr, constr) in enumerate(chunk)
-            ]
-            lines += [
-                "DispGraph", "RecallPic 0", "StorePic 0", "ClrDraw", 
-                *(f"DelVar Y{k}" for k in range(10))
-            ]
-            with open(f"program{prog_num}.txt", "w") as f:
-                f.write("\n".join(lines))
 
 class EquationConverterApp(App):
     """TUI for assigning colors to equations."""
@@ -60,6 +124,29 @@ class EquationConverterApp(App):
         padding: 1;
         align: center middle;
     }
+
+    #list-pane {
+        width: 3fr;
+    }
+
+    #detail-pane {
+        width: 2fr;
+    }
+
+    #graph-pane {
+        width: auto;
+        display: none;
+    }
+
+    #graph {
+        border: heavy white;
+        width: auto;
+    }
+
+    #equation-list {
+        border: heavy white;
+        height: 1fr;
+    }
     
     #equation-display, #ti-display {
         border: heavy white;
@@ -76,48 +163,115 @@ class EquationConverterApp(App):
         content-align: center middle;
         text-align: center;
     }
+
+    #generate-container {
+        display: none;
+        height: auto;
+        margin: 1 0;
+    }
     """
     
     BINDINGS = [
         ("ctrl+b", "undo", "Undo"),
         ("ctrl+n", "skip", "Skip"),
-        ("ctrl+l", "generate", "Generate Programs"),
+        ("ctrl+l", "generate", "Generate Programs (again to cancel)"),
         ("ctrl+o", "submit_color", "Submit Color"),
+        ("ctrl+f", "focus_search", "Search"),
+        ("ctrl+r", "focus_rules", "Color Rules"),
+        ("ctrl+y", "apply_rules", "Apply Rules"),
+        ("ctrl+g", "toggle_graph", "Graph Preview"),
     ]
 
     current_index = reactive(0)
 
-    def __init__(self, processor: EquationProcessor) -> None:
+    def __init__(self, processor: EquationProcessor, **generate_options) -> None:
         super().__init__()
         self.processor = processor
+        # core.main's --ram-budget/--y-vars/--lines/--no-optimize, passed on to generate_programs by ctrl+l
+        self.generate_options = generate_options
         self.total = len(processor.valid_equations)
+        self.index = eqindex.EquationIndex(processor.valid_equations)
+        # formatted TI-BASIC of recently shown equations, so moving back and forth doesn't reformat
+        self.preview = functools.lru_cache(maxsize=PREVIEW_CACHE)(processor.format_function)
+        # rules text and what it matched, waiting for ctrl+y
+        self.pending_rules: Optional[Tuple[str, Dict[int, str]]] = None
+        # preview.GraphPreview once it's been drawn (needs numpy, so imported on first ctrl+g)
+        self.graph = None
+        # the worker writing the programs while ctrl+l runs
+        self.generating: Optional[Worker] = None
 
     def compose(self) -> ComposeResult:
         yield Header()
-        with Vertical(id="main-container"):
-            # Equation display with rounded corners
-            self.eq_display = Static(id="equation-display")
-            self.eq_display.styles.rounding = (1, 2)  # Rounded corners
-            yield self.eq_display
-
-            # TI-BASIC display with rounded corners
-            self.ti_display = Static(id="ti-display")
-            self.ti_display.styles.rounding = (1, 2)  # Rounded corners
-            yield self.ti_display
-
-            # Color input with rounded corners
-            with Vertical(id="input-container"):
-                self.color_input = Input(placeholder="Enter color code (any value)")
-                self.color_input.styles.rounding = (1, 1)  # Rounded corners
-                yield self.color_input
-
-            # Centered counter
-            self.counter = Static(id="counter")
-            yield self.counter
+        with Horizontal(id="main-container"):
+            with Vertical(id="list-pane"):
+                self.search = Input(placeholder="Search: text, type:linear, x:0..1 or #123 to jump", id="search")
+                yield self.search
+                self.rules_input = Input(value=self.processor.rules, id="rules",
+                                         placeholder="Color rules: type:trig=RED; /sqrt/=BLUE; x:0..5=GREEN; #1-500=ORANGE")
+                yield self.rules_input
+                self.equation_list = EquationList(self.processor, id="equation-list")
+                self.equation_list.styles.rounding = (1, 2)
+                yield self.equation_list
+
+            with Vertical(id="graph-pane"):
+                self.graph_view = Static(id="graph")
+                window = self.processor.window
+                self.graph_view.border_title = ("What the calculator draws "
+                                                f"({'ZStandard' if window is None else window})")
+                yield self.graph_view
+
+            with Vertical(id="detail-pane"):
+                # Equation display with rounded corners
+                self.eq_display = Static(id="equation-display")
+                self.eq_display.styles.rounding = (1, 2)  # Rounded corners
+                yield self.eq_display
+
+                # TI-BASIC display with rounded corners
+                self.ti_display = Static(id="ti-display")
+                self.ti_display.styles.rounding = (1, 2)  # Rounded corners
+                yield self.ti_display
+
+                # Color input with rounded corners
+                with Vertical(id="input-container"):
+                    self.color_input = Input(placeholder="Enter color code (any value)", id="color")
+                    self.color_input.styles.rounding = (1, 1)  # Rounded corners
+                    yield self.color_input
+
+                # Centered counter
+                self.counter = Static(id="counter")
+                yield self.counter
+
+                # progress of ctrl+l, only shown while it runs
+                with Vertical(id="generate-container"):
+                    self.generate_bar = ProgressBar(total=max(self.total, 1), show_eta=False, id="generate-bar")
+                    yield self.generate_bar
+                    self.generate_status = Static(id="generate-status")
+                    yield self.generate_status
         yield Footer()
 
     def on_mount(self) -> None:
         self.update_display()
+        self.color_input.focus()
+        if self.processor.import_stats:
+            self.notify(str(self.processor.import_stats))
+        if self.processor.merge_stats:
+            self.notify(str(self.processor.merge_stats))
+        if self.processor.cull_stats:
+            self.notify(str(self.processor.cull_stats))
+        if self.processor.resume_index:
+            self.equation_list.jump_to_index(min(self.processor.resume_index, self.total - 1))
+            self.notify(f"Resumed session: {len(self.processor.colors)} colors assigned")
+        if self.processor.session is not None:
+            self.set_interval(journal.FLUSH_INTERVAL, self._flush_session)
+        self.run_worker(self._build_index, thread=True, exclusive=True, group="index")
+
+    def _flush_session(self) -> None:
+        # fsync off the UI thread; the journal serializes overlapping flushes itself
+        self.run_worker(self.processor.session.flush, thread=True, group="journal")
+
+    def _build_index(self) -> None:
+        self.index.build_details()
+        self.call_from_thread(self.notify, "Search index ready (type: and x: filters)")
 
     def update_display(self) -> None:
         """Update all display elements."""
@@ -129,34 +283,206 @@ class EquationConverterApp(App):
 
         expr, constr = self.processor.valid_equations[self.current_index]
         y_idx = self.current_index % 10
-        color = self.processor.colors.get(self.current_index, "color")
+        color = self.processor.color_of(self.current_index, "color")
         
         self.eq_display.update(f"Equation: y = {expr} {{{constr}}}")
-        self.ti_display.update(f"TI-BASIC:\n{self.processor.format_piecewise(expr, constr, color, y_idx)}")
-        self.counter.update(f"Equation {self.current_index + 1}/{self.total}")
+        try:
+            self.ti_display.update(
+                f"TI-BASIC:\n{self.processor.format_assignment(self.preview(expr, constr), color, y_idx)}")
+        except exprparse.ParseError as e:  # loading only split the lines, generating rejects this one
+            self.ti_display.update(f"TI-BASIC: none, it doesn't parse and goes into badeqn.txt ({e})")
+        shown = len(self.equation_list.rows)
+        filtered = f" ({shown} shown)" if shown != self.total else ""
+        self.counter.update(f"Equation {self.current_index + 1}/{self.total}{filtered}")
         self.color_input.value = self.processor.colors.get(self.current_index, "")
 
+    def on_equation_list_highlighted(self, message: EquationList.Highlighted) -> None:
+        self.current_index = message.index
+        if self.processor.session is not None:
+            self.processor.session.record_position(message.index)
+        self.update_display()
+
+    def on_input_submitted(self, message: Input.Submitted) -> None:
+        if message.input is self.color_input:
+            self.action_submit_color()
+            return
+        if message.input is self.rules_input:
+            self.preview_rules(message.value.strip())
+            return
+        query = message.value.strip()
+        if query.lstrip("#").isdigit() and query.startswith("#"):
+            if not self.equation_list.jump_to_index(int(query[1:]) - 1):
+                self.notify(f"Equation {query} isn't in the list", severity="warning")
+            return
+        if ("type:" in query or "x:" in query) and not self.index.ready:
+            self.notify("Search index is still being built, try again in a moment", severity="warning")
+            return
+        rows = self.index.query(query)
+        if not rows:
+            self.notify("No matches", severity="warning")
+            return
+        self.equation_list.set_rows(rows)
+        self.equation_list.focus()
+
+    def action_focus_search(self) -> None:
+        self.search.focus()
+
+    def action_focus_rules(self) -> None:
+        self.rules_input.focus()
+
+    def preview_rules(self, text: str) -> None:
+        """Show what the rules would color (list filtered to the matches) without applying them."""
+        try:
+            rules = colorrules.parse_rules(text)
+        except colorrules.RuleError as e:
+            self.notify(str(e), severity="error")
+            return
+        self.notify("Matching rules...")
+        self.run_worker(functools.partial(self._match_rules, text, rules), thread=True, exclusive=True, group="rules")
+
+    def _match_rules(self, text: str, rules: List[colorrules.ColorRule]) -> None:
+        matched = self.processor.match_rules(rules)
+        self.call_from_thread(self._show_rule_preview, text, matched)
+
+    def _show_rule_preview(self, text: str, matched: Dict[int, str]) -> None:
+        self.pending_rules = (text, matched)
+        self.equation_list.preview = matched
+        counts: Dict[str, int] = {}
+        for color in matched.values():
+            counts[color] = counts.get(color, 0) + 1
+        overridden = sum(1 for index in matched if index in self.processor.colors)
+        summary = ", ".join(f"{count} {color}" for color, count in counts.items()) or "nothing"
+        self.notify(f"Rules would color {summary} ({overridden} keep their own color). ctrl+y applies")
+        self.equation_list.set_rows(sorted(matched) if matched else range(self.total))
+
+    def action_apply_rules(self) -> None:
+        if self.pending_rules is None:
+            self.notify("Enter rules and press enter to preview them first", severity="warning")
+            return
+        text, matched = self.pending_rules
+        changed = set(self.processor.rule_colors) | set(matched)
+        count = self.processor.apply_rules(text, matched)
+        self._recolor_graph(changed)
+        self.pending_rules = None
+        self.equation_list.preview = {}
+        self.equation_list.set_rows(range(self.total))
+        self.notify(f"Rules applied to {count} equations")
+
+    def action_toggle_graph(self) -> None:
+        """Show the graph preview in place of the list, or go back to the list."""
+        graph_pane, list_pane = self.query_one("#graph-pane"), self.query_one("#list-pane")
+        if graph_pane.display:
+            graph_pane.display, list_pane.display = False, True
+            return
+        if self.graph is None:
+            try:
+                import preview
+            except ImportError:
+                self.notify("The graph preview needs numpy (pip install numpy)", severity="error")
+                return
+            self.graph_view.update("Drawing...")
+            self.run_worker(functools.partial(self._draw_graph, preview), thread=True, exclusive=True, group="graph")
+        graph_pane.display, list_pane.display = True, False
+
+    def _draw_graph(self, preview) -> None:
+        graph = preview.GraphPreview(self.processor.valid_equations, self.processor.window or preview.WINDOW)
+        graph.draw()
+        self.call_from_thread(self._graph_ready, graph)
+
+    def _graph_ready(self, graph) -> None:
+        self.graph = graph
+        self.graph_view.update(graph.render(self.processor.color_of))
+
+    def _recolor_graph(self, changed: Iterable[int]) -> None:
+        if self.graph is not None:
+            self.graph_view.update(self.graph.render(self.processor.color_of, changed))
+
     def action_submit_color(self) -> None:
         if self.current_index >= self.total:
             return
-        color = self.color_input.value.strip().upper() or "BLACK"
-        self.processor.colors[self.current_index] = color
-        self.current_index += 1
-        self.update_display()
+        color = self.color_input.value.strip().upper() or self.processor.color_of(self.current_index)
+        self.processor.set_color(self.current_index, color)
+        self._recolor_graph([self.current_index])
+        self.equation_list.action_move(1)
+        self.equation_list.refresh()
 
     def action_undo(self) -> None:
-        if self.current_index > 0:
-            self.current_index -= 1
-            self.update_display()
+        self.equation_list.action_move(-1)
 
     def action_skip(self) -> None:
-        if self.current_index < self.total:
-            self.current_index += 1
-            self.update_display()
+        self.equation_list.action_move(1)
 
     def action_generate(self) -> None:
-        self.processor.generate_programs()
-        self.notify("Program files generated!")
+        """Write the programs in a worker so the list stays usable; pressed again while that runs, cancel it."""
+        if self.generating is not None:
+            self.generating.cancel()
+            self.generate_status.update("Cancelling...")
+            return
+        # the colors as they are now, so coloring on while it runs doesn't end up half in the programs
+        colors, rule_colors = dict(self.processor.colors), dict(self.processor.rule_colors)
+
+        def color_of(index: int) -> str:
+            return colors.get(index) or rule_colors.get(index, "BLACK")
+
+        self.generate_bar.update(progress=0)
+        self.generate_status.update("Generating...")
+        self.query_one("#generate-container").display = True
+        self.generating = self.run_worker(functools.partial(self._generate, color_of), thread=True,
+                                          exclusive=True, group="generate", exit_on_error=False)
+
+    def _generate(self, color_of) -> None:
+        worker = get_current_worker()
+        start = time.perf_counter()
+
+        def progress(programs: int, equations: int) -> None:
+            if worker.is_cancelled:
+                raise GenerationCancelled
+            rate = equations / max(time.perf_counter() - start, 1e-9)
+            self.call_from_thread(self._generate_progress, programs, equations, rate)
+
+        saved = peephole.PeepholeStats() if self.generate_options.get("optimize", True) else None
+        message, severity = "Generating failed, the old program files are untouched", "error"
+        try:
+            stats, files = self.processor.generate_programs(progress=progress, color_of=color_of, peephole_stats=saved,
+                                                            **self.generate_options)
+        except GenerationCancelled:
+            message, severity = "Generating cancelled, the old program files are untouched", "warning"
+        except GenerationError as e:
+            count, shown = len(e.failures), e.failures[:FAILURES_SHOWN]
+            if count > FAILURES_SHOWN:
+                shown.append(f"and {count - FAILURES_SHOWN} more")
+            message = "\n".join([f"Generating failed ({count} problem{'s' if count > 1 else ''}):", *shown,
+                                  "The old program files are untouched"])
+        except Exception as e:  # anything else mustn't take the app down with it
+            message = f"Generating failed: {type(e).__name__}: {e}. The old program files are untouched"
+        else:
+            message, severity = (f"Program files generated! {stats.redraws} redraws in {stats.programs} programs, "
+                                 f"{files.written} files changed"), "information"
+            if saved is not None:
+                message += f", {saved.before - saved.after} bytes saved by optimizing"
+            if self.processor.dedupe_stats:
+                message += f"\n{self.processor.dedupe_stats}"
+        finally:
+            try:
+                self.call_from_thread(self._generate_done, message, severity)
+            except RuntimeError:
+                pass  # the app was quit while generating
+
+    def _generate_progress(self, programs: int, equations: int, rate: float) -> None:
+        self.generate_bar.update(progress=equations)
+        if self.generating is not None:
+            self.generate_status.update(f"{programs} programs written, {equations:,}/{self.total:,} equations "
+                                        f"({rate:,.0f}/s), ctrl+l cancels")
+
+    def _generate_done(self, message: str, severity: str) -> None:
+        self.generating = None
+        self.query_one("#generate-container").display = False
+        self.notify(message, severity=severity)
+
+def main(argv=None) -> None:
+    """python CONVERTERv3.py [input.txt] [options] is python core.py --tui, see core.main for the options."""
+    import core
+    core.main(["--tui", *(sys.argv[1:] if argv is None else argv)])
 
 if __name__ == "__main__":
-    EquationConverterApp(EquationProcessor()).run()
+    main()
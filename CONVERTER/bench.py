@@ -0,0 +1,423 @@
+"""Benchmarks for every stage of the conversion, on synthetic Desmos dumps.
+
+Generates expressions.txt/input.txt style files (tracings of linear pieces that
+continue each other, trig and radical segments, and some malformed lines) of any
+size and times each stage on its own:
+
+    latex      LatexNodes2Text (pylatexenc), on --latex-sample lines since it's slow
+    fastlatex  fastlatex.py, what LaTeXTOASCII/pipeline.py actually use first
+    cleanup    the unicode/space cleanup rule set
+    parse      EQUATION_PATTERN + validation (EquationProcessor.parse_line)
+    load       EquationProcessor("input.txt") as the converter loads by default
+               (the EQUATION_PATTERN split into the equation store), from a temp folder
+    merge      segments.merge_equations
+    format     format_piecewise
+    write      packing + writing programN.txt/.8xp into a temp folder
+
+Results are lines per second (best of --repeat) and go to a JSON file. With a
+baseline saved (--save-baseline) every run compares against it and exits with 1
+if a stage got more than --threshold slower, so nightly jobs notice.
+It exits with 1 as well when ti8xp.check_golden() finds a golden/ program the
+.8xp writer no longer reproduces.
+
+Startup gets measured too, since cron jobs launching the converter on small
+inputs spend most of their time importing: `python -X importtime -c "import core"`
+(and pipeline), compared against the baseline the same way, and it fails outright
+if the batch modules drag in textual or pylatexenc again (--no-startup skips it).
+
+--memory also measures (tracemalloc) what EquationProcessor keeps per equation,
+eqstore.py's offsets and color array against the list of tuples and {index: color}
+dict it replaced, with every equation colored, and the peak while loading, plus
+how long loading takes against that old loader (the EQUATION_PATTERN split of
+every line into a list). All of it in the default configuration, like the
+converter runs. The store has to stay under MEMORY_LIMIT bytes an equation and
+loading under LOAD_LIMIT times the old loader; the store and the peak also
+within --threshold of the baseline.
+
+    python bench.py --sizes 1000 100000 --save-baseline
+    python bench.py --sizes 1000 100000 --threshold 0.15 -o results.json
+    python bench.py --generate 1000000 --data-dir big/   # just write the files
+    python bench.py --sizes 1000000 --stages parse --memory --no-startup
+"""
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from core import EquationProcessor
+
+import manifest
+import pipeline
+import segments
+import ti8xp
+
+import fastlatex  # next to LaTeXTOASCII.py, core.py puts that folder on sys.path
+import LaTeXTOASCII
+
+STAGES = ("latex", "fastlatex", "cleanup", "parse", "load", "merge", "format", "write")
+BASELINE_PATH = "bench-baseline.json"
+# fraction slower than the baseline that counts as a regression
+THRESHOLD = 0.2
+LATEX_SAMPLE = 5000
+# share of malformed lines in the generated files
+MALFORMED = 0.02
+# what the batch tools import, and what only the TUI / the LaTeX fallback may import
+STARTUP_MODULES = ("core", "pipeline")
+HEADLESS_FORBIDDEN = ("textual", "rich", "pylatexenc")
+HERE = os.path.dirname(os.path.abspath(__file__))
+# bytes per equation the equation store + colors may keep (--memory)
+MEMORY_LIMIT = 32
+# times the old list of tuples loader's seconds loading into the store may take (--memory)
+LOAD_LIMIT = 4
+
+MALFORMED_LINES = [
+    (r"y=\frac{1}{", "y=1/"),
+    (r"x=3\left\{0\le y\le1\right\}", "x=3{0<=y<=1}"),
+    (r"y=2x+\left(", "y=2x+("),
+    (r"\left\{0.26\le x\le0.4\right\}", "{0.26<=x<=0.4}"),
+]
+
+
+def _num(rng: random.Random, lo: float, hi: float) -> str:
+    return f"{rng.uniform(lo, hi):.3g}"
+
+
+def generate(count: int, seed: int = 0, malformed: float = MALFORMED) -> Iterator[Tuple[str, str]]:
+    """Yield count (LaTeX line, ASCII line) pairs that look like a Desmos tracing."""
+    rng = random.Random(seed)
+    x = 0.0
+    slope, intercept = "1", "0"
+    for _ in range(count):
+        kind = rng.random()
+        if kind < malformed:
+            yield rng.choice(MALFORMED_LINES)
+            continue
+        lo = f"{x:.3g}"
+        x = round(x + rng.uniform(0.05, 0.5), 2)
+        hi = f"{x:.3g}"
+        if x > 10:
+            x = -10.0
+        if kind < 0.7:
+            if rng.random() < 0.4:  # a new line every few pieces, otherwise the tracing continues it
+                slope, intercept = _num(rng, -5, 5), _num(rng, -5, 5)
+            sign = "" if intercept.startswith("-") else "+"
+            yield (rf"y={slope}x{sign}{intercept}\ \left\{{{lo}\ \le x\ \le{hi}\ \right\}}",
+                   f"y={slope}x{sign}{intercept} {{{lo}<=x<={hi}}}")
+        elif kind < 0.85:
+            a, b, c = _num(rng, 0.1, 3), _num(rng, 0.5, 4), _num(rng, 0, 3)
+            yield (rf"y={a}\sin\left({b}x\right)+{c}\left\{{{lo}\le x\le{hi}\right\}}",
+                   f"y={a}sin({b}x)+{c}{{{lo}<=x<={hi}}}")
+        else:
+            shift, c = _num(rng, 0, 2), _num(rng, 0, 3)
+            yield (rf"y=\sqrt{{x+{shift}}}+{c}\left\{{{lo}\le x\le{hi}\right\}}",
+                   f"y=sqrt(x+{shift})+{c}{{{lo}<=x<={hi}}}")
+
+
+def write_files(count: int, data_dir: str, seed: int = 0) -> Tuple[str, str]:
+    """Write expressions.txt and input.txt with count lines into data_dir."""
+    os.makedirs(data_dir, exist_ok=True)
+    latex_path, ascii_path = os.path.join(data_dir, "expressions.txt"), os.path.join(data_dir, "input.txt")
+    with open(latex_path, "w") as latex_file, open(ascii_path, "w") as ascii_file:
+        for latex, text in generate(count, seed):
+            latex_file.write(latex + "\n")
+            ascii_file.write(text + "\n")
+    return latex_path, ascii_path
+
+
+def best_time(func: Callable[[], object], repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run_stages(latex_lines: List[str], ascii_lines: List[str], stages: Sequence[str] = STAGES,
+               repeat: int = 3, latex_sample: int = LATEX_SAMPLE) -> Dict[str, dict]:
+    """Time each stage; returns {stage: {"lines": n, "seconds": s, "lines_per_s": r}}."""
+    results: Dict[str, dict] = {}
+
+    def timed(name: str, func: Callable[[], object], lines: int) -> None:
+        if name in stages:
+            seconds = best_time(func, repeat)
+            results[name] = {"lines": lines, "seconds": round(seconds, 6),
+                             "lines_per_s": round(lines / seconds, 1) if seconds else None}
+
+    sample = [line.replace("\\\\", "\\ \\") for line in latex_lines[:latex_sample]]
+    converter = LaTeXTOASCII.get_converter() if {"latex", "cleanup"} & set(stages) else None
+    timed("latex", lambda: [converter.latex_to_text(line) for line in sample], len(sample))
+
+    def fast() -> None:
+        for line in latex_lines:
+            try:
+                fastlatex.latex_to_ascii(line)
+            except fastlatex.Unsupported:
+                pass
+    timed("fastlatex", fast, len(latex_lines))
+
+    if "cleanup" in stages:
+        raw = [converter.latex_to_text(line) for line in sample]
+        timed("cleanup", lambda: [LaTeXTOASCII.LATEX_CLEANUP.apply(text).strip() for text in raw], len(raw))
+
+    parsed = [EquationProcessor.parse_line(line) for line in ascii_lines]
+    equations = [equation for equation in parsed if equation]
+    timed("parse", lambda: [EquationProcessor.parse_line(line) for line in ascii_lines], len(ascii_lines))
+    if "load" in stages:
+        with _input_file(ascii_lines):
+            timed("load", lambda: EquationProcessor("input.txt").valid_equations.nbytes(), len(ascii_lines))
+    timed("merge", lambda: segments.merge_equations(equations), len(equations))
+    timed("format", lambda: [EquationProcessor.format_piecewise(expr, constraints, "BLACK", i % 10)
+                             for i, (expr, constraints) in enumerate(equations)], len(equations))
+    if "write" in stages:
+        functions = [EquationProcessor.format_function(*equation) for equation in equations]
+        with tempfile.TemporaryDirectory() as out_dir:
+            def write() -> None:
+                files = manifest.Manifest(out_dir)
+                files.entries.clear()  # so every file really gets written, not skipped as unchanged
+                for number, program in enumerate(pipeline.build_programs(functions), 1):
+                    pipeline.write_program(files, number, program)
+                files.finish()
+            timed("write", write, len(functions))
+    return results
+
+
+def _traced(func: Callable[[], object]) -> Tuple[object, int, int]:
+    """func()'s result, the bytes it (still) holds and the most it held meanwhile, by tracemalloc."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = func()
+        peak = tracemalloc.get_traced_memory()[1]
+        gc.collect()  # also empties the tuple/float free lists, which tracemalloc counts as held
+        held = tracemalloc.get_traced_memory()[0]
+        return result, held - before, peak - before
+    finally:
+        tracemalloc.stop()
+
+
+@contextlib.contextmanager
+def _input_file(ascii_lines: List[str]) -> Iterator[None]:
+    """Run in a temp folder with ascii_lines as its input.txt (badeqn.txt goes in there too)."""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.chdir(data_dir)
+        try:
+            with open("input.txt", "w") as f:
+                f.write("\n".join(ascii_lines) + "\n")
+            yield
+        finally:
+            os.chdir(cwd)
+
+
+def memory(ascii_lines: List[str], repeat: int = 3) -> dict:
+    """Bytes valid_equations + colors keep after loading ascii_lines and the seconds loading takes, the old
+    list of tuples and dict vs eqstore.py's, and the most loading took on the way."""
+    def eager() -> Tuple[list, dict]:
+        # what loading was before eqstore.py: the EQUATION_PATTERN split of every line into a list
+        with open("input.txt") as f:
+            equations = [equation for equation in (EquationProcessor.split_line(line.strip()) for line in f)
+                         if equation]
+        return equations, {index: "RED" for index in range(len(equations))}
+
+    def stored() -> EquationProcessor:
+        processor = EquationProcessor("input.txt")
+        for index in range(len(processor.valid_equations)):
+            processor.colors[index] = "RED"
+        return processor
+
+    with _input_file(ascii_lines):
+        (equations, _), eager_bytes, _ = _traced(eager)
+        processor, store_bytes, peak_bytes = _traced(stored)
+        count = len(processor.valid_equations)
+        processor.valid_equations = None  # unmaps the file before it's deleted
+        eager_seconds = best_time(eager, repeat)
+        store_seconds = best_time(lambda: stored().valid_equations.nbytes(), repeat)
+    return {"equations": count, "list_bytes": eager_bytes, "store_bytes": store_bytes, "peak_bytes": peak_bytes,
+            "list_per_equation": round(eager_bytes / max(len(equations), 1), 1),
+            "store_per_equation": round(store_bytes / max(count, 1), 1),
+            "peak_per_equation": round(peak_bytes / max(count, 1), 1),
+            "list_seconds": round(eager_seconds, 6), "store_seconds": round(store_seconds, 6)}
+
+
+def compare_memory(results: Dict[str, dict], baseline: Dict[str, float], peak_baseline: Dict[str, float],
+                   threshold: float = THRESHOLD) -> List[str]:
+    """Sizes whose store keeps more than MEMORY_LIMIT (or threshold more than the baseline) bytes an equation,
+    whose loading peaked threshold more than the baseline or took over LOAD_LIMIT times the old loader."""
+    regressions = []
+    for size, result in results.items():
+        per_equation = result["store_per_equation"]
+        if per_equation > MEMORY_LIMIT:
+            regressions.append(f"memory @ {size} lines: {per_equation:.1f} bytes/equation, over {MEMORY_LIMIT}")
+        base = baseline.get(size)
+        if base and per_equation > base * (1 + threshold):
+            regressions.append(f"memory @ {size} lines: {per_equation:.1f} bytes/equation vs {base:.1f} baseline")
+        peak, base = result["peak_per_equation"], peak_baseline.get(size)
+        if base and peak > base * (1 + threshold):
+            regressions.append(f"memory peak @ {size} lines: {peak:.1f} bytes/equation vs {base:.1f} baseline")
+        if result["store_seconds"] > result["list_seconds"] * LOAD_LIMIT:
+            regressions.append(f"load @ {size} lines: {result['store_seconds']:.3f}s, over {LOAD_LIMIT}x the "
+                               f"{result['list_seconds']:.3f}s of a list of tuples")
+    return regressions
+
+
+def startup(module: str, repeat: int = 3) -> dict:
+    """Best of repeat `python -X importtime -c "import module"` runs: wall time, import time, heaviest imports."""
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)  # time it with .pyc files, like any install after the first run
+    command = [sys.executable, "-X", "importtime", "-c", f"import {module}"]
+    subprocess.run(command, cwd=HERE, env=env, capture_output=True, check=True)  # writes the .pyc files
+    best: Optional[dict] = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stderr = subprocess.run(command, cwd=HERE, env=env, capture_output=True, text=True, check=True).stderr
+        seconds = time.perf_counter() - start
+        imports = []  # (cumulative us, self us, name) of every module imported
+        for line in stderr.splitlines():
+            if line.startswith("import time:") and "|" in line:
+                own, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+                if own.isdigit():
+                    imports.append((int(cumulative), int(own), name))
+        total = next(cumulative for cumulative, _, name in reversed(imports) if name == module)
+        if best is None or total < best["import_us"]:
+            names = {name.split(".")[0] for _, _, name in imports}
+            heaviest = sorted(imports, key=lambda item: -item[1])[:5]
+            best = {"seconds": round(seconds, 6), "import_us": total, "modules": len(imports),
+                    "heaviest": [f"{name} {own / 1000:.1f}ms" for _, own, name in heaviest],
+                    "forbidden": sorted(names.intersection(HEADLESS_FORBIDDEN))}
+    return best
+
+
+def compare(results: Dict[str, Dict[str, dict]], baseline: Dict[str, Dict[str, float]],
+            threshold: float = THRESHOLD) -> List[str]:
+    """Stages more than threshold slower than the baseline (by lines/s), as messages."""
+    regressions = []
+    for size, stages in results.items():
+        for stage, result in stages.items():
+            base = baseline.get(size, {}).get(stage)
+            rate = result["lines_per_s"]
+            if base and rate and rate < base * (1 - threshold):
+                regressions.append(f"{stage} @ {size} lines: {rate:,.0f} lines/s vs {base:,.0f} baseline "
+                                   f"({100 * (1 - rate / base):.0f}% slower)")
+    return regressions
+
+
+def compare_startup(results: Dict[str, dict], baseline: Dict[str, float],
+                    threshold: float = THRESHOLD) -> List[str]:
+    """Modules that import something only the TUI/LaTeX fallback should, or got slower to import, as messages."""
+    regressions = []
+    for module, result in results.items():
+        if result["forbidden"]:
+            regressions.append(f"import {module} pulls in {', '.join(result['forbidden'])}")
+        base = baseline.get(module)
+        if base and result["import_us"] > base * (1 + threshold):
+            regressions.append(f"import {module}: {result['import_us'] / 1000:.1f}ms vs {base / 1000:.1f}ms baseline "
+                               f"({100 * (result['import_us'] / base - 1):.0f}% slower)")
+    return regressions
+
+
+def load_baseline(path: str) -> Dict[str, Dict[str, float]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Time each conversion stage on synthetic Desmos dumps.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="lines per generated file (default %(default)s)")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES), help="stages to time")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage, the best one counts")
+    parser.add_argument("--latex-sample", type=int, default=LATEX_SAMPLE,
+                        help="lines the (slow) pylatexenc stages get (default %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="write the results as JSON here")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON (default %(default)s)")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="fraction slower than the baseline that fails (default %(default)s)")
+    parser.add_argument("--generate", type=int, metavar="LINES",
+                        help="only write expressions.txt/input.txt with this many lines into --data-dir")
+    parser.add_argument("--data-dir", default=".", help="where --generate writes")
+    parser.add_argument("--no-startup", action="store_true", help="don't time importing the batch modules")
+    parser.add_argument("--memory", action="store_true",
+                        help="also measure what the loaded equations and colors take per equation")
+    args = parser.parse_args(argv)
+
+    if args.generate:
+        for path in write_files(args.generate, args.data_dir, args.seed):
+            print(f"wrote {path}")
+        return 0
+
+    results: Dict[str, Dict[str, dict]] = {}
+    memories: Dict[str, dict] = {}
+    for size in args.sizes:
+        pairs = list(generate(size, args.seed))
+        results[str(size)] = stages = run_stages([latex for latex, _ in pairs], [text for _, text in pairs],
+                                                 args.stages, args.repeat, args.latex_sample)
+        for stage, result in stages.items():
+            print(f"{size:>9} lines  {stage:<10} {result['lines_per_s']:>14,.0f} lines/s "
+                  f"({result['seconds']:.3f}s for {result['lines']})")
+        if args.memory:
+            memories[str(size)] = result = memory([text for _, text in pairs], args.repeat)
+            print(f"{size:>9} lines  memory     {result['store_bytes'] / 2**20:>10.1f} MiB "
+                  f"({result['store_per_equation']:.1f} bytes/equation) vs {result['list_bytes'] / 2**20:.1f} MiB "
+                  f"({result['list_per_equation']:.1f}) as tuples and a dict, peak "
+                  f"{result['peak_bytes'] / 2**20:.1f} MiB while loading")
+            print(f"{size:>9} lines  load       {result['store_seconds']:>10.3f} s vs {result['list_seconds']:.3f} s "
+                  f"as tuples and a dict ({result['store_seconds'] / result['list_seconds']:.1f}x)")
+
+    startups: Dict[str, dict] = {}
+    if not args.no_startup:
+        for module in STARTUP_MODULES:
+            startups[module] = result = startup(module, args.repeat)
+            print(f"  import {module:<10} {result['import_us'] / 1000:>8.1f}ms import, {result['seconds']:.3f}s "
+                  f"to start, {result['modules']} modules (heaviest: {', '.join(result['heaviest'])})")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"python": platform.python_version(), "platform": platform.platform(),
+                       "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results, "startup": startups,
+                       "memory": memories},
+                      f, indent=2)
+
+    # the .8xp writer has no timing to regress, but a bench run that passes shouldn't ship broken files
+    broken = [stem for stem, ok in ti8xp.check_golden().items() if not ok]
+    for stem in broken:
+        print(f"FAIL ti8xp: golden/{stem}.txt doesn't tokenize to golden/{stem}.8xp")
+
+    baseline = load_baseline(args.baseline)
+    regressions = compare(results, baseline, args.threshold)
+    regressions += compare_startup(startups, baseline.get("startup", {}), args.threshold)
+    regressions += compare_memory(memories, baseline.get("memory", {}), baseline.get("memory_peak", {}),
+                                  args.threshold)
+    if args.save_baseline:
+        for size, stages in results.items():
+            baseline.setdefault(size, {}).update({stage: r["lines_per_s"] for stage, r in stages.items()})
+        baseline.setdefault("startup", {}).update({module: r["import_us"] for module, r in startups.items()})
+        baseline.setdefault("memory", {}).update({size: r["store_per_equation"] for size, r in memories.items()})
+        baseline.setdefault("memory_peak", {}).update({size: r["peak_per_equation"] for size, r in memories.items()})
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"baseline saved to {args.baseline}")
+    elif regressions:
+        print(f"REGRESSIONS (more than {args.threshold:.0%} slower):")
+        for message in regressions:
+            print("  " + message)
+        return 1
+    return 1 if broken else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
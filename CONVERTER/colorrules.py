@@ -0,0 +1,98 @@
+"""Color rules: give whole groups of equations a color at once instead of one ctrl+o at a time.
+
+Rules are separated by ";", each one is some terms, "=" and a color. All terms of
+a rule have to match (none at all matches everything), and later rules win over
+earlier ones:
+
+    type:trig=RED; /sqrt/=BLUE; x:0..5 type:lin=GREEN; #1-500=ORANGE
+
+- type:<name>  function type (exprparse.FUNCTION_TYPES), any prefix: lin, trig, quad...
+- /<regex>/    searched in the expression as written in input.txt (can't contain ;)
+- x:<lo>..<hi> the equation's x domain lies inside lo..hi (either side optional)
+- #<a>-<b>     equation numbers a to b, as shown in the TUI (#<a> for just one)
+"""
+import math
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Pattern, Tuple
+
+import exprparse
+
+# GraphColor colors (in token order, 10 = BLUE ... 24 = DARKGRAY) as they look on the CE
+GRAPH_COLORS = {
+    "BLUE": "#0000ff", "RED": "#ff0000", "BLACK": "#000000", "MAGENTA": "#ff00ff", "GREEN": "#009f00",
+    "ORANGE": "#ff8f20", "BROWN": "#b62020", "NAVY": "#000086", "LTBLUE": "#0093ff", "YELLOW": "#e0e000",
+    "WHITE": "#ffffff", "LTGRAY": "#e7e3e7", "MEDGRAY": "#c7c3c7", "GRAY": "#8e8a8e", "DARKGRAY": "#515151",
+}
+RULE_TERM = re.compile(r'\s*(?:type:(\w+)|x:(-?[\d.]*)\.\.(-?[\d.]*)|#(\d+)(?:-(\d+))?|/((?:[^/\\]|\\.)*)/)',
+                       re.IGNORECASE)
+
+
+class RuleError(ValueError):
+    """Rule text that doesn't follow the syntax above."""
+
+
+@dataclass(frozen=True)
+class ColorRule:
+    color: str
+    function_type: Optional[str] = None  # lower-cased prefix
+    pattern: Optional[Pattern] = None
+    x_box: Optional[Tuple[float, float]] = None
+    numbers: Optional[Tuple[int, int]] = None  # 0-based equation indexes, inclusive
+
+    @property
+    def needs_details(self) -> bool:
+        """Whether matching has to parse the equation (type or domain terms)."""
+        return self.function_type is not None or self.x_box is not None
+
+    def matches(self, index: int, expr: str, details) -> bool:
+        """details() gives (function type, (lo, hi) or None) and is only called when needed."""
+        if self.numbers is not None and not self.numbers[0] <= index <= self.numbers[1]:
+            return False
+        if self.pattern is not None and not self.pattern.search(expr):
+            return False
+        if not self.needs_details:
+            return True
+        function_type, bounds = details()
+        if self.function_type is not None and not function_type.lower().startswith(self.function_type):
+            return False
+        if self.x_box is not None:
+            return bounds is not None and self.x_box[0] <= bounds[0] and bounds[1] <= self.x_box[1]
+        return True
+
+
+def parse_rule(text: str) -> ColorRule:
+    terms, sep, color = text.rpartition("=")
+    color = color.strip().upper()
+    if not sep or not color:
+        raise RuleError(f"rule {text.strip()!r} needs '= COLOR' at the end")
+    fields = {}
+    pos = 0
+    terms = terms.rstrip()
+    while pos < len(terms):
+        if not (match := RULE_TERM.match(terms, pos)):
+            raise RuleError(f"can't read {terms[pos:].strip()!r} in rule {text.strip()!r}")
+        type_name, lo, hi, first, last, pattern = match.groups()
+        if type_name:
+            if not any(name.lower().startswith(type_name.lower()) for name in exprparse.FUNCTION_TYPES):
+                raise RuleError(f"unknown function type {type_name!r}")
+            fields["function_type"] = type_name.lower()
+        elif first:
+            fields["numbers"] = (int(first) - 1, int(last or first) - 1)
+        elif pattern is not None:
+            try:
+                fields["pattern"] = re.compile(pattern)
+            except re.error as e:
+                raise RuleError(f"bad regex /{pattern}/: {e}") from None
+        else:
+            try:
+                fields["x_box"] = (float(lo) if lo else -math.inf, float(hi) if hi else math.inf)
+            except ValueError:
+                raise RuleError(f"bad domain x:{lo}..{hi}") from None
+        pos = match.end()
+    return ColorRule(color, **fields)
+
+
+def parse_rules(text: str) -> List[ColorRule]:
+    """Parse ';'-separated rules. Raises RuleError with what's wrong."""
+    return [parse_rule(part) for part in text.split(";") if part.strip()]
@@ -0,0 +1,643 @@
+"""The converter without the TUI: parsing input.txt, formatting piecewise( functions and packing programs.
+
+Everything that turns equations into programs lives here, so the batch tools
+(pipeline.py, bench.py, the cron jobs) don't pay for importing textual. The TUI
+(CONVERTERv3.py) is a front end over EquationProcessor, and pylatexenc only gets
+loaded by LaTeXTOASCII.py when a line needs it. Runs headless too:
+
+    python core.py input.txt --rules "type:trig=RED; /sqrt/=BLUE"
+    python core.py input.txt --tui        # same as python CONVERTERv3.py
+"""
+import decimal
+import functools
+import os
+import re
+import sys
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# shared helpers (convcache, ...) live next to LaTeXTOASCII.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "LaTeXTOASCII"))
+
+import colorrules  # noqa: E402
+import culling  # noqa: E402
+import dedupe  # noqa: E402
+import eqstore  # noqa: E402
+import exprparse  # noqa: E402
+import journal  # noqa: E402
+import manifest  # noqa: E402
+import packer  # noqa: E402
+import peephole  # noqa: E402
+import runstats  # noqa: E402
+import segments  # noqa: E402
+import sinks  # noqa: E402
+import ti8xp  # noqa: E402
+
+# Bump whenever format_function output changes so cached results from older runs miss
+FORMAT_VERSION = 2
+# expression, then any number of {restriction} groups ({0<x<1}{y>0} is how Desmos writes several)
+EQUATION_PATTERN = re.compile(r'\s*y\s*=\s*([^{]+)\s*((?:{[^}]*}\s*)*)')
+CONDITION_PATTERN = re.compile(r'{([^}]*)}')
+# reject_reason() (and dropped duplicates) -> the code badeqn.txt lines start with
+REJECT_CODES = {"not y=...": "NOT_Y", "bad expression": "BAD_EXPR", "bad restriction": "BAD_RESTRICTION",
+                "duplicate": dedupe.CODE}
+# Y-vars per redraw (Y0..Y9)
+PROGRAM_SIZE = packer.Y_VARS
+# on-calculator name of programN.8xp (8 characters max)
+PROGRAM_NAME = "EQ{}"
+# --format: which of programN.txt and programN.8xp get written
+FORMATS = ("txt", "8xp", "both")
+# draw what's in the Y-vars on top of the picture so far and save it; followed by a DelVar per Y-var used.
+# Line( commands go right after DispGraph, so StorePic catches them before ClrDraw wipes them
+REDRAW = ["DispGraph", "RecallPic 0", "StorePic 0", "ClrDraw"]
+# what format_function output starts with when it's a segment to draw instead of a Y-var function
+LINE = "Line("
+# equations between generate_programs progress calls (besides one per program)
+PROGRESS_STEP = 500
+
+
+class GenerationCancelled(Exception):
+    """Raised by a generate_programs progress callback to stop it. The old programs stay."""
+
+
+class GenerationError(Exception):
+    """Programs couldn't be generated (bad colors, unwritable files, ...). The old programs stay.
+
+    failures lists every problem with where it was, not just the first one.
+    """
+
+    def __init__(self, failures: List[str]) -> None:
+        super().__init__("; ".join(failures))
+        self.failures = failures
+
+
+class EquationProcessor:
+    """Handles equation processing and TI-BASIC code generation."""
+    
+    def __init__(self, input_file: str = "input.txt", merge: bool = False,
+                 session: Optional[journal.SessionJournal] = None,
+                 run_stats: runstats.RunStats = runstats.NULL_STATS,
+                 window: Optional[culling.Window] = None, deduplicate: bool = True,
+                 dedupe_tolerance: float = 0.0) -> None:
+        self.input_file = input_file
+        # graph window equations get culled/clipped to, None keeps them all
+        self.window = window
+        self.run_stats = run_stats
+        # (expr, constraints) of every equation, parsed when asked for (see eqstore.py)
+        self.valid_equations = eqstore.EquationStore()
+        # colors entered per equation; they override the ones from rules
+        self.colors = eqstore.ColorTable(0)
+        self.rules = ""
+        self.rule_colors: Dict[int, str] = {}
+        self._details: Dict[int, Tuple[str, Optional[Tuple[float, float]]]] = {}
+        # equations drawing the same as an earlier one of their color get dropped by generate_programs
+        self.deduplicate, self.dedupe_tolerance = deduplicate, dedupe_tolerance
+        self.dedupe_stats: Optional[dedupe.DedupeStats] = None
+        self.merge_stats: Optional[segments.MergeStats] = None
+        self.cull_stats: Optional[culling.CullStats] = None
+        self.import_stats = None  # desmos.ImportStats for a .json input
+        # equation to continue from when a journaled session was resumed
+        self.resume_index = 0
+        self.session = session
+        if session is not None:
+            key = session.input_key(input_file, merge, window, FORMAT_VERSION)
+            if session.load(key):
+                # the journal keeps using the store too, instead of its own list
+                self.valid_equations = session.equations = eqstore.EquationStore.of(session.equations)
+                self.colors = eqstore.ColorTable(len(self.valid_equations), session.colors)
+                self.rules, self.rule_colors = session.rules, dict(session.rule_colors)
+                self.resume_index = session.position
+                return
+        merger = segments.Merger() if merge else None
+        colors = self._process_input(merger, validate=merge or window is not None)
+        if merger is not None:
+            self.merge_stats = segments.MergeStats()
+            with run_stats.stage("merge"):
+                merged = merger.merged(self.merge_stats)
+            self.valid_equations = self.valid_equations.select(merged)
+            colors = [colors[index] for index, _ in merged]
+            del merged
+        if window is not None:
+            self.cull_stats = culling.CullStats()
+            with run_stats.stage("cull"):
+                kept = list(culling.cull_indexed(self.valid_equations, window, self.cull_stats))
+            self.valid_equations = self.valid_equations.select(kept)
+            colors = [colors[index] for index, _ in kept]
+            del kept
+        self.colors = eqstore.ColorTable(len(colors))
+        for index, color in enumerate(colors):
+            if color:
+                self.colors[index] = color
+        if session is not None:
+            session.start(key, self.valid_equations, self.colors)
+
+    def _process_input(self, merger: Optional[segments.Merger] = None, validate: bool = False) -> List[str]:
+        """Load equations from input file, only checking that they're y=... (EquationProcessor.split_line).
+
+        Parsing them, and dropping duplicates, waits for generate_programs, which parses
+        every equation anyway, so opening a big input costs about what reading it does.
+        With validate (merging or culling need the trees) every line is parsed here
+        instead and the ones that don't parse are rejected; merger gets the trees.
+
+        Lines can carry a color after a tab ("y=2x<tab>RED", what desmos.py writes);
+        returns them ("" for none) in the order of valid_equations. Only equations
+        of the same color get merged. Lines of the file are kept as where they are
+        in it (eqstore.EquationStore).
+        """
+        stats = self.run_stats
+        rejects = sinks.RejectStream(sinks.REJECTS_NAME)
+        colors: List[str] = []
+        try:
+            for raw, start in self._input_lines():
+                line = raw.lstrip()
+                if start is not None:
+                    start += len(raw[:len(raw) - len(line)].encode())
+                line, _, color = line.partition("\t")
+                if not (line := line.rstrip()):
+                    continue
+                color = sys.intern(color.strip().upper())
+                stats.count("lines")
+                with stats.stage("parse"):
+                    parsed = self.parse(line) if validate else self.split_line(line)
+                if parsed:
+                    if validate:
+                        equation, (tree, conditions) = parsed
+                    else:
+                        equation = parsed
+                    if merger is not None:
+                        with stats.stage("merge"):
+                            simplified = exprparse.simplify(tree), exprparse.simplify_conditions(conditions)
+                            merger.add(len(self.valid_equations), equation, simplified, color)
+                    if start is None:
+                        self.valid_equations.append(equation)
+                    else:
+                        self.valid_equations.add(start, len(line.encode()))
+                    colors.append(color)
+                else:
+                    reason = self.reject_reason(line)
+                    stats.reject(reason)
+                    rejects.write(line, REJECT_CODES[reason])
+        except BaseException:
+            rejects.abort()
+            raise
+        rejects.close()
+        return colors
+
+    def _input_lines(self) -> Iterator[Tuple[str, Optional[int]]]:
+        """(line, byte offset in the input file) for every line, starting a new valid_equations on it.
+
+        A .json input is read as a Desmos graph state (desmos.py); its lines aren't
+        in the file, so their offset is None.
+        """
+        if self.input_file.lower().endswith(".json"):
+            import desmos  # only for Desmos states, it loads LaTeXTOASCII
+
+            self.valid_equations = eqstore.EquationStore(split=self.split_line)
+            self.import_stats = desmos.ImportStats()
+            with self.run_stats.stage("import"):
+                for line in desmos.ascii_lines(self.input_file, run_stats=self.run_stats, stats=self.import_stats):
+                    yield line, None
+            return
+        self.valid_equations = eqstore.EquationStore(self.input_file, self.split_line)
+        data, start = self.valid_equations.data, 0
+        while start < len(data):
+            end = data.find(b"\n", start)
+            end = len(data) if end < 0 else end
+            yield data[start:end].decode(), start
+            start = end + 1
+
+    @staticmethod
+    def split_line(line: str) -> Optional[Tuple[str, str]]:
+        """(expression, constraints) of an ASCII equation without checking that they parse, or None."""
+        if not (match := EQUATION_PATTERN.match(line)):
+            return None
+        expr, groups = match.groups()
+        return expr.strip(), ", ".join(c.strip() for c in CONDITION_PATTERN.findall(groups) if c.strip())
+
+    @staticmethod
+    def join_line(expr: str, constraints: str) -> str:
+        """An input line for (expression, constraints), the reverse of split_line."""
+        return f"y={expr}{{{constraints}}}" if constraints else f"y={expr}"
+
+    @staticmethod
+    def parse_line(line: str) -> Optional[Tuple[str, str]]:
+        """Split an ASCII equation into (expression, constraints), or None if invalid.
+
+        Several restriction groups are joined with commas. Lines whose expression or
+        constraints don't parse are invalid too.
+        """
+        parsed = EquationProcessor.parse(line)
+        return parsed and parsed[0]
+
+    @staticmethod
+    def parse(line: str) -> Optional[Tuple[Tuple[str, str], dedupe.Parsed]]:
+        """parse_line(), along with the (expression tree, conditions) it parsed for merging to reuse."""
+        if not (equation := EquationProcessor.split_line(line)):
+            return None
+        expr, constraints = equation
+        try:
+            trees = exprparse.parse_expression(expr), exprparse.parse_conditions(constraints)
+        except exprparse.ParseError:
+            return None
+        return equation, trees
+
+    def set_color(self, index: int, color: str) -> None:
+        """Assign a color to equation index (journaled when there's a session)."""
+        self.colors[index] = color
+        if self.session is not None:
+            self.session.record_color(index, color)
+
+    def color_of(self, index: int, default: str = "BLACK") -> str:
+        """The color equation index gets: its own if it has one, else from the rules."""
+        return self.colors.get(index) or self.rule_colors.get(index, default)
+
+    @staticmethod
+    def identify_function_type(expr: str) -> str:
+        """One of exprparse.FUNCTION_TYPES (Linear, Trigonometric, ...). Raises exprparse.ParseError."""
+        return exprparse.function_type(exprparse.simplify(exprparse.parse_expression(expr)))
+
+    def equation_details(self, index: int) -> Tuple[str, Optional[Tuple[float, float]]]:
+        """(function type, x interval or None) of equation index, parsed once."""
+        if (details := self._details.get(index)) is None:
+            expr, constraints = self.valid_equations[index]
+            try:
+                bounds = segments.interval(exprparse.simplify_conditions(exprparse.parse_conditions(constraints)))
+                details = (self.identify_function_type(expr), bounds and (bounds[0], bounds[3]))
+            except exprparse.ParseError:  # generate_programs rejects it, nothing to match on
+                details = ("Other", None)
+            self._details[index] = details
+        return details
+
+    def match_rules(self, rules: Sequence[colorrules.ColorRule]) -> Dict[int, str]:
+        """The color every equation gets from rules (later rules win), without assigning anything."""
+        matched: Dict[int, str] = {}
+        for index, (expr, _) in enumerate(self.valid_equations):
+            details = functools.partial(self.equation_details, index)
+            for rule in reversed(rules):
+                if rule.matches(index, expr, details):
+                    matched[index] = rule.color
+                    break
+        return matched
+
+    def apply_rules(self, text: str, matched: Optional[Dict[int, str]] = None) -> int:
+        """Color equations by the rules in text (see colorrules), replacing earlier rules.
+
+        Colors entered per equation stay and keep overriding. Returns how many equations
+        the rules colored. Raises colorrules.RuleError for bad rules.
+        """
+        if matched is None:
+            matched = self.match_rules(colorrules.parse_rules(text))
+        self.rules, self.rule_colors = text, matched
+        if self.session is not None:
+            self.session.record_rules(text, matched)
+        return len(matched)
+
+    @staticmethod
+    def reject_reason(line: str) -> str:
+        """Why parse_line rejects line, for the --stats reject counts."""
+        if not (match := EQUATION_PATTERN.match(line)):
+            return "not y=..."
+        try:
+            exprparse.parse_expression(match.group(1).strip())
+        except exprparse.ParseError:
+            return "bad expression"
+        return "bad restriction"
+
+    @classmethod
+    def format_function(cls, expr: str, constraints: str, draw_lines: bool = False) -> str:
+        """Format the TI-BASIC function for one equation: piecewise(...) if it has constraints.
+
+        With draw_lines, straight segments become "Line(x1,y1,x2,y2" instead (see format_line).
+        Raises exprparse.ParseError for text parse_line would have rejected.
+        """
+        return cls.format_simplified(*cls.simplified(expr, constraints), draw_lines)
+
+    @staticmethod
+    def simplified(expr: str, constraints: str) -> dedupe.Parsed:
+        """The simplified (expression tree, conditions) of an equation. Raises exprparse.ParseError."""
+        return (exprparse.simplify(exprparse.parse_expression(expr)),
+                exprparse.simplify_conditions(exprparse.parse_conditions(constraints or "")))
+
+    @classmethod
+    def format_simplified(cls, tree: exprparse.Node, conditions: List[exprparse.Compare],
+                          draw_lines: bool = False) -> str:
+        """format_function() for an equation simplified() already."""
+        if draw_lines and (segment := cls.format_line(tree, conditions)) is not None:
+            return segment
+        body = exprparse.emit(tree)
+        if not conditions:
+            return body
+        return f"piecewise({body},{exprparse.emit_conditions(conditions)})"
+
+    @staticmethod
+    def format_line(tree: exprparse.Node, conditions: List[exprparse.Compare]) -> Optional[str]:
+        """ "Line(x1,y1,x2,y2" for a linear (simplified) expression restricted to a bounded x range, else None.
+
+        The calculator draws that once instead of evaluating a Y-var at every pixel column.
+        Strict bounds are drawn inclusive, which is less than a pixel. The endpoints are
+        folded exactly, like simplify() does, so they read like the input's numbers
+        (with pi or e in there they're computed to 12 digits instead).
+        """
+        if (line := exprparse.linear(tree)) is None:
+            return None
+        bounds = segments.interval(conditions)
+        if bounds is None:
+            return None
+        lo, lo_text, lo_strict, hi, hi_text, hi_strict = bounds
+        if lo_text is None or hi_text is None or lo > hi or (lo == hi and (lo_strict or hi_strict)):
+            return None  # unbounded (the Y-var draws it to the edges) or empty
+        points = []
+        for value, text in ((lo, lo_text), (hi, hi_text)):
+            x = exprparse.Num(value, text)
+            y = exprparse.simplify(exprparse.substitute(tree, "X", x))
+            if not isinstance(y, exprparse.Num):
+                y = exprparse.number(decimal.Decimal(f"{line[0] * value + line[1]:.12g}"))
+            points += [exprparse.emit(x), exprparse.emit(y)]
+        return LINE + ",".join(points)
+
+    @staticmethod
+    def format_draw(segment: str, color: str) -> str:
+        """Draw a format_line segment in color (1 = draw, not erase)."""
+        return f"{segment},1,{color})"
+
+    @staticmethod
+    def format_assignment(function: str, color: str, y_index: int) -> str:
+        """Store a formatted function in Y{y_index} and give it a color."""
+        return f'"{function}"->Y{y_index}\nGraphColor(Y{y_index},{color})'
+
+    @classmethod
+    def format_piecewise(cls, expr: str, constraints: str, color: str, y_index: int) -> str:
+        """Format TI-BASIC piecewise function."""
+        return cls.format_assignment(cls.format_function(expr, constraints), color, y_index)
+
+    @staticmethod
+    def format_epilogue(count: int, draws: Sequence[str] = ()) -> List[str]:
+        """The redraw after storing count functions in Y0.. and drawing draws, clearing those Y-vars for the next one."""
+        return REDRAW[:1] + list(draws) + REDRAW[1:] + [f"DelVar Y{k}" for k in range(count)]
+
+    @classmethod
+    def format_program(cls, functions: List[str], colors: List[str], first: int = 0, closed: bool = True) -> str:
+        """Format one redraw: up to 10 formatted functions and any number of segments plus the redraw epilogue.
+
+        first is how many Y-vars the previous program already stored for this redraw; without
+        closed the epilogue is left for the next program (see packer.Redraw).
+        """
+        lines, draws = [], []
+        for function, color in zip(functions, colors):
+            if function.startswith(LINE):
+                draws.append(cls.format_draw(function, color))
+            else:
+                lines.append(cls.format_assignment(function, color, first + len(lines)))
+        if not closed:
+            return "\n".join(lines)
+        return "\n".join(lines + cls.format_epilogue(first + len(lines), draws))
+
+    @classmethod
+    def pack_programs(cls, functions: Iterable[Tuple[str, str]], ram_budget: int = packer.RAM_BUDGET,
+                      y_vars: int = PROGRAM_SIZE, stats: Optional[packer.PackStats] = None,
+                      optimize: bool = True, peephole_stats: Optional[peephole.PeepholeStats] = None,
+                      ) -> Iterator[str]:
+        """Pack (function, color) pairs into as few programs as fit ram_budget bytes, yielding each program's text.
+
+        Segments (functions starting with LINE) don't take a Y-var and cost nothing per pixel column.
+        With optimize the text goes through peephole.py first, so the bytes it saves hold more
+        equations; peephole_stats gets what that saved per program.
+        """
+        finish = peephole.optimize_program if optimize else str
+        # color -> bytes around a function stored in a Y-var, and around a drawn segment
+        assignment_size: Dict[str, int] = {}
+        draw_size: Dict[str, int] = {}
+        epilogue_size = [len(ti8xp.tokenize("\n".join(cls.format_epilogue(n)))) + 1 for n in range(y_vars + 1)]
+
+        def sized(function: str, color: str) -> Tuple[str, str, int, bool, str]:
+            if color not in assignment_size:
+                assignment_size[color] = len(ti8xp.tokenize(finish(cls.format_assignment("", color, 0)))) + 1
+                draw_size[color] = len(ti8xp.tokenize(finish(cls.format_draw("", color)))) + 1
+            raw, line = function, function.startswith(LINE)
+            if optimize:
+                function = peephole.optimize_expression(function) if line else peephole.optimize_function(function)
+            return function, color, len(ti8xp.tokenize(function)), line, raw
+
+        for program in packer.pack(
+                (sized(*pair) for pair in functions),
+                size=lambda item: item[2] + (draw_size if item[3] else assignment_size)[item[1]],
+                overhead=epilogue_size.__getitem__,
+                ram_budget=ram_budget, y_vars=y_vars, cost=lambda item: 0 if item[3] else item[2], stats=stats,
+                y_var=lambda item: not item[3]):
+            text = finish("\n".join(cls.format_program([item[0] for item in redraw.items],
+                                                        [item[1] for item in redraw.items], redraw.first,
+                                                        redraw.closed) for redraw in program))
+            if peephole_stats is not None:
+                peephole.report(peephole_stats, "\n".join(cls.format_program(
+                    [item[4] for item in redraw.items], [item[1] for item in redraw.items], redraw.first,
+                    redraw.closed) for redraw in program), text)
+            yield text
+
+    def generate_programs(self, ram_budget: int = packer.RAM_BUDGET, y_vars: int = PROGRAM_SIZE,
+                          files=None, draw_lines: bool = False,
+                          progress: Optional[Callable[[int, int], None]] = None,
+                          color_of: Optional[Callable[[int], str]] = None, optimize: bool = True,
+                          peephole_stats: Optional[peephole.PeepholeStats] = None, output_format: str = "both",
+                          ) -> Tuple[packer.PackStats, manifest.Manifest]:
+        """Generate program files with equations and colors into files (a sinks.py sink).
+
+        Without one they go into the current folder, only rewriting the ones that changed.
+        With draw_lines, straight segments are drawn with Line( instead of taking a Y-var.
+        progress(programs written, equations done) is called after every program and every
+        PROGRESS_STEP equations, and may raise GenerationCancelled. color_of replaces
+        self.color_of (the TUI passes a snapshot so coloring can go on meanwhile).
+        optimize and peephole_stats are pack_programs'. output_format (one of FORMATS) picks
+        programN.txt, programN.8xp or both, unless files only takes one (a .txt bundle).
+        This is where equations get parsed, once each (loading only split them; with merge or
+        a window loading parsed them too, and they get parsed again here): the ones that don't
+        parse, and with self.deduplicate the ones drawing the same as an earlier one of
+        their color, are left out and go into files' badeqn.txt (counted in self.dedupe_stats).
+        Colors and programs that fail are collected and generating goes on, so the
+        GenerationError raised at the end lists all of them. Nothing replaces the old
+        programs unless every one of them got generated.
+        """
+        stats = packer.PackStats()
+        files = files if files is not None else manifest.Manifest()
+        output_format = files.output_format or output_format
+        run_stats = self.run_stats
+        color_of = color_of or self.color_of
+        written = done = first = 0  # programs written, equations formatted, equations before this program
+        deduper = dedupe.Deduper(self.dedupe_tolerance) if self.deduplicate else None
+        failures: List[str] = []
+        bad_colors: Dict[str, List[int]] = {}  # color that doesn't tokenize -> equations (1-based) with it
+        color_errors: Dict[str, Optional[str]] = {}  # color -> why it doesn't tokenize, None when it does
+
+        def color_error(color: str) -> Optional[str]:
+            if color not in color_errors:
+                try:
+                    ti8xp.tokenize(self.format_assignment("", color, 0))
+                    color_errors[color] = None
+                except ti8xp.TokenizeError as e:
+                    color_errors[color] = str(e)
+            return color_errors[color]
+
+        def functions() -> Iterator[Tuple[str, str]]:
+            nonlocal done
+            for i, eq in enumerate(self.valid_equations):
+                color = color_of(i)
+                reason = None
+                try:
+                    with run_stats.stage("parse"):
+                        simplified = self.simplified(*eq)
+                except exprparse.ParseError:
+                    reason = self.reject_reason(self.valid_equations.line(i, self.join_line))
+                else:
+                    if deduper is not None:
+                        with run_stats.stage("dedupe"):
+                            if deduper.duplicate(eq, color, simplified):
+                                reason = "duplicate"
+                if reason is not None:
+                    run_stats.reject(reason)
+                    files.rejects.write(self.valid_equations.line(i, self.join_line), REJECT_CODES[reason])
+                elif color_error(color) is None:
+                    with run_stats.stage("format"):
+                        function = self.format_simplified(*simplified, draw_lines)
+                    yield function, color
+                else:  # colors typed in the TUI; left out so the rest still gets checked
+                    bad_colors.setdefault(color, []).append(i + 1)
+                done = i + 1
+                if progress is not None and done % PROGRESS_STEP == 0:
+                    progress(written, done)
+
+        programs = run_stats.iterate("pack", self.pack_programs(functions(), ram_budget, y_vars, stats,
+                                                                 optimize, peephole_stats))
+        try:
+            for prog_num, program in enumerate(programs, 1):
+                try:
+                    if output_format != "8xp":
+                        with run_stats.stage("write"):
+                            files.write(f"program{prog_num}.txt", program.encode())
+                    if output_format != "txt":
+                        with run_stats.stage("tokenize"):
+                            data = ti8xp.program_bytes(PROGRAM_NAME.format(prog_num), program)
+                        with run_stats.stage("write"):
+                            files.write(f"program{prog_num}.8xp", data)
+                except (ValueError, OSError) as e:  # TokenizeError, disk trouble
+                    failures.append(f"program{prog_num} (equations {first + 1}-{done}): {e}")
+                written, first = prog_num, done
+                if progress is not None:
+                    progress(written, done)
+        except BaseException:
+            files.abort()
+            raise
+        for color, equations in bad_colors.items():
+            shown = ", ".join(map(str, equations[:5]))
+            if len(equations) > 5:
+                shown += f" and {len(equations) - 5} more"
+            failures.append(f"color {color!r} (equations {shown}): {color_errors[color]}")
+        if deduper is not None:
+            self.dedupe_stats = deduper.stats
+        if failures:
+            files.abort()
+            raise GenerationError(failures)
+        with run_stats.stage("write"):
+            files.finish()
+        return stats, files
+
+
+def latex_to_ascii(line: str) -> str:
+    """A Desmos LaTeX line as an ASCII equation (fastlatex, pylatexenc for what it can't do)."""
+    from LaTeXTOASCII import latex_to_ascii
+    return latex_to_ascii(line)
+
+
+def main(argv=None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Turn the equations in input.txt into programs, "
+                                                 "headless or with the TUI for giving them colors.")
+    parser.add_argument("input", nargs="?", default="input.txt",
+                        help="ASCII equations, or a Desmos graph state .json (default %(default)s)")
+    parser.add_argument("--tui", action="store_true",
+                        help="open the TUI (what CONVERTERv3.py does), colors are kept in the session journal")
+    parser.add_argument("--rules", default="", metavar="RULES",
+                        help="color rules like in the TUI's rules box, e.g. \"type:trig=RED; /sqrt/=BLUE\"")
+    parser.add_argument("--merge", action=argparse.BooleanOptionalAction, default=False,
+                        help="merge collinear/touching segments while loading (takes longer to load)")
+    parser.add_argument("--no-dedupe", action="store_true",
+                        help="keep equations that draw the same as an earlier one (default: drop them, "
+                             "listed as DUPLICATE in badeqn.txt)")
+    parser.add_argument("--dedupe-tolerance", type=float, default=0.0, metavar="TOL",
+                        help="round numbers to multiples of this when deduping, a grid and not a distance: "
+                             "0.0004 and 0.0006 still differ at 0.001 (default: exact)")
+    parser.add_argument("--bundle", type=sinks.bundle, metavar="PATH",
+                        help="write all programs into one .zip/.tar[.gz|.xz] or .txt file, or - for stdout "
+                             "(default: programN.txt/.8xp files)")
+    parser.add_argument("-f", "--format", choices=FORMATS, default="both",
+                        help="write programN.txt, programN.8xp or both (default %(default)s)")
+    parser.add_argument("--window", type=culling.parse_window, metavar="XMIN,XMAX,YMIN,YMAX",
+                        help="drop equations this graph window doesn't show and clip the rest to it "
+                             "(\"standard\" for ZStandard; default: keep everything)")
+    parser.add_argument("--lines", action="store_true",
+                        help="draw straight segments (y=mx+c on a bounded x range) with Line( instead of "
+                             "a Y-var each: no 10 per redraw limit and no evaluating them per pixel column")
+    parser.add_argument("--no-optimize", action="store_true",
+                        help="write the TI-BASIC as is, without peephole.py's token-saving rewrites "
+                             "(.26 for 0.260, pi for 3.1415, X2 for X*2, no closing parens at line ends)")
+    parser.add_argument("--ram-budget", type=int, default=packer.RAM_BUDGET,
+                        help="max bytes of tokens per program (default %(default)s)")
+    parser.add_argument("--y-vars", type=int, default=PROGRAM_SIZE, choices=range(1, PROGRAM_SIZE + 1),
+                        metavar="1-10", help="Y-vars to use per redraw (default %(default)s)")
+    parser.add_argument("--stats", action="store_true",
+                        help="print time per stage (loading, formatting, packing, writing), "
+                             "reject reasons and peak memory (after quitting, with --tui)")
+    parser.add_argument("--stats-json", metavar="PATH", help="write the --stats numbers to PATH as JSON")
+    parser.add_argument("--profile", metavar="PATH", help="run under cProfile and dump the profile to PATH")
+    args = parser.parse_args(argv)
+
+    try:
+        rules = colorrules.parse_rules(args.rules)
+    except colorrules.RuleError as e:
+        parser.error(str(e))
+    if args.bundle and args.tui:
+        parser.error("--bundle is for headless runs, the TUI writes programN.txt/.8xp")
+    run_stats = runstats.open_stats(args.stats or bool(args.stats_json))
+    session = journal.SessionJournal() if args.tui else None
+
+    def run() -> None:
+        try:
+            processor = EquationProcessor(args.input, args.merge, session, run_stats, args.window,
+                                          not args.no_dedupe, args.dedupe_tolerance)
+        except ValueError as e:  # desmos.DesmosError: a .json input that isn't a graph state
+            sys.exit(f"error: {args.input}: {e}")
+        if rules and not (args.tui and processor.rules):  # a resumed session keeps its own rules
+            processor.apply_rules(args.rules, processor.match_rules(rules))
+        if args.tui:
+            from CONVERTERv3 import EquationConverterApp  # textual only gets imported here
+            EquationConverterApp(processor, ram_budget=args.ram_budget, y_vars=args.y_vars,
+                                 draw_lines=args.lines, optimize=not args.no_optimize,
+                                 output_format=args.format).run()
+            return
+        out = sys.stderr if args.bundle == "-" else sys.stdout
+        for stats in (processor.import_stats, processor.merge_stats, processor.cull_stats):
+            if stats:
+                print(stats, file=out)
+        try:
+            peephole_stats = None if args.no_optimize else peephole.PeepholeStats()
+            stats, files = processor.generate_programs(args.ram_budget, args.y_vars, sinks.open_sink(args.bundle),
+                                                       draw_lines=args.lines, optimize=not args.no_optimize,
+                                                       peephole_stats=peephole_stats, output_format=args.format)
+        except GenerationError as e:
+            sys.exit("\n".join([*(f"error: {failure}" for failure in e.failures), "nothing was replaced"]))
+        if processor.dedupe_stats:
+            print(processor.dedupe_stats, file=out)
+        if peephole_stats:
+            print(peephole_stats, file=out)
+        print(stats, file=out)
+        print(files.stats(), file=out)
+
+    try:
+        runstats.profiled(args.profile, run)
+    finally:
+        if session is not None:
+            session.close()
+    if run_stats.enabled:
+        run_stats.finish().report(args.stats, args.stats_json, sys.stderr if args.bundle == "-" else sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
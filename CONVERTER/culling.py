@@ -0,0 +1,239 @@
+"""Dropping equations the calculator window never shows, and restrictions it doesn't need.
+
+Every equation costs the calculator a full sweep over the screen's pixel columns,
+even when nothing of it lands on screen. For a target window (Xmin/Xmax/Ymin/Ymax):
+
+- equations whose x domain misses Xmin..Xmax are dropped
+- so are the ones whose values over the visible part of their domain stay above
+  Ymax or below Ymin. The values are bounded with interval arithmetic over the
+  expression tree, which can only overestimate, so nothing visible gets dropped.
+- bounds outside the window are removed from the rest ({-100<x<2} -> {x<2},
+  {-100<x<100} -> no piecewise( at all), since the calculator doesn't draw there anyway
+
+Only restrictions that are plain bounds on x (like segments.py merges) get
+clipped; equations with other restrictions are only culled by their values.
+"""
+import math
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+import exprparse
+import segments
+from exprparse import BinOp, Call, Const, Neg, Num, Var
+
+Equation = Tuple[str, str]
+Bounds = Tuple[float, float]
+UNBOUNDED: Bounds = (-math.inf, math.inf)
+
+
+class Window(NamedTuple):
+    xmin: float
+    xmax: float
+    ymin: float
+    ymax: float
+
+    def __str__(self) -> str:
+        return f"{self.xmin:g},{self.xmax:g},{self.ymin:g},{self.ymax:g}"
+
+
+# what ZStandard sets, and what a fresh calculator has
+STANDARD = Window(-10.0, 10.0, -10.0, 10.0)
+# pixel rows of the CE's graph screen; values up to half a pixel past Ymin/Ymax still light the edge row
+PIXEL_ROWS = 165
+WINDOW_PATTERN = re.compile(r'\s*,\s*')
+
+
+def parse_window(text: str) -> Window:
+    """ "xmin,xmax,ymin,ymax" or "standard", for --window. Raises ValueError."""
+    if text.strip().lower() == "standard":
+        return STANDARD
+    parts = WINDOW_PATTERN.split(text.strip())
+    if len(parts) != 4:
+        raise ValueError(f"window needs xmin,xmax,ymin,ymax, got {text!r}")
+    window = Window(*map(float, parts))
+    if not (window.xmin < window.xmax and window.ymin < window.ymax):
+        raise ValueError(f"window {text!r} is empty (needs xmin<xmax and ymin<ymax)")
+    return window
+
+
+@dataclass
+class CullStats:
+    before: int = 0
+    dropped: int = 0
+    clipped: int = 0
+
+    def __str__(self) -> str:
+        return (f"CULLED: {self.before} -> {self.before - self.dropped} equations "
+                f"({self.dropped} off-screen), {self.clipped} restrictions clipped to the window")
+
+
+# ---------------- Interval arithmetic -------------------
+
+def _span(*values: float) -> Bounds:
+    if any(math.isnan(value) for value in values):
+        return UNBOUNDED
+    return min(values), max(values)
+
+
+def _monotonic(func: Callable[[float], float], bounds: Bounds, lo_limit: float = -math.inf,
+               hi_limit: float = math.inf, increasing: bool = True) -> Bounds:
+    """func over bounds for a function that only goes one way, evaluated on its domain lo_limit..hi_limit."""
+    lo, hi = max(bounds[0], lo_limit), min(bounds[1], hi_limit)
+    if lo > hi:
+        return UNBOUNDED  # undefined everywhere; the calculator draws nothing, but don't bet on it
+    try:
+        a, b = func(lo), func(hi)
+    except (OverflowError, ValueError):
+        return UNBOUNDED
+    return (a, b) if increasing else (b, a)
+
+
+def _sin(bounds: Bounds) -> Bounds:
+    lo, hi = bounds
+    if not (math.isfinite(lo) and math.isfinite(hi)) or hi - lo >= 2 * math.pi:
+        return -1.0, 1.0
+    low, high = _span(math.sin(lo), math.sin(hi))
+    # peaks (pi/2 + 2k pi) and troughs (-pi/2 + 2k pi) inside the interval
+    if math.floor((hi - math.pi / 2) / (2 * math.pi)) >= math.ceil((lo - math.pi / 2) / (2 * math.pi)):
+        high = 1.0
+    if math.floor((hi + math.pi / 2) / (2 * math.pi)) >= math.ceil((lo + math.pi / 2) / (2 * math.pi)):
+        low = -1.0
+    return low, high
+
+
+def _tan(bounds: Bounds) -> Bounds:
+    lo, hi = bounds
+    if not (math.isfinite(lo) and math.isfinite(hi)):
+        return UNBOUNDED
+    # an asymptote (pi/2 + k pi) inside means every value
+    if math.floor((hi - math.pi / 2) / math.pi) >= math.ceil((lo - math.pi / 2) / math.pi):
+        return UNBOUNDED
+    return math.tan(lo), math.tan(hi)
+
+
+def _even(func: Callable[[float], float], bounds: Bounds) -> Bounds:
+    """For functions symmetric around 0 that grow with |x| (abs, cosh, even powers)."""
+    lo, hi = bounds
+    try:
+        return (func(0.0) if lo <= 0 <= hi else func(min(abs(lo), abs(hi)))), func(max(abs(lo), abs(hi)))
+    except OverflowError:
+        return 0.0, math.inf  # all of these are >= 0
+
+
+def _power(base: Bounds, exponent) -> Bounds:
+    if isinstance(exponent, Num) and exponent.value == int(exponent.value) and abs(exponent.value) <= 64:
+        n = int(exponent.value)
+        if n >= 0:
+            if n % 2 == 0:
+                return _even(lambda v: v ** n, base)
+            return _monotonic(lambda v: v ** n, base)
+    return UNBOUNDED
+
+
+CALLS: Dict[str, Callable[[Bounds], Bounds]] = {
+    "sin": _sin,
+    "cos": lambda b: _sin((b[0] + math.pi / 2, b[1] + math.pi / 2)),
+    "tan": _tan,
+    "arcsin": lambda b: _monotonic(math.asin, b, -1, 1),
+    "arccos": lambda b: _monotonic(math.acos, b, -1, 1, increasing=False),
+    "arctan": lambda b: _monotonic(math.atan, b),
+    "sinh": lambda b: _monotonic(math.sinh, b),
+    "cosh": lambda b: _even(math.cosh, b),
+    "tanh": lambda b: _monotonic(math.tanh, b),
+    "ln": lambda b: _monotonic(math.log, b, 1e-300),
+    "log": lambda b: _monotonic(math.log10, b, 1e-300),
+    "exp": lambda b: _monotonic(math.exp, b),
+    "sqrt": lambda b: _monotonic(math.sqrt, b, 0),
+    "abs": lambda b: _even(abs, b),
+}
+
+
+def value_bounds(node, x: Bounds) -> Bounds:
+    """Lower/upper bound of an exprparse tree for x in x[0]..x[1]. May be wider than the truth, never narrower."""
+    if isinstance(node, Num):
+        return node.value, node.value
+    if isinstance(node, Var):
+        return x if node.name == "X" else UNBOUNDED
+    if isinstance(node, Const):
+        value = exprparse.CONSTANTS[node.name]
+        return value, value
+    if isinstance(node, Neg):
+        lo, hi = value_bounds(node.operand, x)
+        return -hi, -lo
+    if isinstance(node, Call):
+        args = [value_bounds(arg, x) for arg in node.args]
+        if node.func == "min":
+            return min(a[0] for a in args), min(a[1] for a in args)
+        if node.func == "max":
+            return max(a[0] for a in args), max(a[1] for a in args)
+        return CALLS[node.func](args[0]) if node.func in CALLS else UNBOUNDED
+    if not isinstance(node, BinOp):
+        return UNBOUNDED
+    a = value_bounds(node.left, x)
+    if node.op == "^":
+        if isinstance(node.left, Num) and node.left.value > 0:  # 2^x
+            b = value_bounds(node.right, x)
+            return _monotonic(lambda v: node.left.value ** v, b, increasing=node.left.value >= 1)
+        return _power(a, node.right)
+    b = value_bounds(node.right, x)
+    if node.op == "+":
+        return _span(a[0] + b[0], a[1] + b[1])
+    if node.op == "-":
+        return _span(a[0] - b[1], a[1] - b[0])
+    if node.op == "*":
+        return _span(a[0] * b[0], a[0] * b[1], a[1] * b[0], a[1] * b[1])
+    if node.op == "/":
+        if b[0] <= 0 <= b[1]:
+            return UNBOUNDED
+        return _span(a[0] / b[0], a[0] / b[1], a[1] / b[0], a[1] / b[1])
+    return UNBOUNDED
+
+
+# ---------------- Culling -------------------
+
+def clip(equation: Equation, window: Window) -> Optional[Equation]:
+    """The equation with its restriction clipped to window, or None if none of it is on screen."""
+    expr, constraints = equation
+    conditions = exprparse.simplify_conditions(exprparse.parse_conditions(constraints))
+    bounds = segments.interval(conditions)
+    if bounds is None:
+        lo, hi = window.xmin, window.xmax
+    else:
+        lo, lo_text, lo_strict, hi, hi_text, hi_strict = bounds
+        if hi < window.xmin or lo > window.xmax or (hi == window.xmin and hi_strict) or \
+                (lo == window.xmax and lo_strict):
+            return None
+        # a bound outside the window (or on its edge, inclusively) doesn't change what gets drawn
+        clip_lo = lo_text is not None and (lo < window.xmin or (lo == window.xmin and not lo_strict))
+        clip_hi = hi_text is not None and (hi > window.xmax or (hi == window.xmax and not hi_strict))
+        if clip_lo or clip_hi:
+            constraints = segments.constraints_text(None if clip_lo else lo_text, lo_strict,
+                                                    None if clip_hi else hi_text, hi_strict)
+        lo, hi = max(lo, window.xmin), min(hi, window.xmax)
+    tree = exprparse.simplify(exprparse.parse_expression(expr))
+    ylo, yhi = value_bounds(tree, (lo, hi))
+    pixel = (window.ymax - window.ymin) / (PIXEL_ROWS - 1)
+    if yhi < window.ymin - pixel or ylo > window.ymax + pixel:
+        return None
+    return expr, constraints
+
+
+def cull_equations(equations: Iterable[Equation], window: Window,
+                   stats: Optional[CullStats] = None) -> Iterator[Equation]:
+    """Drop the equations that are off-screen in window and clip the restrictions of the rest (lazily)."""
+    for _, equation in cull_indexed(equations, window, stats):
+        yield equation
+
+
+def cull_indexed(equations: Iterable[Equation], window: Window,
+                 stats: Optional[CullStats] = None) -> Iterator[Tuple[int, Equation]]:
+    """cull_equations(), with the index every kept equation had in equations."""
+    for index, equation in enumerate(equations):
+        clipped = clip(equation, window)
+        if stats is not None:
+            stats.before += 1
+            stats.dropped += clipped is None
+            stats.clipped += clipped is not None and clipped[1] != equation[1]
+        if clipped is not None:
+            yield index, clipped
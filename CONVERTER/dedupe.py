@@ -0,0 +1,85 @@
+"""Dropping equations that draw exactly what an earlier one already drew.
+
+Desmos exports (and pasting several of them together) repeat equations, often
+written differently: "y=1/4x {x>1}" and "y=0.25*x {1<x}" are the same line, so
+are "y=sin(x)+2" and "y=2+sin(x)". Every equation gets a canonical key
+(exprparse.canonical: numbers normalized, + and * operands sorted, restrictions
+sorted and flipped the same way) and one pass with a set of key digests keeps
+the first of each key. With a tolerance numbers only need to round to the same
+multiple of it. That's quantization, not a distance: numbers either side of a
+half multiple (0.0004 and 0.0006 at 0.001) stay apart however close they are,
+while 0.0006 and 0.0014 count as equal.
+
+Nothing disappears silently: every dropped line goes into badeqn.txt as
+"DUPLICATE<tab>line" and the stats print how many there were.
+"""
+import hashlib
+from dataclasses import dataclass
+from typing import Hashable, Iterable, Iterator, List, Optional, Set, Tuple
+
+import exprparse
+
+Equation = Tuple[str, str]
+Parsed = Tuple[exprparse.Node, List[exprparse.Compare]]
+# bytes of the digest kept per equation; 128 bits won't collide by accident
+DIGEST_SIZE = 16
+# the badeqn.txt code for dropped duplicates
+CODE = "DUPLICATE"
+
+
+@dataclass
+class DedupeStats:
+    before: int = 0
+    removed: int = 0
+
+    def __str__(self) -> str:
+        return (f"DEDUPED: {self.before} -> {self.before - self.removed} equations "
+                f"({self.removed} duplicates, listed as {CODE} in badeqn.txt)")
+
+
+def equation_key(equation: Equation, tolerance: float = 0.0,
+                 simplified: Optional[Parsed] = None) -> Hashable:
+    """What the equation draws: equal for equations that only differ in how they're written.
+
+    simplified is the equation's simplified (expression tree, conditions) when they're
+    parsed already (EquationProcessor.parse), so they aren't parsed again.
+    """
+    if simplified is None:
+        expr, constraints = equation
+        simplified = (exprparse.simplify(exprparse.parse_expression(expr)),
+                      exprparse.simplify_conditions(exprparse.parse_conditions(constraints)))
+    tree, conditions = simplified
+    return exprparse.canonical(tree, tolerance), exprparse.canonical_conditions(conditions, tolerance)
+
+
+def digest(key: Hashable) -> bytes:
+    """16 bytes standing for a key: the nested tuples of a key take a few hundred bytes an equation."""
+    return hashlib.blake2b(repr(key).encode(), digest_size=DIGEST_SIZE).digest()
+
+
+class Deduper:
+    """Remembers the keys seen so far (as digests); duplicate() says whether an equation was already there."""
+
+    def __init__(self, tolerance: float = 0.0, stats: Optional[DedupeStats] = None) -> None:
+        self.tolerance = tolerance
+        self.stats = stats if stats is not None else DedupeStats()
+        self._seen: Set[bytes] = set()
+
+    def duplicate(self, equation: Equation, group: Hashable = None, simplified: Optional[Parsed] = None) -> bool:
+        """Whether an earlier equation of the same group (color, say) draws the same."""
+        key = digest((equation_key(equation, self.tolerance, simplified), group))
+        self.stats.before += 1
+        if key in self._seen:
+            self.stats.removed += 1
+            return True
+        self._seen.add(key)
+        return False
+
+
+def dedupe_equations(equations: Iterable[Equation], tolerance: float = 0.0,
+                     stats: Optional[DedupeStats] = None) -> Iterator[Equation]:
+    """The equations without the ones an earlier equation already draws (lazily, first one wins)."""
+    deduper = Deduper(tolerance, stats)
+    for equation in equations:
+        if not deduper.duplicate(equation):
+            yield equation
@@ -0,0 +1,292 @@
+"""Reading a Desmos graph state (the JSON Desmos exports/Calculator.getState() returns) instead of copied LaTeX.
+
+The state is {"expressions": {"list": [{"type": "expression", "latex": "y=2x", "color": "#c74440"}, ...]}, ...}
+(sometimes wrapped in {"state": ...}). expressions.list is read one entry at a time
+with json's raw_decode over a chunked buffer, so a graph with a million
+expressions never has to be in memory as a whole. Hidden expressions (and the
+ones in hidden folders), tables, notes and images are skipped.
+
+The LaTeX goes through LaTeXTOASCII.convert_serial like expressions.txt does, and
+the color is mapped to the nearest GraphColor color, so nothing needs coloring by
+hand. Lines come out as "y=2x<tab>RED", which EquationProcessor reads as equation
+plus color (core.py and the TUI read .json inputs directly too).
+
+    python desmos.py graph.json            # -> input.txt
+    python core.py graph.json --tui
+"""
+import json
+import os
+import re
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, Optional, TextIO, Tuple
+
+import colorrules
+import core  # noqa: F401  (puts LaTeXTOASCII/ on sys.path)
+import sinks
+
+import convcache
+import runstats
+
+# characters read at a time; a single entry bigger than this just takes a few reads
+CHUNK = 1 << 16
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+# what can follow a whole value
+DELIMITERS = " \t\n\r,:]}"
+_DECODER = json.JSONDecoder()
+
+# Desmos' own palette, mapped by what it's meant to be rather than the nearest CE color
+# (its muted red is closest to BROWN, its purple has no CE color)
+DESMOS_PALETTE = {
+    "#c74440": "RED", "#2d70b3": "BLUE", "#388c46": "GREEN", "#6042a6": "MAGENTA",
+    "#fa7e19": "ORANGE", "#000000": "BLACK",
+}
+# bits per channel of the nearest color lookup table (4096 cells)
+LUT_BITS = 4
+_LUT: Optional[bytes] = None
+_NAMES = list(colorrules.GRAPH_COLORS)
+
+
+class DesmosError(ValueError):
+    """The file isn't a Desmos state."""
+
+
+@dataclass
+class ImportStats:
+    expressions: int = 0
+    hidden: int = 0
+    other: int = 0  # tables, notes, images, folders
+    colors: Counter = field(default_factory=Counter)
+
+    def __str__(self) -> str:
+        colors = ", ".join(f"{count} {color}" for color, count in self.colors.most_common())
+        return (f"IMPORTED: {self.expressions} expressions ({colors or 'no colors'}), "
+                f"skipped {self.hidden} hidden and {self.other} tables/notes/images/folders")
+
+
+# ---------------- Streaming JSON -------------------
+
+class _Reader:
+    """Just enough of a pull parser to walk down to expressions.list: raw_decode on a refilled buffer."""
+
+    def __init__(self, f: TextIO, chunk_size: int = CHUNK) -> None:
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+
+    def _more(self, size: int) -> bool:
+        chunk = self.f.read(size)
+        if not chunk:
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """The next character that isn't whitespace ("" at the end), without taking it."""
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._more(self.chunk_size):
+                return ""
+
+    def take(self, expected: str) -> str:
+        char = self.peek()
+        if char not in expected:
+            raise DesmosError(f"expected one of {expected!r} but found {char or 'the end'!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        """The next whole JSON value (read further until it's complete)."""
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                if self._more(size):
+                    size *= 2  # a big value: don't re-decode it once per chunk
+                    continue
+                raise DesmosError(f"not valid JSON: {e}") from None
+            # a value cut off by the end of the buffer ("1." of 1.5) decodes fine but isn't all of it
+            if (end < len(self.buf) and self.buf[end] in DELIMITERS) or not self._more(size):
+                self.pos = end
+                return value
+
+    def keys(self) -> Iterator[str]:
+        """The keys of the object starting here; the caller reads (or skips) each value before asking for the next."""
+        self.take("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.take(":")
+            yield key
+            if self.take(",}") == "}":
+                return
+
+
+def read_state(f: TextIO, chunk_size: int = CHUNK) -> Iterator[Dict]:
+    """The entries of expressions.list in a Desmos state, one at a time."""
+    reader = _Reader(f, chunk_size)
+    found = False
+    for key in reader.keys():
+        if key == "state":  # {"state": {...}, "title": ...} as saved graphs come
+            for inner in reader.keys():
+                if inner == "expressions":
+                    found = True
+                    yield from _expression_list(reader)
+                else:
+                    reader.value()
+        elif key == "expressions":
+            found = True
+            yield from _expression_list(reader)
+        else:
+            reader.value()
+    if not found:
+        raise DesmosError("no expressions in there, is it a Desmos graph state?")
+
+
+def _expression_list(reader: _Reader) -> Iterator[Dict]:
+    for key in reader.keys():
+        if key != "list":
+            reader.value()
+            continue
+        reader.take("[")
+        if reader.peek() == "]":
+            reader.pos += 1
+            continue
+        while True:
+            yield reader.value()
+            if reader.take(",]") == "]":
+                break
+
+
+# ---------------- Colors -------------------
+
+def _rgb(hex_color: str) -> Tuple[int, int, int]:
+    return int(hex_color[1:3], 16), int(hex_color[3:5], 16), int(hex_color[5:7], 16)
+
+
+def _distance(a: Tuple[int, int, int], b: Tuple[int, int, int]) -> float:
+    """Squared "redmean" distance, a cheap approximation of how different colors look."""
+    mean = (a[0] + b[0]) / 2
+    dr, dg, db = a[0] - b[0], a[1] - b[1], a[2] - b[2]
+    return (2 + mean / 256) * dr * dr + 4 * dg * dg + (2 + (255 - mean) / 256) * db * db
+
+
+def _build_lut() -> bytes:
+    """Index into _NAMES of the nearest CE color for every cell of a LUT_BITS per channel RGB cube."""
+    palette = [_rgb(hex_color) for hex_color in colorrules.GRAPH_COLORS.values()]
+    cells = 1 << LUT_BITS
+    step = 256 // cells
+    lut = bytearray(cells ** 3)
+    for r in range(cells):
+        for g in range(cells):
+            for b in range(cells):
+                center = (r * step + step // 2, g * step + step // 2, b * step + step // 2)
+                lut[(r * cells + g) * cells + b] = min(range(len(palette)),
+                                                       key=lambda i: _distance(center, palette[i]))
+    return bytes(lut)
+
+
+def ti_color(hex_color: Optional[str]) -> str:
+    """The GraphColor color for a Desmos color ("#c74440" or "#c44"), "" for anything else."""
+    global _LUT
+    if not hex_color or not re.fullmatch(r'#(?:[0-9a-fA-F]{3}){1,2}', hex_color):
+        return ""
+    hex_color = hex_color.lower()
+    if len(hex_color) == 4:
+        hex_color = "#" + "".join(c * 2 for c in hex_color[1:])
+    if hex_color in DESMOS_PALETTE:
+        return DESMOS_PALETTE[hex_color]
+    if _LUT is None:
+        _LUT = _build_lut()
+    shift = 8 - LUT_BITS
+    r, g, b = (channel >> shift for channel in _rgb(hex_color))
+    return _NAMES[_LUT[(r << (2 * LUT_BITS)) | (g << LUT_BITS) | b]]
+
+
+# ---------------- Import -------------------
+
+def graph_expressions(entries: Iterable[Dict], stats: Optional[ImportStats] = None) -> Iterator[Tuple[str, str]]:
+    """(latex, GraphColor color or "") of the entries the graph shows."""
+    stats = stats if stats is not None else ImportStats()
+    hidden_folders = set()
+    for entry in entries:
+        kind = entry.get("type", "expression")
+        if kind == "folder" and entry.get("hidden"):
+            hidden_folders.add(entry.get("id"))
+        latex = " ".join((entry.get("latex") or "").split())
+        if kind != "expression":
+            stats.other += 1
+            continue
+        if not latex:
+            continue  # an empty row
+        if entry.get("hidden") or entry.get("folderId") in hidden_folders:
+            stats.hidden += 1
+            continue
+        color = ti_color(entry.get("color"))
+        stats.expressions += 1
+        stats.colors[color or "no color"] += 1
+        yield latex, color
+
+
+def ascii_lines(path: str, cache: Optional[convcache.ConversionCache] = None,
+                run_stats: runstats.RunStats = runstats.NULL_STATS,
+                stats: Optional[ImportStats] = None) -> Iterator[str]:
+    """ "ascii equation<tab>COLOR" (or just the equation) for every shown expression in the state at path.
+
+    Raises DesmosError when it isn't a Desmos state.
+    """
+    from LaTeXTOASCII import convert_serial
+
+    colors: deque = deque()
+
+    def latex(f: TextIO) -> Iterator[str]:
+        for text, color in graph_expressions(read_state(f), stats):
+            colors.append(color)
+            yield text
+
+    with open(path, "r", encoding="utf-8") as f:
+        for _, text in convert_serial(latex(f), cache=cache, stats=run_stats):
+            color = colors.popleft()
+            yield f"{text}\t{color}" if color else text
+
+
+def main(argv=None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Turn a Desmos graph state (JSON) into input.txt lines with colors.")
+    parser.add_argument("state", help="the exported graph state")
+    parser.add_argument("-o", "--output", default="input.txt", help="where the lines go (default %(default)s)")
+    parser.add_argument("--no-cache", action="store_true", help=f"don't read or write {convcache.DEFAULT_PATH}")
+    args = parser.parse_args(argv)
+
+    cache = convcache.open_cache(args.no_cache)
+    stats = ImportStats()
+    temp = sinks.temp_path(args.output)
+    try:
+        with open(temp, "w", buffering=sinks.BUFFER) as out:
+            for line in ascii_lines(args.state, cache, stats=stats):
+                out.write(line + "\n")
+        os.replace(temp, args.output)
+    except DesmosError as e:
+        os.remove(temp)
+        parser.exit(1, f"{args.state}: {e}\n")
+    except BaseException:
+        os.remove(temp)
+        raise
+    finally:
+        if cache:
+            cache.close()
+    print(stats)
+    print(f"Saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Search index over the loaded equations, so the TUI can filter/jump over 100k of them instantly.
+
+- substring: every row's "y = expr {constraints}" text lower-cased and joined into one
+  string, searched with str.find (C speed) and mapped back to rows with bisect
+- function type: rows per exprparse.function_type bucket
+- domain: each row's x interval, sorted by start, so "rows overlapping a..b" is a
+  bisect plus a scan over the candidates
+
+The type and domain parts need every equation parsed (~40us each), so they're built
+separately with build_details(), which the TUI runs off the UI thread.
+
+    index = EquationIndex(equations)
+    index.query("0.4 type:linear x:0..1")  # rows matching all three
+"""
+import math
+import re
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import exprparse
+import segments
+
+QUERY_TERM = re.compile(r'(?:type:(\w+)|x:(-?[\d.]*)\.\.(-?[\d.]*)|(\S+))', re.IGNORECASE)
+
+
+def display_text(expr: str, constraints: str) -> str:
+    return f"y = {expr} {{{constraints}}}"
+
+
+class EquationIndex:
+    """Prebuilt lookups over a list of (expression, constraints)."""
+
+    def __init__(self, equations: Sequence[Tuple[str, str]]) -> None:
+        self.count = len(equations)
+        lines = [display_text(*equation).lower() for equation in equations]
+        self._text = "\n".join(lines)
+        self._starts: List[int] = []
+        offset = 0
+        for line in lines:
+            self._starts.append(offset)
+            offset += len(line) + 1
+        self._equations = equations
+        self.types: Optional[Dict[str, List[int]]] = None
+        self._by_lo: Optional[List[Tuple[float, float, int]]] = None
+        self._lo_keys: List[float] = []
+
+    @property
+    def ready(self) -> bool:
+        """Whether build_details() is done (type: and x: terms need it)."""
+        return self._by_lo is not None
+
+    def build_details(self) -> None:
+        """Parse every equation for the type and domain lookups."""
+        types: Dict[str, List[int]] = {name: [] for name in exprparse.FUNCTION_TYPES}
+        by_lo = []
+        for row, (expr, constraints) in enumerate(self._equations):
+            try:
+                tree = exprparse.simplify(exprparse.parse_expression(expr))
+                conditions = exprparse.simplify_conditions(exprparse.parse_conditions(constraints))
+            except exprparse.ParseError:
+                continue
+            types[exprparse.function_type(tree)].append(row)
+            bounds = segments.interval(conditions)
+            if bounds is not None:
+                by_lo.append((bounds[0], bounds[3], row))
+        by_lo.sort()
+        self._lo_keys = [lo for lo, _, _ in by_lo]
+        self.types = types
+        self._by_lo = by_lo
+
+    def line(self, row: int) -> str:
+        end = self._starts[row + 1] - 1 if row + 1 < self.count else len(self._text)
+        return self._text[self._starts[row]:end]
+
+    def substring(self, needle: str) -> List[int]:
+        """Rows whose text contains needle (case insensitive), in order."""
+        needle = needle.lower()
+        rows = []
+        pos = self._text.find(needle)
+        while pos != -1:
+            row = bisect_right(self._starts, pos) - 1
+            rows.append(row)
+            if row + 1 >= self.count:
+                break
+            pos = self._text.find(needle, self._starts[row + 1])
+        return rows
+
+    def of_type(self, name: str) -> List[int]:
+        """Rows of the function type starting with name (case insensitive)."""
+        name = name.lower()
+        rows: List[int] = []
+        for type_name, type_rows in (self.types or {}).items():
+            if type_name.lower().startswith(name):
+                rows.extend(type_rows)
+        return sorted(rows)
+
+    def in_range(self, lo: float = -math.inf, hi: float = math.inf) -> List[int]:
+        """Rows whose x interval overlaps lo..hi."""
+        if self._by_lo is None:
+            return []
+        end = bisect_right(self._lo_keys, hi)
+        return sorted(row for _, row_hi, row in self._by_lo[:end] if row_hi >= lo)
+
+    def query(self, text: str) -> List[int]:
+        """Rows matching every term of text: type:<name>, x:<lo>..<hi> (either side optional) or a substring."""
+        result: Optional[List[int]] = None
+        words = []
+        for type_name, lo, hi, word in QUERY_TERM.findall(text):
+            if word:
+                words.append(word.lower())
+                continue
+            if type_name:
+                rows = self.of_type(type_name)
+            else:
+                rows = self.in_range(float(lo) if lo else -math.inf, float(hi) if hi else math.inf)
+            result = rows if result is None else _intersect(result, rows)
+        if words:
+            # one find() pass for the first word, the rest are checked on the matching rows only
+            rows = [row for row in self.substring(words[0]) if all(w in self.line(row) for w in words[1:])]
+            result = rows if result is None else _intersect(result, rows)
+        return list(range(self.count)) if result is None else result
+
+
+def _intersect(a: List[int], b: List[int]) -> List[int]:
+    if len(a) > len(b):
+        a, b = b, a
+    keep = set(b)
+    return [row for row in a if row in keep]
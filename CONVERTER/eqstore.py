@@ -0,0 +1,175 @@
+"""valid_equations and colors for millions of equations without a Python object per equation.
+
+A list of (expr, constraints) tuples costs around 200 bytes an equation and a
+{index: color} dict another 100, so a few million lines took gigabytes before
+the TUI even opened. Instead:
+
+- EquationStore maps the input file (mmap, read only) and keeps where every
+  valid line is: an array of start offsets and one of lengths, 12 bytes an
+  equation. Indexing it splits the line into (expr, constraints) right then,
+  nothing is kept. Equations that aren't in the file as they are (merged or
+  clipped ones, a Desmos import, a resumed session) go into one bytearray as
+  "expr<tab>constraints" and get a negative offset.
+- ColorTable is a {index: color} mapping over an array with one small int per
+  equation, indexing a table of color names.
+
+Both keep the API of what they replace (indexing, len, iteration; get, [], in,
+items), so generate_programs, the rules and the TUI didn't change.
+
+The mapping reads the file as it is on disk: replacing input.txt (editors,
+desmos.py and the other tools write a new file and rename it over) is fine,
+truncating it in place while the converter runs is not.
+"""
+import mmap
+from array import array
+from collections.abc import MutableMapping
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import colorrules
+
+Equation = Tuple[str, str]
+SEPARATOR = "\t"
+
+
+class EquationStore(Sequence[Equation]):
+    """(expr, constraints) by index, kept as offsets into the input file (or a bytearray of extra equations).
+
+    split turns a valid line of the file into (expr, constraints); it's only called on access.
+    """
+
+    def __init__(self, path: Optional[str] = None, split: Optional[Callable[[str], Equation]] = None) -> None:
+        self.path = path
+        self._split = split
+        self._data: Union[mmap.mmap, bytes] = b""
+        if path is not None:
+            with open(path, "rb") as f:
+                try:
+                    self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:  # empty file, nothing to map
+                    pass
+        self._starts = array("q")  # offset in the file, or -1 - offset in _extra
+        self._lengths = array("I")
+        self._extra = bytearray()
+
+    @classmethod
+    def of(cls, equations: Iterable[Equation]) -> "EquationStore":
+        """A store holding equations (from a journal, say) in its bytearray."""
+        store = cls()
+        for equation in equations:
+            store.append(equation)
+        return store
+
+    @property
+    def data(self) -> Union[mmap.mmap, bytes]:
+        """The mapped input file, to find the lines to add()."""
+        return self._data
+
+    def add(self, start: int, length: int) -> None:
+        """Append the equation on the file's bytes [start, start + length)."""
+        self._starts.append(start)
+        self._lengths.append(length)
+
+    def append(self, equation: Equation) -> None:
+        """Append an equation that isn't in the file like that."""
+        expr, constraints = equation
+        data = f"{expr}{SEPARATOR}{constraints}".encode()
+        self._starts.append(-1 - len(self._extra))
+        self._lengths.append(len(data))
+        self._extra += data
+
+    def select(self, kept: Iterable[Tuple[int, Equation]]) -> "EquationStore":
+        """A store of kept's equations, (index, equation) pairs as segments.merge_indexed and
+        culling.cull_indexed return them. The ones still in the file as they are stay offsets."""
+        store = EquationStore(split=self._split)
+        store.path, store._data = self.path, self._data
+        for index, equation in kept:
+            if self._starts[index] >= 0 and equation == self[index]:
+                store.add(self._starts[index], self._lengths[index])
+            else:
+                store.append(equation)
+        return store
+
+    def line(self, index: int, join: Callable[[str, str], str]) -> str:
+        """The input line of equation index as it is in the file (for badeqn.txt), or join(expr, constraints)."""
+        start, length = self._starts[index], self._lengths[index]
+        if start < 0:
+            return join(*self._get(index))
+        return self._data[start:start + length].decode()
+
+    def _get(self, index: int) -> Equation:
+        start, length = self._starts[index], self._lengths[index]
+        if start < 0:
+            start = -1 - start
+            expr, _, constraints = self._extra[start:start + length].decode().partition(SEPARATOR)
+            return expr, constraints
+        return self._split(self._data[start:start + length].decode())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._get(i) for i in range(*index.indices(len(self)))]
+        return self._get(index)
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def __iter__(self) -> Iterator[Equation]:
+        for index in range(len(self._starts)):
+            yield self._get(index)
+
+    def nbytes(self) -> int:
+        """Memory the offsets and the extra equations take (the mapped file is the OS's page cache)."""
+        return (len(self._starts) * self._starts.itemsize + len(self._lengths) * self._lengths.itemsize
+                + len(self._extra))
+
+
+class ColorTable(MutableMapping):
+    """{equation index: color} for size equations, as one small int per equation into a table of color names."""
+
+    def __init__(self, size: int, colors: Optional[Dict[int, str]] = None) -> None:
+        # 0 is "no color"; the GraphColor colors come first, anything else typed in gets added
+        self._names: List[str] = ["", *colorrules.GRAPH_COLORS]
+        self._ids = {name: i for i, name in enumerate(self._names)}
+        self._codes = array("B", bytes(size))
+        self._count = 0
+        for index, color in (colors or {}).items():
+            self[index] = color
+
+    def _id(self, color: str) -> int:
+        if (code := self._ids.get(color)) is None:
+            code = self._ids[color] = len(self._names)
+            self._names.append(color)
+            if code > 255 and self._codes.typecode == "B":
+                self._codes = array("H", self._codes)
+        return code
+
+    def get(self, index: int, default=None):
+        if 0 <= index < len(self._codes) and (code := self._codes[index]):
+            return self._names[code]
+        return default
+
+    def __getitem__(self, index: int) -> str:
+        if (color := self.get(index)) is None:
+            raise KeyError(index)
+        return color
+
+    def __setitem__(self, index: int, color: str) -> None:
+        code = self._id(color) if color else 0
+        self._count += bool(code) - bool(self._codes[index])
+        self._codes[index] = code
+
+    def __delitem__(self, index: int) -> None:
+        if not self.get(index):
+            raise KeyError(index)
+        self[index] = ""
+
+    def __contains__(self, index: object) -> bool:
+        return isinstance(index, int) and self.get(index) is not None
+
+    def __iter__(self) -> Iterator[int]:
+        return (index for index, code in enumerate(self._codes) if code)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def nbytes(self) -> int:
+        return len(self._codes) * self._codes.itemsize
@@ -0,0 +1,628 @@
+"""Expression and constraint parser for the ASCII equations LaTeXTOASCII.py puts out.
+
+Replaces the regex rewriting in format_piecewise: expressions like
+"-2x+1.3", "1/4x+0.7", "sinx+sqrt(x)" or "|x|" and constraints like
+"0.26 <=x <=0.4", "x>=1" or "0<x<1, y>0" are parsed into a small AST,
+constant-folded and simplified, then emitted as TI-BASIC text.
+
+    tree = simplify(parse_expression("2*3x+0"))    # 6 * X
+    emit(tree)                                     # '6X'
+    emit_conditions(simplify_conditions(parse_conditions("0<=x<=1")))  # '0<=X and X<=1'
+
+Emission follows instruct.md: negation is written as 0-..., chained
+comparisons are split into "a<=X and X<=b".
+"""
+import decimal
+import math
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, Hashable, List, Optional, Tuple, Union
+
+
+class ParseError(ValueError):
+    """The text isn't an expression/constraint we understand."""
+
+
+# ---------------- AST -------------------
+
+@dataclass(frozen=True)
+class Num:
+    __slots__ = ("value", "text")
+    value: float
+    text: str  # as written, or formatted after folding
+
+
+@dataclass(frozen=True)
+class Var:
+    __slots__ = ("name",)
+    name: str  # upper case, like on the calculator
+
+
+@dataclass(frozen=True)
+class Const:
+    __slots__ = ("name",)
+    name: str  # pi, e, infinity
+
+
+@dataclass(frozen=True)
+class Neg:
+    __slots__ = ("operand",)
+    operand: "Node"
+
+
+@dataclass(frozen=True)
+class BinOp:
+    __slots__ = ("op", "left", "right")
+    op: str  # + - * / ^
+    left: "Node"
+    right: "Node"
+
+
+@dataclass(frozen=True)
+class Call:
+    __slots__ = ("func", "args")
+    func: str
+    args: Tuple["Node", ...]
+
+
+@dataclass(frozen=True)
+class Compare:
+    __slots__ = ("op", "left", "right")
+    op: str  # < <= > >= = !=
+    left: "Node"
+    right: "Node"
+
+
+Node = Union[Num, Var, Const, Neg, BinOp, Call]
+
+CONSTANTS = {"pi": math.pi, "e": math.e, "infinity": math.inf}
+
+# function name -> how it's written in TI-BASIC (the name of the token plus its open paren)
+FUNCTIONS = {
+    "sin": "sin(", "cos": "cos(", "tan": "tan(",
+    "arcsin": "sin^-1(", "arccos": "cos^-1(", "arctan": "tan^-1(",
+    "sinh": "sinh(", "cosh": "cosh(", "tanh": "tanh(",
+    "ln": "ln(", "log": "log(", "exp": "e^(", "sqrt": "sqrt(", "abs": "abs(",
+    "min": "min(", "max": "max(",
+}
+
+# longest first, so "sinh" wins over "sin" and "exp" over "e"
+_NAMES = sorted([*FUNCTIONS, *CONSTANTS], key=len, reverse=True)
+
+COMPARISONS = {"<", "<=", ">", ">=", "=", "!="}
+FLIPPED = {"<": ">", "<=": ">=", ">": "<", ">=": "<=", "=": "=", "!=": "!="}
+
+# ---------------- Tokenizer -------------------
+
+# a known name (longest first, so "sinh" wins over "sin") or else one letter, so "sinx" is sin, x
+_TOKEN = re.compile(r'\s*(?:(\d+\.?\d*|\.\d+)|(' + "|".join(map(re.escape, _NAMES)) + r')|([A-Za-z])'
+                    r'|(<=|>=|!=|[-+*/^(),|<>=·]))')
+
+
+def tokenize(text: str) -> List[Tuple[str, str]]:
+    """Split text into (kind, value) tokens: num, name, var or op. Letter runs are split into
+    known names and single-letter variables, so "sinx" is sin, x and "2xy" is 2, x, y."""
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    for match in _TOKEN.finditer(text):
+        if match.start() != pos:
+            break
+        number, name, letter, op = match.groups()
+        if number:
+            tokens.append(("num", number))
+        elif name:
+            tokens.append(("name", name))
+        elif letter:
+            tokens.append(("var", letter.upper()))
+        else:
+            tokens.append(("op", "*" if op == "·" else op))
+        pos = match.end()
+    if pos < len(text):
+        raise ParseError(f"unexpected {text[pos:].lstrip()[:1]!r} in {text!r}")
+    return tokens
+
+
+# ---------------- Parser -------------------
+
+ADD, MUL, UNARY, POW = 10, 20, 25, 30
+BINARY = {"+": ADD, "-": ADD, "*": MUL, "/": MUL, "^": POW}
+
+
+class _Parser:
+    """Pratt parser. Juxtaposition ("2x", "x(x+1)", "|x|sinx") is multiplication at the same
+    level as * and /, which is also how the calculator reads it."""
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.tokens: List[Optional[Tuple[str, str]]] = tokenize(text)
+        self.tokens.append(None)  # the end, so peek() needs no bounds check
+        self.pos = 0
+        self.abs_depth = 0
+
+    def peek(self) -> Optional[Tuple[str, str]]:
+        return self.tokens[self.pos]
+
+    def next(self) -> Tuple[str, str]:
+        token = self.tokens[self.pos]
+        if token is None:
+            raise ParseError(f"unexpected end of {self.text!r}")
+        self.pos += 1
+        return token
+
+    def expect(self, op: str) -> None:
+        if self.next() != ("op", op):
+            raise ParseError(f"expected {op!r} in {self.text!r}")
+
+    def at_end(self) -> bool:
+        return self.tokens[self.pos] is None
+
+    def starts_operand(self, token) -> bool:
+        if token is None:
+            return False
+        kind, value = token
+        if kind != "op":
+            return True
+        return value == "(" or (value == "|" and self.abs_depth == 0)
+
+    def expression(self, rbp: int = 0) -> Node:
+        left = self.prefix()
+        while True:
+            token = self.peek()
+            if token is not None and token[0] == "op" and token[1] in BINARY:
+                op = token[1]
+                lbp = BINARY[op]
+                if lbp <= rbp and not (op == "^" and lbp == rbp):
+                    break
+                self.pos += 1
+                # ^ is right associative: parse its right side at one less so another ^ binds there
+                right = self.expression(lbp - 1 if op == "^" else lbp)
+                left = BinOp(op, left, right)
+            elif self.starts_operand(token):
+                if MUL <= rbp:
+                    break
+                left = BinOp("*", left, self.expression(MUL))
+            else:
+                break
+        return left
+
+    def prefix(self) -> Node:
+        kind, value = self.next()
+        if kind == "num":
+            return Num(float(value), value)
+        if kind == "var":
+            return Var(value)
+        if kind == "name":
+            if value in CONSTANTS:
+                return Const(value)
+            return self.call(value)
+        if value == "(":
+            node = self.expression()
+            self.expect(")")
+            return node
+        if value == "|":
+            self.abs_depth += 1
+            node = self.expression()
+            self.abs_depth -= 1
+            self.expect("|")
+            return Call("abs", (node,))
+        if value == "-":
+            return Neg(self.expression(UNARY))
+        if value == "+":
+            return self.expression(UNARY)
+        raise ParseError(f"unexpected {value!r} in {self.text!r}")
+
+    def call(self, func: str) -> Node:
+        if self.peek() == ("op", "("):
+            self.pos += 1
+            args = [self.expression()]
+            while self.peek() == ("op", ","):
+                self.pos += 1
+                args.append(self.expression())
+            self.expect(")")
+            return Call(func, tuple(args))
+        # "sinx", "sin2x": the argument runs up to the next + or -, like in Desmos
+        return Call(func, (self.expression(ADD),))
+
+
+def parse_expression(text: str) -> Node:
+    parser = _Parser(text)
+    node = parser.expression()
+    if not parser.at_end():
+        raise ParseError(f"unexpected {parser.peek()[1]!r} in {text!r}")
+    return node
+
+
+def parse_conditions(text: str) -> List[Compare]:
+    """Parse comma separated (possibly chained) comparisons into a flat list of Compares."""
+    if not text.strip():
+        return []
+    parser = _Parser(text)
+    conditions = []
+    while True:
+        left = parser.expression()
+        token = parser.peek()
+        if token is None or token[1] not in COMPARISONS:
+            raise ParseError(f"expected a comparison in {text!r}")
+        while token is not None and token[1] in COMPARISONS:
+            parser.pos += 1
+            right = parser.expression()
+            conditions.append(Compare(token[1], left, right))
+            left = right
+            token = parser.peek()
+        if parser.at_end():
+            return conditions
+        parser.expect(",")
+
+
+# ---------------- Simplification -------------------
+
+# Folding is done in decimal on the literals as written and only kept when the result is
+# exact in 12 digits: 1/4 -> 0.25 and 0.1*3 -> 0.3, but 1/3 and sin(1) stay as they are
+# rather than turning into longer, rounded numbers.
+EXACT = decimal.Context(prec=12, traps=[decimal.Inexact, decimal.DivisionByZero,
+                                        decimal.InvalidOperation, decimal.Overflow])
+FOLD_OPS = {"+": EXACT.add, "-": EXACT.subtract, "*": EXACT.multiply, "/": EXACT.divide, "^": EXACT.power}
+FOLD_CALLS: Dict[str, Callable[..., decimal.Decimal]] = {
+    "abs": abs, "min": min, "max": max, "sqrt": EXACT.sqrt,
+}
+
+
+def number(value: decimal.Decimal) -> Num:
+    """Num for a folded value, written without an exponent (the calculator's E is its own token)."""
+    text = format(value.normalize(), "f")
+    if text == "-0":
+        text = "0"
+    return Num(float(text), text)
+
+
+def _fold(op: str, a: Num, b: Num) -> Optional[Num]:
+    try:
+        return number(FOLD_OPS[op](decimal.Decimal(a.text), decimal.Decimal(b.text)))
+    except decimal.DecimalException:
+        return None
+
+
+def _negate(a: Num) -> Num:
+    return number(-decimal.Decimal(a.text))
+
+
+def _is(node: Node, value: float) -> bool:
+    return isinstance(node, Num) and node.value == value
+
+
+def simplify(node: Node) -> Node:
+    """Constant folding plus the identities that can't change what gets graphed."""
+    if isinstance(node, Neg):
+        operand = simplify(node.operand)
+        if isinstance(operand, Num):
+            return _negate(operand)
+        if isinstance(operand, Neg):
+            return operand.operand
+        return Neg(operand)
+
+    if isinstance(node, Call):
+        args = tuple(simplify(arg) for arg in node.args)
+        if node.func in FOLD_CALLS and all(isinstance(arg, Num) for arg in args):
+            try:
+                return number(FOLD_CALLS[node.func](*(decimal.Decimal(arg.text) for arg in args)))
+            except decimal.DecimalException:
+                pass
+        return Call(node.func, args)
+
+    if not isinstance(node, BinOp):
+        return node
+
+    op = node.op
+    left, right = simplify(node.left), simplify(node.right)
+    if isinstance(left, Num) and isinstance(right, Num):
+        folded = _fold(op, left, right)
+        if folded is not None:
+            return folded
+
+    if op in "+-":
+        if _is(right, 0):
+            return left
+        if _is(left, 0):
+            return right if op == "+" else simplify(Neg(right))
+        # a+(-b) -> a-b, a-(-b) -> a+b
+        if isinstance(right, Neg) or (isinstance(right, Num) and right.value < 0):
+            positive = right.operand if isinstance(right, Neg) else _negate(right)
+            return simplify(BinOp("-" if op == "+" else "+", left, positive))
+        # (a+1)+2 -> a+3
+        if (isinstance(right, Num) and isinstance(left, BinOp) and left.op in "+-"
+                and isinstance(left.right, Num)):
+            total = _fold("+", left.right if left.op == "+" else _negate(left.right),
+                          right if op == "+" else _negate(right))
+            if total is not None:
+                return simplify(BinOp("+", left.left, total))
+    elif op == "*":
+        if _is(right, 1):
+            return left
+        if _is(left, 1):
+            return right
+        if isinstance(right, Num) and not isinstance(left, Num):
+            left, right = right, left  # constants go in front: x*2 -> 2x
+        if isinstance(left, Num):
+            if _is(left, -1):
+                return simplify(Neg(right))
+            # 2*(3*x) -> 6x
+            if isinstance(right, BinOp) and right.op == "*" and isinstance(right.left, Num):
+                product = _fold("*", left, right.left)
+                if product is not None:
+                    return simplify(BinOp("*", product, right.right))
+            if isinstance(right, Neg):
+                return simplify(BinOp("*", _negate(left), right.operand))
+            # -2x -> -(2x), which then reads as a subtraction: 1-2x, 0-2X
+            if left.value < 0:
+                return Neg(BinOp("*", _negate(left), right))
+    elif op == "/":
+        if _is(right, 1):
+            return left
+        # (2x)/4 -> 0.5x
+        if isinstance(right, Num) and isinstance(left, BinOp) and left.op == "*" and isinstance(left.left, Num):
+            quotient = _fold("/", left.left, right)
+            if quotient is not None:
+                return simplify(BinOp("*", quotient, left.right))
+    elif op == "^":
+        if _is(right, 1):
+            return left
+    return BinOp(op, left, right)
+
+
+def simplify_conditions(conditions: List[Compare]) -> List[Compare]:
+    """Simplify both sides of every comparison and drop the ones that are always true
+    (like x<infinity). A comparison that's always false is kept, the calculator just won't draw it."""
+    result = []
+    for condition in conditions:
+        left, right = simplify(condition.left), simplify(condition.right)
+        if not _always_true(condition.op, left, right):
+            result.append(Compare(condition.op, left, right))
+    return result
+
+
+def _bound(node: Node) -> Optional[float]:
+    """Value of a constant side of a comparison (infinity included), None if it depends on x/y."""
+    if isinstance(node, Num):
+        return node.value
+    if isinstance(node, Const):
+        return CONSTANTS[node.name]
+    if isinstance(node, Neg) and isinstance(node.operand, Const):
+        return -CONSTANTS[node.operand.name]
+    return None
+
+
+def _always_true(op: str, left: Node, right: Node) -> bool:
+    a, b = _bound(left), _bound(right)
+    if a is not None and b is not None:
+        return {"<": a < b, "<=": a <= b, ">": a > b, ">=": a >= b, "=": a == b, "!=": a != b}[op]
+    # x < infinity, -infinity < x, ... hold for every finite x
+    if op in ("<", "<="):
+        return b == math.inf or a == -math.inf
+    if op in (">", ">="):
+        return a == math.inf or b == -math.inf
+    return False
+
+
+# ---------------- Classification -------------------
+
+TRIG = {"sin", "cos", "tan", "arcsin", "arccos", "arctan", "sinh", "cosh", "tanh"}
+# the buckets CONVERTERv2's identify_function_type guessed from the text, plus Constant/Polynomial/Other
+FUNCTION_TYPES = ("Constant", "Linear", "Quadratic", "Polynomial", "Trigonometric", "Logarithmic",
+                  "Radical", "Exponential", "Other")
+
+
+def linear(node) -> Optional[Tuple[float, float]]:
+    """(slope, intercept) if node is a*X+b, else None."""
+    if isinstance(node, Num):
+        return 0.0, node.value
+    if isinstance(node, Const) and node.name != "infinity":
+        return 0.0, CONSTANTS[node.name]
+    if isinstance(node, Var):
+        return (1.0, 0.0) if node.name == "X" else None
+    if isinstance(node, Neg):
+        inner = linear(node.operand)
+        return (-inner[0], -inner[1]) if inner else None
+    if not isinstance(node, BinOp):
+        return None
+    left, right = linear(node.left), linear(node.right)
+    if left is None or right is None:
+        return None
+    if node.op == "+":
+        return left[0] + right[0], left[1] + right[1]
+    if node.op == "-":
+        return left[0] - right[0], left[1] - right[1]
+    if node.op == "*":
+        if left[0] == 0:
+            return left[1] * right[0], left[1] * right[1]
+        if right[0] == 0:
+            return right[1] * left[0], right[1] * left[1]
+    if node.op == "/" and right[0] == 0 and right[1] != 0:
+        return left[0] / right[1], left[1] / right[1]
+    return None
+
+
+def substitute(node: Node, name: str, value: Node) -> Node:
+    """node with the variable name replaced by value; simplify() the result to fold it."""
+    if isinstance(node, Var):
+        return value if node.name == name else node
+    if isinstance(node, Neg):
+        return Neg(substitute(node.operand, name, value))
+    if isinstance(node, BinOp):
+        return BinOp(node.op, substitute(node.left, name, value), substitute(node.right, name, value))
+    if isinstance(node, Call):
+        return Call(node.func, tuple(substitute(arg, name, value) for arg in node.args))
+    return node
+
+
+def _walk(node):
+    yield node
+    if isinstance(node, Neg):
+        yield from _walk(node.operand)
+    elif isinstance(node, BinOp):
+        yield from _walk(node.left)
+        yield from _walk(node.right)
+    elif isinstance(node, Call):
+        for arg in node.args:
+            yield from _walk(arg)
+
+
+def _has_x(node: Node) -> bool:
+    return any(isinstance(n, Var) and n.name == "X" for n in _walk(node))
+
+
+def function_type(node: Node) -> str:
+    """Which of FUNCTION_TYPES a (simplified) expression looks like, checked in that order of priority:
+    any trig function makes it Trigonometric, any x^2 Quadratic, and so on."""
+    calls = {n.func for n in _walk(node) if isinstance(n, Call)}
+    powers = [n for n in _walk(node) if isinstance(n, BinOp) and n.op == "^"]
+    if calls & TRIG:
+        return "Trigonometric"
+    if any(_is(p.right, 2) and _has_x(p.left) for p in powers):
+        return "Quadratic"
+    if calls & {"ln", "log"}:
+        return "Logarithmic"
+    if "sqrt" in calls:
+        return "Radical"
+    if "exp" in calls or any(_has_x(p.right) for p in powers):
+        return "Exponential"
+    if powers and not calls and all(isinstance(p.right, Num) for p in powers):
+        return "Polynomial"
+    line = linear(node)
+    if line is not None:
+        return "Constant" if line[0] == 0 else "Linear"
+    return "Other"
+
+
+# ---------------- Canonical form -------------------
+
+# significant digits numbers are compared at, so 1/3 and 0.333333333333 match (the calculator keeps 14)
+CANONICAL_DIGITS = 12
+
+
+def _canonical_number(value: float, tolerance: float) -> Hashable:
+    # a grid, not a distance: values either side of a half multiple of tolerance get different keys
+    if tolerance:
+        return round(value / tolerance)
+    return float(f"{value:.{CANONICAL_DIGITS}g}")
+
+
+def canonical(node: Node, tolerance: float = 0.0) -> Hashable:
+    """A key that's equal for (simplified) expressions that are the same up to number formatting
+    and the order of + and * operands: 1/4x, 0.25*x and x*.250 all get the same one, as do
+    sin(x)+1 and 1+sin(x). Lines are keyed by slope and intercept, so 2(x+1) = 2x+2 too.
+    With a tolerance numbers count as equal when they round to the same multiple of it (so
+    it quantizes: two numbers closer than tolerance can still round to neighbouring multiples)."""
+    line = linear(node)
+    if line is not None:
+        return "line", _canonical_number(line[0], tolerance), _canonical_number(line[1], tolerance)
+    return _canonical(node, tolerance)
+
+
+def _canonical(node: Node, tolerance: float) -> Hashable:
+    if isinstance(node, Num):
+        return "n", _canonical_number(node.value, tolerance)
+    if isinstance(node, (Var, Const)):
+        return "v", node.name
+    if isinstance(node, Neg):
+        return "+", ((-1, _canonical(node.operand, tolerance)),)
+    if isinstance(node, Call):
+        args = [_canonical(arg, tolerance) for arg in node.args]
+        if node.func in ("min", "max"):
+            args.sort()
+        return "f", node.func, tuple(args)
+    if node.op in "+-":
+        terms = []
+        _terms(node, 1, terms, tolerance)
+        return "+", tuple(sorted(terms))
+    if node.op == "*":
+        factors = []
+        _factors(node, factors, tolerance)
+        return "*", tuple(sorted(factors))
+    return node.op, _canonical(node.left, tolerance), _canonical(node.right, tolerance)
+
+
+def _terms(node: Node, sign: int, terms: list, tolerance: float) -> None:
+    """Flatten a chain of + - (and negations) into (sign, key) terms."""
+    if isinstance(node, BinOp) and node.op in "+-":
+        _terms(node.left, sign, terms, tolerance)
+        _terms(node.right, sign if node.op == "+" else -sign, terms, tolerance)
+    elif isinstance(node, Neg):
+        _terms(node.operand, -sign, terms, tolerance)
+    else:
+        terms.append((sign, _canonical(node, tolerance)))
+
+
+def _factors(node: Node, factors: list, tolerance: float) -> None:
+    if isinstance(node, BinOp) and node.op == "*":
+        _factors(node.left, factors, tolerance)
+        _factors(node.right, factors, tolerance)
+    else:
+        factors.append(_canonical(node, tolerance))
+
+
+def canonical_conditions(conditions: List[Compare], tolerance: float = 0.0) -> Hashable:
+    """canonical() for (simplified) restrictions: x>1 and 1<x are the same, and so is the
+    order of comma separated conditions."""
+    keys = []
+    for condition in conditions:
+        op, left, right = condition.op, condition.left, condition.right
+        if op in (">", ">="):
+            op, left, right = FLIPPED[op], right, left
+        sides = [canonical(left, tolerance), canonical(right, tolerance)]
+        if op in ("=", "!="):
+            sides.sort()
+        keys.append((op, *sides))
+    return tuple(sorted(keys))
+
+
+# ---------------- Emission -------------------
+
+# binding strength of each kind of node when written out; wrap in parens below the required level
+P_ADD, P_MUL, P_POW, P_ATOM = 1, 2, 3, 4
+
+
+def emit(node: Node, min_prec: int = 0) -> str:
+    """Write node as TI-BASIC, with only the parentheses it needs."""
+    text, prec = _emit(node)
+    return f"({text})" if prec < min_prec else text
+
+
+def _emit(node: Node) -> Tuple[str, int]:
+    if isinstance(node, Num):
+        if node.value < 0:
+            return _emit(Neg(_negate(node)))
+        return node.text, P_ATOM
+    if isinstance(node, Var):
+        return node.name, P_ATOM
+    if isinstance(node, Const):
+        if node.name == "infinity":
+            return "10^(99)", P_ATOM
+        return node.name, P_ATOM
+    if isinstance(node, Neg):
+        # negation as subtraction from zero (instruct.md rule 6)
+        return "0-" + emit(node.operand, P_MUL), P_ADD
+    if isinstance(node, Call):
+        if node.func == "abs" and len(node.args) == 1:
+            return f"abs({emit(node.args[0])})", P_ATOM
+        name = FUNCTIONS.get(node.func, node.func + "(")
+        return name + ",".join(emit(arg) for arg in node.args) + ")", P_ATOM
+
+    op = node.op
+    if op in "+-":
+        return emit(node.left, P_ADD) + op + emit(node.right, P_MUL if op == "-" else P_ADD), P_ADD
+    if op == "*":
+        left = emit(node.left, P_MUL)
+        right = emit(node.right, P_MUL)
+        # juxtapose when the calculator reads it the same way: 2X, 2sin(X), 2(X+1), XY
+        if (right[0].isalpha() or right[0] == "(") and not right.startswith("E") and not isinstance(node.right, Num):
+            return left + right, P_MUL
+        return f"{left}*{right}", P_MUL
+    if op == "/":
+        return emit(node.left, P_MUL) + "/" + emit(node.right, P_POW), P_MUL
+    # the calculator evaluates ^ left to right, so anything but a plain number/variable exponent gets parens
+    return emit(node.left, P_ATOM) + "^" + emit(node.right, P_ATOM), P_POW
+
+
+def emit_conditions(conditions: List[Compare]) -> str:
+    return " and ".join(f"{emit(c.left, P_ADD)}{c.op}{emit(c.right, P_ADD)}" for c in conditions)
@@ -0,0 +1,177 @@
+"""Append-only session journal for the TUI, so color entry survives crashes and quitting.
+
+One JSON record per line:
+
+    {"session": "<key>"}                    which input (+ settings) this belongs to
+    {"equations": [[expr, constraints]...]}  the validated/merged equations
+    {"colors": {"12": "RED"}, "at": 13}      snapshot written on compaction
+    {"rules": "type:trig=RED", "assigned": {"3": "RED"}}   color rules applied, and what they colored
+    {"i": 12, "c": "RED"}                    one color assignment
+    {"at": 40}                               where the cursor was
+
+Appends only go into a buffer; flush() (the TUI calls it on a timer from a worker
+thread) writes them out and fsyncs, so the UI never waits on the disk. When enough
+records pile up the file is compacted into a fresh snapshot (written to a temp file
+and renamed over, so a crash mid-compaction leaves the old journal intact).
+
+Resuming replays the journal: the equations come from the snapshot instead of
+re-validating the input, so it takes time proportional to the journal. A torn last
+line from a crash is ignored.
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+JOURNAL_NAME = ".mathaa-session.jsonl"
+# seconds between flushes, i.e. the most color entry a hard crash can lose
+FLUSH_INTERVAL = 2.0
+# compact once this many records were appended since the last snapshot
+COMPACT_AFTER = 5000
+
+
+class SessionJournal:
+    """Colors and cursor position of one TUI session, kept on disk."""
+
+    def __init__(self, path: str = JOURNAL_NAME) -> None:
+        self.path = path
+        self.key: Optional[str] = None
+        self.equations: Sequence[Tuple[str, str]] = []
+        self.colors: Dict[int, str] = {}
+        self.rules = ""
+        self.rule_colors: Dict[int, str] = {}
+        self.position = 0
+        self._records = 0
+        self._pending: List[str] = []
+        self._position_written = 0
+        self._lock = threading.Lock()
+        self._file = None
+
+    @staticmethod
+    def input_key(input_file: str, *settings) -> str:
+        """Identifies the input file contents plus whatever settings change the equation list."""
+        digest = hashlib.blake2b(digest_size=16)
+        with open(input_file, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        digest.update(repr(settings).encode())
+        return digest.hexdigest()
+
+    def load(self, key: str) -> bool:
+        """Replay the journal if it belongs to key. Returns whether there was a session to resume."""
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return False
+        with f:
+            try:
+                if json.loads(f.readline()).get("session") != key:
+                    return False
+            except ValueError:
+                return False
+            equations = None
+            good = f.tell()
+            for line in iter(f.readline, b""):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # torn write from a crash, everything before it is good
+                good += len(line)
+                if "equations" in record:
+                    equations = [tuple(equation) for equation in record["equations"]]
+                if "colors" in record:
+                    self.colors = {int(index): color for index, color in record["colors"].items()}
+                    self._records = 0
+                if "rules" in record:
+                    self.rules = record["rules"]
+                    self.rule_colors = {int(index): color for index, color in record["assigned"].items()}
+                if "i" in record:
+                    self.colors[record["i"]] = record["c"]
+                    self._records += 1
+                if "at" in record:
+                    self.position = record["at"]
+        if equations is None:
+            return False
+        self.key, self.equations = key, equations
+        self._position_written = self.position
+        if good < os.path.getsize(self.path):
+            os.truncate(self.path, good)  # so appends don't continue the torn line
+        self._open()
+        return True
+
+    def start(self, key: str, equations: Sequence[Tuple[str, str]], colors: Optional[Dict[int, str]] = None) -> None:
+        """Begin a new session for key, replacing whatever journal was there (colors: ones the input came with).
+
+        equations is kept as it is (not copied), it mustn't change afterwards.
+        """
+        self.key, self.equations = key, equations
+        self.colors, self.position = dict(colors or {}), 0
+        self.rules, self.rule_colors = "", {}
+        with self._lock:
+            self._compact()
+
+    def record_color(self, index: int, color: str) -> None:
+        with self._lock:
+            self.colors[index] = color
+            self._pending.append(json.dumps({"i": index, "c": color}))
+            self._records += 1
+
+    def record_rules(self, rules: str, assigned: Dict[int, str]) -> None:
+        with self._lock:
+            self.rules, self.rule_colors = rules, dict(assigned)
+            self._pending.append(json.dumps({"rules": rules, "assigned": assigned}))
+            # as big as a snapshot, so count it as one record per equation it colored
+            self._records += len(assigned)
+
+    def record_position(self, index: int) -> None:
+        # only the latest position matters, it's written with the next flush
+        self.position = index
+
+    def flush(self) -> None:
+        """Write out buffered records and fsync; compacts when enough have piled up."""
+        with self._lock:
+            if self._file is None:
+                return
+            if self.position != self._position_written:
+                self._pending.append(json.dumps({"at": self.position}))
+                self._position_written = self.position
+            if self._pending:
+                self._file.write("\n".join(self._pending) + "\n")
+                self._pending.clear()
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            if self._records >= COMPACT_AFTER:
+                self._compact()
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _open(self) -> None:
+        self._file = open(self.path, "a")
+
+    def _compact(self) -> None:
+        """Rewrite the journal as header + snapshot. Needs the lock."""
+        if self._file is not None:
+            self._file.close()
+        self._pending.clear()
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(json.dumps({"session": self.key}) + "\n")
+            f.write('{"equations": [')  # one at a time, so millions of them are never one string
+            for index, equation in enumerate(self.equations):
+                f.write((", " if index else "") + json.dumps(equation))
+            f.write("]}\n")
+            if self.rules:
+                f.write(json.dumps({"rules": self.rules, "assigned": self.rule_colors}) + "\n")
+            f.write(json.dumps({"colors": self.colors, "at": self.position}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._records = 0
+        self._position_written = self.position
+        self._open()
@@ -0,0 +1,103 @@
+"""Content-hash manifest for the generated program files.
+
+Remembers a hash (plus size and mtime) of every file written into a folder, so
+a re-run only rewrites the programs whose contents actually changed and only
+those have to be sent to the calculator again. Files from the last run that
+weren't produced this time (the drawing got shorter) are removed on finish().
+
+Files are written to temporary names first and only renamed over the old ones in
+finish(), so a run that dies halfway (or abort()) leaves the last complete set of
+programs alone instead of a mix of old and new ones. Rejected lines go to the
+badeqn.txt reject stream, see sinks.py.
+"""
+import hashlib
+import json
+import os
+from typing import Dict, Set
+
+import sinks
+
+MANIFEST_NAME = ".mathaa-manifest.json"
+
+
+class Manifest:
+    """Write-if-changed for one output folder."""
+
+    # write both programN.txt and programN.8xp unless told otherwise
+    output_format = None
+
+    def __init__(self, out_dir: str = ".", name: str = MANIFEST_NAME, append_rejects: bool = True) -> None:
+        self.out_dir = out_dir
+        self.path = os.path.join(out_dir, name)
+        self.written = 0
+        self.unchanged = 0
+        self.removed = 0
+        self._seen: Set[str] = set()
+        # written files waiting to be renamed into place by finish()
+        self._staged: Dict[str, str] = {}
+        self.rejects = sinks.RejectStream(os.path.join(out_dir, sinks.REJECTS_NAME), append_rejects)
+        try:
+            with open(self.path) as f:
+                self.entries: Dict[str, list] = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+    def _stamp(self, filename: str):
+        stat = os.stat(os.path.join(self.out_dir, filename))
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def write(self, filename: str, data: bytes) -> bool:
+        """Write data to out_dir/filename unless it's already there. Returns whether it was written."""
+        self._seen.add(filename)
+        digest = self.digest(data)
+        entry = self.entries.get(filename)
+        if entry and entry[0] == digest:
+            try:
+                if self._stamp(filename) == entry[1:]:
+                    self.unchanged += 1
+                    return False
+            except FileNotFoundError:
+                pass
+        staged = self._staged.get(filename) or sinks.temp_path(os.path.join(self.out_dir, filename))
+        with open(staged, "wb") as f:
+            f.write(data)
+        self._staged[filename] = staged
+        self.entries[filename] = [digest]
+        self.written += 1
+        return True
+
+    def finish(self) -> None:
+        """Move the new files into place, remove files left over from the last run and save the manifest."""
+        for filename, staged in self._staged.items():
+            os.replace(staged, os.path.join(self.out_dir, filename))
+            self.entries[filename][1:] = self._stamp(filename)
+        self._staged.clear()
+        self.rejects.close()
+        for filename in list(self.entries):
+            if filename in self._seen:
+                continue
+            try:
+                os.remove(os.path.join(self.out_dir, filename))
+                self.removed += 1
+            except FileNotFoundError:
+                pass
+            del self.entries[filename]
+        sinks.atomic_write(self.path, json.dumps(self.entries).encode())
+        self._seen.clear()
+
+    def abort(self) -> None:
+        """Drop everything written since the last finish(), keeping the files from the last run."""
+        for staged in self._staged.values():
+            try:
+                os.remove(staged)
+            except FileNotFoundError:
+                pass
+        self._staged.clear()
+        self.rejects.abort()
+
+    def stats(self) -> str:
+        return f"FILES: {self.written} written, {self.unchanged} unchanged, {self.removed} removed"
@@ -0,0 +1,121 @@
+"""Size-aware packing of equations into programs.
+
+A program is a run of redraws: up to y_vars equations stored in Y0.., then the
+DispGraph/RecallPic/StorePic/ClrDraw round trip and a DelVar for each Y-var used.
+Each redraw is filled up to the Y-var limit and each program gets as many redraws
+as fit its RAM budget (in tokenized bytes), so a big dump turns into a handful of
+programs with the fewest possible Pic round trips instead of one program per 10
+equations.
+
+Equations drawn with a command instead of a Y-var (Line( for segments, see
+core.EquationProcessor.format_line) ride along in whatever redraw is open: they
+don't count against the Y-var limit and cost nothing per pixel column.
+
+When a program's budget runs out halfway through a redraw, the redraw isn't cut
+short: the program ends with those Y-vars stored and the next program fills the
+rest before doing the round trip. So every redraw but the very last has all y_vars
+Y-vars, which is the fewest round trips there can be, and the programs have to be
+run in order (which they already had to, for the picture to build up). A redraw
+with Line( items stays in one program, those are drawn in its round trip.
+
+Equations stay in their original order: later equations draw over earlier ones,
+and for a fixed order filling greedily is already the fewest redraws/programs.
+"""
+from dataclasses import dataclass, field
+from typing import Callable, Generic, Iterable, Iterator, List, Optional, TypeVar
+
+# bytes of tokens per program; fits in the free RAM of a monochrome 84+, a CE has plenty more
+RAM_BUDGET = 16384
+# Y0..Y9
+Y_VARS = 10
+
+T = TypeVar("T")
+
+
+@dataclass
+class PackStats:
+    equations: int = 0
+    redraws: int = 0
+    programs: int = 0
+    largest: int = 0  # bytes of the biggest program
+    draw_cost: int = 0  # tokens evaluated per pixel column, summed over the equations
+    drawn: int = 0  # equations drawn with a command instead of a Y-var
+    carried: int = 0  # redraws finished in the next program instead of cut short, i.e. round trips saved
+
+    def __str__(self) -> str:
+        drawn = f", {self.drawn} as Line(" if self.drawn else ""
+        carried = f", {self.carried} redraws saved by continuing them in the next program" if self.carried else ""
+        return (f"PACKED: {self.equations} equations into {self.redraws} redraws in {self.programs} programs "
+                f"(largest {self.largest} bytes, draw cost {self.draw_cost} tokens{drawn}{carried})")
+
+
+@dataclass
+class Redraw(Generic[T]):
+    """A program's part of one redraw."""
+    items: List[T] = field(default_factory=list)
+    first: int = 0  # Y-vars the previous program already stored for it
+    closed: bool = True  # False: no round trip yet, the next program finishes it
+
+
+def pack(items: Iterable[T], size: Callable[[T], int], overhead: Callable[[int], int],
+         ram_budget: int = RAM_BUDGET, y_vars: int = Y_VARS, cost: Optional[Callable[[T], int]] = None,
+         stats: Optional[PackStats] = None, y_var: Optional[Callable[[T], bool]] = None) -> Iterator[List[Redraw[T]]]:
+    """Group items into programs (lists of Redraws).
+
+    size(item) is an item's bytes, overhead(n) the bytes a redraw using n Y-vars adds on top.
+    y_var(item) says whether an item takes a Y-var (all do without it).
+    A single item bigger than the budget still gets a program of its own.
+    """
+    if not 1 <= y_vars <= Y_VARS:
+        raise ValueError(f"y_vars must be between 1 and {Y_VARS}")
+    stats = stats if stats is not None else PackStats()
+    program: List[Redraw[T]] = []
+    batch: Redraw[T] = Redraw()
+    program_size = batch_size = used = 0  # used = Y-vars taken by batch's redraw, in this program or the last
+    drawn = False  # batch has items drawn in its round trip, so it can't be split
+
+    def close_batch() -> None:
+        nonlocal batch, batch_size, program_size, used, drawn
+        program.append(batch)
+        program_size += batch_size + overhead(used)
+        stats.redraws += 1
+        batch, batch_size, used, drawn = Redraw(), 0, 0, False
+
+    def finish_program() -> List[Redraw[T]]:
+        nonlocal program, program_size
+        stats.programs += 1
+        stats.largest = max(stats.largest, program_size)
+        finished, program, program_size = program, [], 0
+        return finished
+
+    for item in items:
+        item_size = size(item)
+        takes = y_var is None or y_var(item)
+        full = takes and used == y_vars
+        over = not full and program_size + batch_size + item_size + overhead(used + takes) > ram_budget
+        if batch.items and over and not drawn:
+            # the program is full but the redraw isn't: store what's there, finish it in the next program
+            batch.closed = False
+            program.append(batch)
+            program_size += batch_size
+            stats.carried += 1
+            yield finish_program()
+            batch, batch_size = Redraw(first=used), 0
+        else:
+            if batch.items and (full or over):
+                close_batch()
+            if program and not batch.items and program_size + item_size + overhead(int(takes)) > ram_budget:
+                yield finish_program()
+        batch.items.append(item)
+        batch_size += item_size
+        used += takes
+        drawn = drawn or not takes
+        stats.equations += 1
+        stats.drawn += not takes
+        if cost is not None:
+            stats.draw_cost += cost(item)
+
+    if batch.items:
+        close_batch()
+    if program:
+        yield finish_program()
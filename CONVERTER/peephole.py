@@ -0,0 +1,119 @@
+"""Token-saving rewrites of the TI-BASIC the converter writes, without changing what it draws.
+
+Runs over the formatted functions before they're packed (so the savings make room
+for more equations per program) and over the finished program lines:
+
+- numbers lose what the calculator doesn't need: 0.260 -> .26, 2.0 -> 2
+- 3.1415 (what LaTeXTOASCII used to write for pi, still in old input.txt files)
+  and longer runs of pi's digits become the one byte pi token
+- * goes where the calculator multiplies anyway: X*2 -> X2, sin(X)*.5 -> sin(X).5, 2*pi -> 2pi
+- closing parens at the end of a line, or at the end of a Y-var's string, are
+  dropped: the calculator closes whatever is still open there
+  ("piecewise(sqrt(X+1),X<2)"->Y0 -> "piecewise(sqrt(X+1),X<2"->Y0, GraphColor(Y0,RED)
+
+The quote before ->Y0 stays, and so does 0- for negation (instruct.md rule 6).
+Parentheses are already only written where they're needed (exprparse.emit).
+"""
+import re
+from dataclasses import dataclass, field
+from typing import List
+
+import ti8xp
+
+PI_DIGITS = "3.14159265358979"
+# numbers with a decimal point, not part of a longer number
+DECIMAL = re.compile(r'(?<![\d.])(?=\.?\d)(\d*)\.(\d*)')
+PI_LITERAL = re.compile(r'(?<![\d.])3\.1415\d*')
+# * before a number after something that isn't one (digits would run together), and * before pi
+IMPLICIT = re.compile(r'(?:(?<=[)X])|(?<=pi))\*(?=[\d.])|\*(?=pi)')
+# "function"->Yn, the function's string being what gets evaluated (and closed) when graphing
+ASSIGNMENT = re.compile(r'"(.*)"(->Y\d)')
+
+
+@dataclass
+class PeepholeStats:
+    before: int = 0
+    after: int = 0
+    saved: List[int] = field(default_factory=list)  # bytes per program, in order
+
+    def add(self, before: bytes, after: bytes) -> None:
+        self.before += len(before)
+        self.after += len(after)
+        self.saved.append(len(before) - len(after))
+
+    def __str__(self) -> str:
+        percent = 100 * (self.before - self.after) / self.before if self.before else 0.0
+        programs = ", ".join(f"{n}: {saved}" for n, saved in enumerate(self.saved, 1))
+        return (f"OPTIMIZED: {self.before} -> {self.after} bytes ({self.before - self.after} saved, "
+                f"{percent:.1f}%), saved per program: {programs}")
+
+
+def _decimal(match: re.Match) -> str:
+    whole, fraction = match.group(1).lstrip("0"), match.group(2).rstrip("0")
+    if fraction:
+        return f"{whole}.{fraction}"
+    return whole or "0"
+
+
+def _pi(match: re.Match) -> str:
+    text = match.group()
+    return "pi" if PI_DIGITS.startswith(text) or text.startswith(PI_DIGITS) else text
+
+
+def optimize_expression(text: str) -> str:
+    """The numbers, pi and implicit multiplication rewrites for one function (or Line( segment)."""
+    text = PI_LITERAL.sub(_pi, text)
+    text = DECIMAL.sub(_decimal, text)
+    return IMPLICIT.sub("", text)
+
+
+def close(text: str) -> str:
+    """text without the closing parens at its end, which the calculator adds back."""
+    return text.rstrip(")")
+
+
+def optimize_function(text: str) -> str:
+    """optimize_expression() for a function that ends up as a Y-var's whole string."""
+    return close(optimize_expression(text))
+
+
+def optimize_line(line: str) -> str:
+    """Drop what the end of a program line, or of the string stored in a Y-var, closes anyway."""
+    match = ASSIGNMENT.fullmatch(line)
+    if match:
+        return f'"{close(match.group(1))}"{match.group(2)}'
+    return close(line)
+
+
+def optimize_program(text: str) -> str:
+    """optimize_line() for every line, for programs whose functions went through optimize_function()."""
+    return "\n".join(optimize_line(line) for line in text.split("\n"))
+
+
+def report(stats: PeepholeStats, raw: str, optimized: str) -> None:
+    """Count what optimizing saved for one program (in tokenized bytes)."""
+    stats.add(ti8xp.tokenize(raw), ti8xp.tokenize(optimized))
+
+
+if __name__ == "__main__":
+    # what every rewrite does (and leaves alone)
+    checks = [
+        ("0.260X+1.50", ".26X+1.5"), ("2.0", "2"), ("10.", "10"), ("0.0", "0"), ("100", "100"),
+        ("3.1415X", "piX"), ("3.14159265X", "piX"), ("3.1416", "3.1416"), ("23.1415", "23.1415"),
+        ("X*2", "X2"), ("sin(X)*0.5", "sin(X).5"), ("2*3.1415", "2pi"), ("X*pi", "Xpi"), ("2*3", "2*3"),
+        ("Y0", "Y0"), ("10^(2)+X", "10^(2)+X"),
+        ("piecewise(sqrt(X+1),X<2)", "piecewise(sqrt(X+1),X<2"),
+    ]
+    failed = 0
+    for text, expected in checks:
+        got = optimize_function(text)
+        if got != expected:
+            failed += 1
+            print(f"FAIL {text!r} -> {got!r}, expected {expected!r}")
+    for line, expected in [('"sin(X)"->Y0', '"sin(X"->Y0'), ("GraphColor(Y0,RED)", "GraphColor(Y0,RED"),
+                           ("Line(0,1,2,3,1,BLUE)", "Line(0,1,2,3,1,BLUE"), ("DelVar Y0", "DelVar Y0")]:
+        if optimize_line(line) != expected:
+            failed += 1
+            print(f"FAIL {line!r} -> {optimize_line(line)!r}, expected {expected!r}")
+    print("ok" if not failed else f"{failed} failed")
+    raise SystemExit(1 if failed else 0)
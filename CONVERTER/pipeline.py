@@ -0,0 +1,372 @@
+"""Single-process Desmos LaTeX -> TI-BASIC pipeline.
+
+Streams LaTeX lines (or ASCII lines with --ascii) from a file or stdin through
+LaTeX -> ASCII -> EQUATION_PATTERN -> format_piecewise -> programN.txt/.8xp
+without the output.txt/input.txt round trip, holding one program in memory at a time.
+--merge merges collinear/touching segments first (see segments.py), which needs the
+whole input in memory.
+Before that, equations drawing the same as an earlier one are dropped and listed
+in badeqn.txt (see dedupe.py, --no-dedupe keeps them).
+--window drops what the calculator's graph window wouldn't show and clips the
+restrictions of the rest to it (see culling.py). --lines draws straight segments
+with Line( instead of a Y-var each (see EquationProcessor.format_line). The
+TI-BASIC goes through peephole.py's token-saving rewrites (--no-optimize skips them). --bundle puts everything into one
+zip/tar/text file or stdout instead of a file per program (see sinks.py); either
+way nothing old gets replaced until the run finished.
+Every converted line goes into the LaTeXTOASCII conversion cache, so lines that
+didn't change since the last run cost one lookup. --stats prints where the time
+went per stage (see runstats.py), --profile dumps a cProfile of the run.
+
+    python pipeline.py expressions.txt
+    cat expressions.txt | python pipeline.py - --quiet
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from core import FORMAT_VERSION, FORMATS, PROGRAM_NAME, PROGRAM_SIZE, REJECT_CODES, EquationProcessor, latex_to_ascii
+
+import culling
+import dedupe
+import exprparse
+import manifest
+import packer
+import peephole
+import segments
+import sinks
+
+import convcache  # next to LaTeXTOASCII.py, core.py puts that folder on sys.path
+import runstats
+import ti8xp
+from runstats import NULL_STATS, RunStats
+
+# (ascii equation, piecewise function, its simplified trees or None when it came from the cache)
+Converted = Tuple[str, str, Optional[dedupe.Parsed]]
+
+
+def read_lines(source: TextIO) -> Iterator[str]:
+    """Yield stripped, non-empty lines."""
+    for line in source:
+        if line := line.strip():
+            yield line
+
+
+def convert_line(line: str, ascii_input: bool = False, run_stats: RunStats = NULL_STATS,
+                 draw_lines: bool = False) -> Tuple[str, Optional[str], Optional[dedupe.Parsed]]:
+    """Return (ascii equation, piecewise function, simplified trees) for one line.
+
+    The function and trees are None if it's rejected. The line is parsed once, the
+    trees go on to dedupe_functions.
+    """
+    if ascii_input:
+        text = line
+    else:
+        with run_stats.stage("latex"):
+            text = latex_to_ascii(line)
+    with run_stats.stage("parse"):
+        equation = EquationProcessor.split_line(text)
+        try:
+            simplified = equation and EquationProcessor.simplified(*equation)
+        except exprparse.ParseError:
+            simplified = None
+    if not simplified:
+        return text, None, None
+    with run_stats.stage("format"):
+        return text, EquationProcessor.format_simplified(*simplified, draw_lines), simplified
+
+
+def cache_kind(ascii_input: bool, draw_lines: bool = False) -> str:
+    """Cache namespace for whole-line results, tied to the converter versions (and mode) that produced them."""
+    suffix = "-draw" if draw_lines else ""
+    if ascii_input:
+        return f"piecewise-{FORMAT_VERSION}{suffix}"
+    from LaTeXTOASCII import CONVERTER_VERSION
+    return f"line-{CONVERTER_VERSION}-{FORMAT_VERSION}{suffix}"
+
+
+def convert_lines(lines: Iterable[str], rejects: sinks.RejectStream, ascii_input: bool = False,
+                  quiet: bool = False, cache: Optional[convcache.ConversionCache] = None,
+                  run_stats: RunStats = NULL_STATS, draw_lines: bool = False) -> Iterator[Converted]:
+    """Yield (ascii equation, piecewise function, trees) for good lines, writing rejected lines to rejects."""
+    kind = cache_kind(ascii_input, draw_lines)
+    for line in lines:
+        run_stats.count("lines")
+        with run_stats.stage("cache"):
+            cached = cache.get(kind, line) if cache else None
+        if cached is not None:
+            text, function = json.loads(cached)
+            simplified = None
+        else:
+            text, function, simplified = convert_line(line, ascii_input, run_stats, draw_lines)
+            if cache:
+                with run_stats.stage("cache"):
+                    cache.put(kind, line, json.dumps([text, function]))
+        if not quiet and not ascii_input:
+            with run_stats.stage("print"):
+                print("LaTeX Equation: ", line)
+                print("ASCII Equation: ", text)
+        if function is None:
+            reason = EquationProcessor.reject_reason(text)
+            run_stats.reject(reason)
+            with run_stats.stage("write"):
+                rejects.write(text, REJECT_CODES[reason])
+        else:
+            yield text, function, simplified
+
+
+def dedupe_functions(converted: Iterable[Converted], deduper: dedupe.Deduper, rejects: sinks.RejectStream,
+                     run_stats: RunStats = NULL_STATS) -> Iterator[Converted]:
+    """Drop the converted lines an earlier one already draws, writing them to rejects (streams).
+
+    Keys come from the trees convert_line parsed; only lines found in the cache get parsed here.
+    """
+    for text, function, simplified in converted:
+        with run_stats.stage("dedupe"):
+            duplicate = deduper.duplicate(EquationProcessor.split_line(text), simplified=simplified)
+        if not duplicate:
+            yield text, function, simplified
+            continue
+        run_stats.reject("duplicate")
+        with run_stats.stage("write"):
+            rejects.write(text, REJECT_CODES["duplicate"])
+
+
+def merge_functions(converted: Iterable[Converted], stats: Optional[segments.MergeStats] = None,
+                    run_stats: RunStats = NULL_STATS, window: Optional[culling.Window] = None,
+                    cull_stats: Optional[culling.CullStats] = None, draw_lines: bool = False) -> Iterator[str]:
+    """Merge collinear/contiguous segments and yield the functions. Needs the whole input in memory.
+
+    Equations that come out of merging (and culling) as they went in keep the function
+    convert_lines made or found in the cache, only merged and clipped ones get formatted again.
+    """
+    equations: List[Tuple[str, str]] = []
+    functions: List[str] = []
+    for text, function, _ in converted:
+        equations.append(EquationProcessor.split_line(text))  # convert_lines already made sure it parses
+        functions.append(function)
+    with run_stats.stage("merge"):
+        merged = segments.merge_indexed(equations, stats)
+    if window is not None:
+        kept = culling.cull_indexed((equation for _, equation in merged), window, cull_stats)
+        merged = [(merged[i][0], clipped) for i, clipped in run_stats.iterate("cull", kept)]
+    for index, equation in merged:
+        if equation == equations[index]:
+            yield functions[index]
+            continue
+        with run_stats.stage("format"):
+            function = EquationProcessor.format_function(*equation, draw_lines)
+        yield function
+
+
+def cull_functions(converted: Iterable[Converted], window: culling.Window,
+                   stats: Optional[culling.CullStats] = None, run_stats: RunStats = NULL_STATS,
+                   draw_lines: bool = False) -> Iterator[str]:
+    """--window without merging: cull line by line, so the input keeps streaming."""
+    for text, function, _ in converted:
+        with run_stats.stage("cull"):
+            equation = EquationProcessor.parse_line(text)
+            clipped = next(culling.cull_equations([equation], window, stats), None)
+        if clipped is None:
+            continue
+        if clipped != equation:
+            with run_stats.stage("format"):
+                function = EquationProcessor.format_function(*clipped, draw_lines)
+        yield function
+
+
+def build_programs(functions: Iterable[str], ram_budget: int = packer.RAM_BUDGET, y_vars: int = PROGRAM_SIZE,
+                   stats: Optional[packer.PackStats] = None, optimize: bool = True,
+                   peephole_stats: Optional[peephole.PeepholeStats] = None) -> Iterator[str]:
+    """Pack functions into programs under ram_budget bytes and yield each program's text."""
+    return EquationProcessor.pack_programs(((function, "BLACK") for function in functions), ram_budget, y_vars, stats,
+                                           optimize, peephole_stats)
+
+
+def write_program(files: manifest.Manifest, number: int, program: str, output_format: str = "both",
+                  run_stats: RunStats = NULL_STATS) -> None:
+    """Write programN.txt and/or programN.8xp (called EQ<N> on the calculator) if they changed."""
+    if output_format != "8xp":
+        with run_stats.stage("write"):
+            files.write(f"program{number}.txt", program.encode())
+    if output_format != "txt":
+        with run_stats.stage("tokenize"):
+            data = ti8xp.program_bytes(PROGRAM_NAME.format(number), program)
+        with run_stats.stage("write"):
+            files.write(f"program{number}.8xp", data)
+
+
+def run(source: TextIO, out_dir: str = ".", ascii_input: bool = False, quiet: bool = False,
+        cache: Optional[convcache.ConversionCache] = None, output_format: str = "both",
+        ram_budget: int = packer.RAM_BUDGET, y_vars: int = PROGRAM_SIZE,
+        merge: bool = False, bad_mode: str = "a", run_stats: RunStats = NULL_STATS,
+        window: Optional[culling.Window] = None, cull_stats: Optional[culling.CullStats] = None,
+        bundle: Optional[str] = None, deduplicate: bool = True, dedupe_tolerance: float = 0.0,
+        dedupe_stats: Optional[dedupe.DedupeStats] = None, draw_lines: bool = False,
+        optimize: bool = True, peephole_stats: Optional[peephole.PeepholeStats] = None,
+        ) -> Tuple[packer.PackStats, Optional[segments.MergeStats], manifest.Manifest]:
+    """Run the whole pipeline, writing the programs that changed into out_dir (or bundle, see sinks.py).
+
+    Equations drawing the same as an earlier one are dropped unless deduplicate is off (counted in dedupe_stats).
+    With a window, equations it doesn't show are dropped (counted in cull_stats).
+    With draw_lines, straight segments are drawn with Line( instead of taking a Y-var.
+    With optimize the programs go through peephole.py (bytes saved per program in peephole_stats).
+    Nothing replaces the old programs or badeqn.txt unless the whole run went through.
+    """
+    stats = packer.PackStats()
+    merge_stats = segments.MergeStats() if merge else None
+    files = sinks.open_sink(bundle, out_dir, append_rejects=bad_mode == "a")
+    output_format = files.output_format or output_format
+    try:
+        lines = run_stats.iterate("read", read_lines(source))
+        converted = convert_lines(lines, files.rejects, ascii_input, quiet, cache, run_stats, draw_lines)
+        if deduplicate:
+            converted = dedupe_functions(converted, dedupe.Deduper(dedupe_tolerance, dedupe_stats),
+                                         files.rejects, run_stats)
+        if merge:
+            functions = merge_functions(converted, merge_stats, run_stats, window, cull_stats, draw_lines)
+        elif window is not None:
+            functions = cull_functions(converted, window, cull_stats, run_stats, draw_lines)
+        else:
+            functions = (function for _, function, _ in converted)
+        programs = run_stats.iterate("pack", build_programs(functions, ram_budget, y_vars, stats,
+                                                            optimize, peephole_stats))
+        for count, program in enumerate(programs, 1):
+            write_program(files, count, program, output_format, run_stats)
+    except BaseException:
+        files.abort()
+        raise
+    with run_stats.stage("write"):
+        files.finish()
+    return stats, merge_stats, files
+
+
+def watch(path: str, interval: float = 1.0, cache: Optional[convcache.ConversionCache] = None,
+          show_stats: bool = False, **options) -> None:
+    """Rebuild whenever path changes (polling its size/mtime) until Ctrl+C.
+
+    The cache makes unchanged lines free and the manifest leaves unchanged programs alone,
+    so a small edit only rewrites the programs it lands in. badeqn.txt is rewritten each time.
+    """
+    last = None
+    try:
+        while True:
+            try:
+                stat = os.stat(path)
+                stamp = (stat.st_size, stat.st_mtime_ns)
+            except FileNotFoundError:
+                stamp = None
+            if stamp is not None and stamp != last:
+                last = stamp
+                run_stats = runstats.open_stats(show_stats)
+                with open(path, "r") as source:
+                    stats, merge_stats, files = run(source, cache=cache, bad_mode="w", run_stats=run_stats, **options)
+                if cache:
+                    cache.flush()
+                print(f"[{time.strftime('%H:%M:%S')}] {stats} / {files.stats()}")
+                if show_stats:
+                    print(run_stats.finish().table())
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Convert Desmos LaTeX straight into TI-BASIC program files.")
+    parser.add_argument("input", nargs="?", default="-", help="LaTeX file to read, or - for stdin (default)")
+    parser.add_argument("-o", "--out-dir", default=".", help="where the programs and badeqn.txt go")
+    parser.add_argument("-f", "--format", choices=FORMATS, default="both",
+                        help="write programN.txt (for a TI-BASIC compiler), ready to send programN.8xp, or both")
+    parser.add_argument("--lines", action="store_true",
+                        help="draw straight segments (y=mx+c on a bounded x range) with Line( instead of "
+                             "a Y-var each: no 10 per redraw limit and no evaluating them per pixel column")
+    parser.add_argument("--no-optimize", action="store_true",
+                        help="write the TI-BASIC as is, without peephole.py's token-saving rewrites "
+                             "(.26 for 0.260, pi for 3.1415, X2 for X*2, no closing parens at line ends)")
+    parser.add_argument("--ram-budget", type=int, default=packer.RAM_BUDGET,
+                        help="max bytes of tokens per program (default %(default)s)")
+    parser.add_argument("--y-vars", type=int, default=PROGRAM_SIZE, choices=range(1, PROGRAM_SIZE + 1),
+                        metavar="1-10", help="Y-vars to use per redraw (default %(default)s)")
+    parser.add_argument("--merge", action=argparse.BooleanOptionalAction, default=False,
+                        help="merge collinear/touching segments first (holds the whole input in memory and "
+                             "formats merged equations again; without it the input streams, one program in memory)")
+    parser.add_argument("--no-dedupe", action="store_true",
+                        help="keep equations that draw the same as an earlier one (default: drop them, "
+                             "listed as DUPLICATE in badeqn.txt)")
+    parser.add_argument("--dedupe-tolerance", type=float, default=0.0, metavar="TOL",
+                        help="round numbers to multiples of this when deduping, a grid and not a distance: "
+                             "0.0004 and 0.0006 still differ at 0.001 (default: exact)")
+    parser.add_argument("--window", type=culling.parse_window, metavar="XMIN,XMAX,YMIN,YMAX",
+                        help="drop equations this graph window doesn't show and clip the rest to it "
+                             "(\"standard\" for ZStandard; default: keep everything)")
+    parser.add_argument("--bundle", type=sinks.bundle, metavar="PATH",
+                        help="write all programs into one .zip/.tar[.gz|.xz] (badeqn.txt goes in too) "
+                             "or .txt file, or - for stdout (default: programN.txt/.8xp files in --out-dir)")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and rebuild the programs that changed whenever the input file changes")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between --watch checks")
+    parser.add_argument("--ascii", action="store_true", help="input is already ASCII (like input.txt)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="don't print every equation")
+    parser.add_argument("--no-cache", action="store_true", help=f"don't read or write {convcache.DEFAULT_PATH}")
+    parser.add_argument("--clear-cache", action="store_true", help="empty the cache before converting")
+    parser.add_argument("--cache-size", type=int, default=convcache.DEFAULT_MAX_ENTRIES,
+                        help="max cached lines before the least recently used get dropped")
+    parser.add_argument("--stats", action="store_true",
+                        help="print time per stage, lines/s, reject reasons, cache hits and peak memory")
+    parser.add_argument("--stats-json", metavar="PATH", help="write the --stats numbers to PATH as JSON")
+    parser.add_argument("--profile", metavar="PATH", help="run under cProfile and dump the profile to PATH")
+    args = parser.parse_args(argv)
+
+    cache = convcache.open_cache(args.no_cache, args.clear_cache, max_entries=args.cache_size)
+    # with the programs on stdout everything else goes to stderr
+    out = sys.stderr if args.bundle == "-" else sys.stdout
+    options = dict(out_dir=args.out_dir, ascii_input=args.ascii, quiet=args.quiet or out is sys.stderr,
+                   output_format=args.format, ram_budget=args.ram_budget, y_vars=args.y_vars,
+                   merge=args.merge, window=args.window, bundle=args.bundle,
+                   deduplicate=not args.no_dedupe, dedupe_tolerance=args.dedupe_tolerance, draw_lines=args.lines,
+                   optimize=not args.no_optimize)
+    if args.watch:
+        if args.input == "-":
+            parser.error("--watch needs an input file")
+        try:
+            watch(args.input, args.interval, cache, args.stats, **options)
+        finally:
+            if cache:
+                cache.close()
+        return
+
+    run_stats = runstats.open_stats(args.stats or bool(args.stats_json))
+    cull_stats = culling.CullStats() if args.window else None
+    dedupe_stats = None if args.no_dedupe else dedupe.DedupeStats()
+    peephole_stats = None if args.no_optimize else peephole.PeepholeStats()
+    source = sys.stdin if args.input == "-" else open(args.input, "r")
+    try:
+        stats, merge_stats, files = runstats.profiled(args.profile, run, source, cache=cache,
+                                                      run_stats=run_stats, cull_stats=cull_stats,
+                                                      dedupe_stats=dedupe_stats, peephole_stats=peephole_stats,
+                                                      **options)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if cache:
+            cache.close()
+    if cache:
+        print(cache.stats(), file=out)
+    if dedupe_stats:
+        print(dedupe_stats, file=out)
+    if merge_stats:
+        print(merge_stats, file=out)
+    if cull_stats:
+        print(cull_stats, file=out)
+    if peephole_stats:
+        print(peephole_stats, file=out)
+    print(stats, file=out)
+    print(files.stats(), file=out)
+    if run_stats.enabled:
+        run_stats.finish(cache).report(args.stats, args.stats_json, out)
+    print(f"Done. Created {stats.programs} files.", file=out)
+
+if __name__ == "__main__":
+    main()
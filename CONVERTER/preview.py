@@ -0,0 +1,252 @@
+"""Preview of what the calculator will draw, as braille in the terminal.
+
+Every equation is evaluated at the 265 pixel columns of the TI-84 Plus CE graph
+screen (265x165) with NumPy: lines (most of a tracing) all at once as one
+slopes * x + intercepts broadcast, anything else one vectorized expression at a
+time, both masked by their restrictions. Like the calculator in connected mode,
+consecutive points are joined with vertical runs, and every pixel remembers the
+last equation drawn over it, since later equations end up on top.
+
+That pixel -> equation grid doesn't depend on colors, so assigning a color only
+recolors the braille cells (2x4 pixels each) showing that equation.
+
+    graph = GraphPreview(equations)
+    text = graph.render(color_of)      # rich Text, 133x42 braille cells
+    text = graph.render(color_of, [5])  # after equation 5 changed color
+"""
+import re
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from rich.text import Text
+
+import colorrules
+import exprparse
+import segments
+from exprparse import BinOp, Call, Compare, Const, Neg, Num, Var
+
+WIDTH, HEIGHT = 265, 165
+# ZStandard, which is what the programs draw on unless the window gets changed
+WINDOW = (-10.0, 10.0, -10.0, 10.0)
+# equations rasterized together; a chunk is CHUNK x WIDTH floats
+CHUNK = 2048
+
+# dot bits of a braille cell by (row, column), U+2800 is the empty cell
+DOTS = np.array([[0x01, 0x08], [0x02, 0x10], [0x04, 0x20], [0x40, 0x80]])
+
+# GraphColor colors as they look on the CE, also by number (10 = BLUE ... 24 = DARKGRAY)
+COLORS = dict(colorrules.GRAPH_COLORS)
+COLORS.update({str(number): color for number, color in enumerate(list(COLORS.values()), 10)})
+BACKGROUND = "#ffffff"
+
+# "0.26<=x<=0.4", by far the most common restriction, read without the parser
+_NUMBER = r'(-?(?:\d+\.?\d*|\.\d+))'
+SIMPLE_INTERVAL = re.compile(rf'\s*{_NUMBER}\s*(<=?)\s*x\s*(<=?)\s*{_NUMBER}\s*$', re.IGNORECASE)
+
+UFUNCS = {
+    "sin": np.sin, "cos": np.cos, "tan": np.tan, "arcsin": np.arcsin, "arccos": np.arccos, "arctan": np.arctan,
+    "sinh": np.sinh, "cosh": np.cosh, "tanh": np.tanh, "ln": np.log, "log": np.log10, "exp": np.exp,
+    "sqrt": np.sqrt, "abs": np.abs,
+}
+BINARY = {"+": np.add, "-": np.subtract, "*": np.multiply, "/": np.divide, "^": np.power}
+COMPARE = {"<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal,
+           "=": np.isclose, "!=": lambda a, b: ~np.isclose(a, b)}
+
+
+def evaluate(node, x: np.ndarray, y: Optional[np.ndarray] = None) -> np.ndarray:
+    """Value of an exprparse tree at every x (NaN where it's undefined). Variables other than X/Y are NaN."""
+    if isinstance(node, Num):
+        return np.full_like(x, node.value)
+    if isinstance(node, Var):
+        if node.name == "X":
+            return x
+        if node.name == "Y" and y is not None:
+            return y
+        return np.full_like(x, np.nan)
+    if isinstance(node, Const):
+        return np.full_like(x, exprparse.CONSTANTS[node.name])
+    if isinstance(node, Neg):
+        return -evaluate(node.operand, x, y)
+    if isinstance(node, BinOp):
+        return BINARY[node.op](evaluate(node.left, x, y), evaluate(node.right, x, y))
+    if isinstance(node, Call):
+        args = [evaluate(arg, x, y) for arg in node.args]
+        if node.func == "min":
+            return np.minimum.reduce(args)
+        if node.func == "max":
+            return np.maximum.reduce(args)
+        return UFUNCS[node.func](args[0])
+    raise TypeError(f"can't evaluate {node!r}")
+
+
+def condition_mask(conditions: Sequence[Compare], x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Where all conditions hold; y in a condition is the equation's value, like in Desmos."""
+    mask = np.ones(x.shape, dtype=bool)
+    for condition in conditions:
+        mask &= COMPARE[condition.op](evaluate(condition.left, x, y), evaluate(condition.right, x, y))
+    return mask
+
+
+class GraphPreview:
+    """Pixel -> equation grid of a list of (expression, constraints), rendered as colored braille."""
+
+    def __init__(self, equations: Sequence[Tuple[str, str]], window: Tuple[float, float, float, float] = WINDOW,
+                 width: int = WIDTH, height: int = HEIGHT) -> None:
+        self.equations = equations
+        self.window = window
+        self.width, self.height = width, height
+        xmin, xmax, _, _ = window
+        self.x = np.linspace(xmin, xmax, width)
+        # index of the equation drawn last on each pixel, -1 = nothing
+        self.owner = np.full(height * width, -1, dtype=np.int64)
+        self._cells: Optional[np.ndarray] = None
+        self._bits: Optional[np.ndarray] = None
+        self._rows: List[Optional[Text]] = []
+
+    def draw(self) -> None:
+        """Evaluate and rasterize every equation (the slow part, run it off the UI thread)."""
+        for start in range(0, len(self.equations), CHUNK):
+            values, mask = self._evaluate(range(start, min(start + CHUNK, len(self.equations))))
+            self._rasterize(start, values, mask)
+        self._build_cells()
+
+    def _evaluate(self, indexes: range) -> Tuple[np.ndarray, np.ndarray]:
+        """Values and draw masks of the equations in indexes, as len(indexes) x width arrays."""
+        count = len(indexes)
+        x = self.x
+        values = np.empty((count, self.width))
+        mask = np.ones((count, self.width), dtype=bool)
+        slopes, intercepts = np.zeros(count), np.zeros(count)
+        linear = np.zeros(count, dtype=bool)
+        lo, hi = np.full(count, -np.inf), np.full(count, np.inf)
+        lo_strict, hi_strict = np.zeros(count, dtype=bool), np.zeros(count, dtype=bool)
+        # tracings repeat the same expression over and over, parse each one once
+        trees: Dict[str, object] = {}
+        with np.errstate(all="ignore"):
+            for row, index in enumerate(indexes):
+                expr, constraints = self.equations[index]
+                try:
+                    if (tree := trees.get(expr)) is None:
+                        tree = trees[expr] = exprparse.simplify(exprparse.parse_expression(expr))
+                    if simple := SIMPLE_INTERVAL.match(constraints):
+                        conditions = None
+                        lo[row], hi[row] = float(simple[1]), float(simple[4])
+                        lo_strict[row], hi_strict[row] = simple[2] == "<", simple[3] == "<"
+                    else:
+                        conditions = exprparse.simplify_conditions(exprparse.parse_conditions(constraints))
+                except exprparse.ParseError:
+                    mask[row] = False
+                    continue
+                line = exprparse.linear(tree)
+                if line is not None:
+                    linear[row] = True
+                    slopes[row], intercepts[row] = line
+                else:
+                    values[row] = evaluate(tree, x)
+                if conditions is None:
+                    continue
+                bounds = segments.interval(conditions)
+                if bounds is not None:
+                    lo[row], lo_strict[row], hi[row], hi_strict[row] = bounds[0], bounds[2], bounds[3], bounds[5]
+                elif conditions:
+                    y = slopes[row] * x + intercepts[row] if linear[row] else values[row]
+                    mask[row] = condition_mask(conditions, x, y)
+            values[linear] = slopes[linear, None] * x + intercepts[linear, None]
+            mask &= np.where(lo_strict[:, None], x > lo[:, None], x >= lo[:, None])
+            mask &= np.where(hi_strict[:, None], x < hi[:, None], x <= hi[:, None])
+        return values, mask
+
+    def _rasterize(self, first: int, values: np.ndarray, mask: np.ndarray) -> None:
+        _, _, ymin, ymax = self.window
+        height, width = self.height, self.width
+        with np.errstate(all="ignore"):
+            rows = (ymax - values) / (ymax - ymin) * (height - 1)
+        valid = mask & np.isfinite(rows)
+        # far off-screen values only need to stay off-screen
+        rows = np.clip(np.where(valid, rows, 0), -2, height + 1)
+        lo = hi = np.rint(rows)
+        # connected mode: each column also reaches halfway to its drawn neighbours
+        pair = valid[:, :-1] & valid[:, 1:]
+        middle = np.rint((rows[:, :-1] + rows[:, 1:]) / 2)
+        lo, hi = lo.copy(), hi.copy()
+        lo[:, :-1] = np.where(pair, np.minimum(lo[:, :-1], middle), lo[:, :-1])
+        hi[:, :-1] = np.where(pair, np.maximum(hi[:, :-1], middle), hi[:, :-1])
+        lo[:, 1:] = np.where(pair, np.minimum(lo[:, 1:], middle), lo[:, 1:])
+        hi[:, 1:] = np.where(pair, np.maximum(hi[:, 1:], middle), hi[:, 1:])
+        visible = valid & (hi >= 0) & (lo <= height - 1)
+        equation, column = np.nonzero(visible)
+        if not len(equation):
+            return
+        lo = np.clip(lo[visible], 0, height - 1).astype(np.int64)
+        hi = np.clip(hi[visible], 0, height - 1).astype(np.int64)
+        lengths = hi - lo + 1
+        starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        pixel_rows = np.repeat(lo, lengths) + np.arange(lengths.sum()) - starts
+        pixels = pixel_rows * width + np.repeat(column, lengths)
+        np.maximum.at(self.owner, pixels, np.repeat(equation + first, lengths))
+
+    def _build_cells(self) -> None:
+        """Group pixels into braille cells: which dots are set, and the equation on top in each."""
+        cell_rows, cell_columns = -(-self.height // 4), -(-self.width // 2)
+        grid = np.full((cell_rows * 4, cell_columns * 2), -1, dtype=np.int64)
+        grid[:self.height, :self.width] = self.owner.reshape(self.height, self.width)
+        cells = grid.reshape(cell_rows, 4, cell_columns, 2).transpose(0, 2, 1, 3)
+        self._bits = ((cells >= 0) * DOTS).sum(axis=(2, 3))
+        self._cells = cells.max(axis=(2, 3))
+        self._rows = [None] * cell_rows
+
+    def render(self, color_of: Callable[[int], str], changed: Optional[Iterable[int]] = None) -> Text:
+        """The braille picture. With changed (equations whose color changed) only their cells are redone."""
+        if self._cells is None:
+            raise RuntimeError("draw() first")
+        if changed is not None:
+            changed = np.fromiter(changed, dtype=np.int64)
+            for row in np.nonzero(np.isin(self._cells, changed).any(axis=1))[0]:
+                self._rows[row] = None
+        colors: Dict[int, str] = {}
+        for row, cached in enumerate(self._rows):
+            if cached is None:
+                self._rows[row] = self._render_row(row, color_of, colors)
+        return Text("\n").join(self._rows)
+
+    def _render_row(self, row: int, color_of: Callable[[int], str], colors: Dict[int, str]) -> Text:
+        text = Text(style=f"on {BACKGROUND}")
+        run, run_style = [], None
+        for bits, owner in zip(self._bits[row].tolist(), self._cells[row].tolist()):
+            if owner < 0:
+                style = None
+            else:
+                if owner not in colors:
+                    colors[owner] = COLORS.get(color_of(owner).upper(), COLORS["BLACK"])
+                style = colors[owner]
+            if style != run_style and run:
+                text.append("".join(run), run_style)
+                run = []
+            run.append(chr(0x2800 + bits) if bits else " ")
+            run_style = style
+        if run:
+            text.append("".join(run), run_style)
+        return text
+
+
+if __name__ == "__main__":
+    # python preview.py [input.txt]: draw it in the terminal and time it
+    import sys
+    import time
+    from rich.console import Console
+
+    from core import EquationProcessor
+
+    with open(sys.argv[1] if len(sys.argv) > 1 else "input.txt") as f:
+        equations = [equation for equation in map(EquationProcessor.parse_line, f) if equation]
+    start = time.perf_counter()
+    graph = GraphPreview(equations)
+    graph.draw()
+    drawn = time.perf_counter()
+    picture = graph.render(lambda index: "BLACK")
+    rendered = time.perf_counter()
+    graph.render(lambda index: "RED", range(0, len(equations), 2))
+    recolored = time.perf_counter()
+    Console().print(picture)
+    print(f"{len(equations)} equations: draw {drawn - start:.3f}s, render {rendered - drawn:.3f}s, "
+          f"recolor half {recolored - rendered:.3f}s")
@@ -0,0 +1,171 @@
+"""Merging of equal and collinear segments before they become programs.
+
+Desmos tracings are thousands of short pieces like "-2x+1.3 {0.26<=x<=0.4}",
+and plenty of them continue each other. Every equation is keyed by what it draws
+(slope and intercept for lines, the simplified expression otherwise) and its
+restriction is turned into an x interval. Within each key the intervals are
+sorted by their start and swept once, merging the ones that overlap or touch,
+so this is O(n log n) instead of comparing every pair.
+
+Only restrictions that are plain bounds on x (0<=x<=1, x>2, none at all) can
+be merged, anything else (y>0, x^2<1, ...) is passed through untouched.
+Only pieces with no equation of another group (color) added between them get
+merged, and the result takes the place of its first piece: nothing of another
+color ends up drawn under a piece it used to be drawn over, so draw order is kept.
+"""
+import math
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import exprparse
+from exprparse import Compare, Num, Var
+
+# slopes/intercepts this close count as the same line, gaps this small as touching
+TOLERANCE = 1e-6
+
+Equation = Tuple[str, str]
+
+
+@dataclass
+class MergeStats:
+    before: int = 0
+    after: int = 0
+
+    def __str__(self) -> str:
+        removed = self.before - self.after
+        percent = 100 * removed / self.before if self.before else 0.0
+        return f"MERGED: {self.before} -> {self.after} equations ({removed} fewer, {percent:.1f}%)"
+
+
+@dataclass
+class _Segment:
+    index: int  # position of the first piece, for keeping the draw order
+    expr: str
+    lo: float
+    lo_text: Optional[str]  # None = unbounded
+    lo_strict: bool
+    hi: float
+    hi_text: Optional[str]
+    hi_strict: bool
+
+
+def interval(conditions: List[Compare]):
+    """(lo, lo_text, lo_strict, hi, hi_text, hi_strict) for conditions that only bound x, else None."""
+    lo, lo_text, lo_strict = -math.inf, None, False
+    hi, hi_text, hi_strict = math.inf, None, False
+    for condition in conditions:
+        op, left, right = condition.op, condition.left, condition.right
+        if isinstance(right, Var) and isinstance(left, Num):
+            op, left, right = exprparse.FLIPPED[op], right, left  # 1<x -> x>1
+        if not (isinstance(left, Var) and left.name == "X" and isinstance(right, Num)):
+            return None
+        if op in (">", ">="):
+            if right.value > lo or (right.value == lo and op == ">"):
+                lo, lo_text, lo_strict = right.value, right.text, op == ">"
+        elif op in ("<", "<="):
+            if right.value < hi or (right.value == hi and op == "<"):
+                hi, hi_text, hi_strict = right.value, right.text, op == "<"
+        else:
+            return None
+    return lo, lo_text, lo_strict, hi, hi_text, hi_strict
+
+
+def _key(tree: exprparse.Node) -> Hashable:
+    line = exprparse.linear(tree)
+    if line is not None:
+        return "line", round(line[0] / TOLERANCE), round(line[1] / TOLERANCE)
+    return "expr", exprparse.emit(tree)
+
+
+def constraints_text(lo_text: Optional[str], lo_strict: bool, hi_text: Optional[str], hi_strict: bool) -> str:
+    """The restriction for an x interval ("0.2<=x<1", "3<x", "" when unbounded), the reverse of interval()."""
+    parts = []
+    if lo_text is not None:
+        parts.append(f"{lo_text}{'<' if lo_strict else '<='}")
+    parts.append("x")
+    if hi_text is not None:
+        parts.append(f"{'<' if hi_strict else '<='}{hi_text}")
+    return "".join(parts) if len(parts) > 1 else ""
+
+
+def _constraints(segment: _Segment) -> str:
+    return constraints_text(segment.lo_text, segment.lo_strict, segment.hi_text, segment.hi_strict)
+
+
+def merge_equations(equations: List[Equation], stats: Optional[MergeStats] = None) -> List[Equation]:
+    """Merge equations that draw the same thing on overlapping/touching x ranges."""
+    return [equation for _, equation in merge_indexed(equations, stats)]
+
+
+def merge_indexed(equations: Sequence[Equation], stats: Optional[MergeStats] = None,
+                  groups: Optional[Sequence[Hashable]] = None) -> List[Tuple[int, Equation]]:
+    """merge_equations(), with the index of every result's first piece (for whatever else belongs to it).
+
+    Only equations with equal groups[i] (their colors, say) and no other group between them get merged.
+    """
+    merger = Merger()
+    for index, equation in enumerate(equations):
+        merger.add(index, equation, group=None if groups is None else groups[index])
+    return merger.merged(stats)
+
+
+class Merger:
+    """merge_indexed() an equation at a time, for equations that are parsed already: add() them, then merged().
+
+    add() takes the equation's simplified (expression tree, conditions) when there are
+    some (EquationProcessor.parse plus exprparse.simplify), so nothing gets parsed twice.
+    Equations have to be added in draw order: a run of equal groups ends at the first
+    equation of another group, and pieces of different runs don't get merged.
+    """
+
+    def __init__(self) -> None:
+        self._keyed: Dict[Hashable, List[_Segment]] = {}
+        self._kept: List[Tuple[int, Equation]] = []
+        self._count = 0
+        self._group: Hashable = None
+        self._run = 0  # how many times the group changed
+
+    def add(self, index: int, equation: Equation,
+            simplified: Optional[Tuple[exprparse.Node, List[Compare]]] = None, group: Hashable = None) -> None:
+        """Add the equation at index; only equations of equal groups (their colors, say) in one run get merged."""
+        expr, constraints = equation
+        if simplified is None:
+            tree, conditions = None, exprparse.simplify_conditions(exprparse.parse_conditions(constraints))
+        else:
+            tree, conditions = simplified
+        if self._count and group != self._group:
+            self._run += 1
+        self._group = group
+        self._count += 1
+        bounds = interval(conditions)
+        if bounds is None:
+            self._kept.append((index, equation))
+            return
+        if tree is None:
+            tree = exprparse.simplify(exprparse.parse_expression(expr))
+        self._keyed.setdefault((_key(tree), group, self._run), []).append(_Segment(index, expr, *bounds))
+
+    def merged(self, stats: Optional[MergeStats] = None) -> List[Tuple[int, Equation]]:
+        """(index of the first piece, equation) of everything added, merged, in the order of the indexes."""
+        kept = self._kept
+        for segments in self._keyed.values():
+            segments.sort(key=lambda s: (s.lo, s.lo_strict))
+            current = segments[0]
+            for segment in segments[1:]:
+                if segment.lo <= current.hi + TOLERANCE:
+                    if segment.hi > current.hi or (segment.hi == current.hi and not segment.hi_strict):
+                        current.hi, current.hi_text, current.hi_strict = segment.hi, segment.hi_text, segment.hi_strict
+                    if segment.index < current.index:
+                        current.index, current.expr = segment.index, segment.expr
+                    continue
+                kept.append((current.index, (current.expr, _constraints(current))))
+                current = segment
+            kept.append((current.index, (current.expr, _constraints(current))))
+        self._keyed, self._kept = {}, []
+
+        kept.sort(key=lambda item: item[0])
+        if stats is not None:
+            stats.before += self._count
+            stats.after += len(kept)
+        self._count = self._run = 0
+        return kept
@@ -0,0 +1,230 @@
+"""Where the generated programs go: a folder (manifest.Manifest), one archive, one text file or stdout.
+
+Every sink has the Manifest interface (write(filename, data), finish(), abort(),
+stats(), written) plus a reject stream for the lines that didn't convert. Nothing
+replaces an existing output until finish(): archives and the concatenated file
+are built under a temporary name next to the target and renamed over it in one
+go, so an interrupted run never leaves half a bundle or a mix of old and new
+programs. One open file per run instead of one per program, which is what
+matters on network filesystems.
+
+    --bundle programs.zip      programN.txt/.8xp and badeqn.txt in a zip
+    --bundle programs.tar.gz   same as a tar (.tar, .tar.gz/.tgz, .tar.xz)
+    --bundle programs.txt      every programN.txt one after another, under "# programN.txt" lines
+    --bundle -                 that text on stdout, rejects on stderr
+
+Rejected lines are written as "CODE<tab>line" (NOT_Y, BAD_EXPR, BAD_RESTRICTION,
+see core.REJECT_CODES) through a buffer instead of reopening badeqn.txt per line.
+"""
+import io
+import os
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+from collections import Counter
+from typing import BinaryIO, Optional, TextIO
+
+import manifest
+
+REJECTS_NAME = "badeqn.txt"
+# bytes buffered before the reject stream touches the disk
+BUFFER = 1 << 16
+TAR_MODES = {".tar": "w", ".tar.gz": "w:gz", ".tgz": "w:gz", ".tar.xz": "w:xz"}
+# mkstemp makes files only the owner can read; what replaces an output should get the usual permissions
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def temp_path(path: str) -> str:
+    """A new temporary file next to path (same filesystem, so os.replace is atomic)."""
+    fd, temp = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp",
+                                dir=os.path.dirname(path) or ".")
+    os.close(fd)
+    os.chmod(temp, 0o666 & ~_UMASK)
+    return temp
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    temp = temp_path(path)
+    try:
+        with open(temp, "wb") as f:
+            f.write(data)
+        os.replace(temp, path)
+    except BaseException:
+        os.remove(temp)
+        raise
+
+
+class RejectStream:
+    """Rejected lines with a reason code, buffered.
+
+    With a path the lines go into a temporary file that replaces path on close()
+    (appending copies what's there first); without one they're kept in memory for
+    an archive, or written to stream (stderr for --bundle -).
+    """
+
+    def __init__(self, path: Optional[str] = None, append: bool = True, stream: Optional[TextIO] = None) -> None:
+        self.path = path
+        self.append = append
+        self.count = 0
+        self.codes: Counter = Counter()
+        self._temp: Optional[str] = None
+        self._file: Optional[TextIO] = None  # opened on the first reject
+        if path is None:
+            self._file = stream if stream is not None else io.StringIO()
+
+    def write(self, line: str, code: str) -> None:
+        if self._file is None:
+            self._open()
+        self._file.write(f"{code}\t{line}\n")
+        self.count += 1
+        self.codes[code] += 1
+
+    def _open(self) -> None:
+        self._temp = temp_path(self.path)
+        if self.append and os.path.exists(self.path):
+            with open(self.path, "rb") as old, open(self._temp, "wb") as new:
+                while chunk := old.read(BUFFER):
+                    new.write(chunk)
+        self._file = open(self._temp, "a", buffering=BUFFER)
+
+    def getvalue(self) -> str:
+        """What was written, for the in-memory stream."""
+        return self._file.getvalue() if isinstance(self._file, io.StringIO) else ""
+
+    def close(self) -> None:
+        if self.path is None:
+            if self._file is not None and not isinstance(self._file, io.StringIO):
+                self._file.flush()
+            return
+        if self._temp is not None:
+            self._file.close()
+            os.replace(self._temp, self.path)
+            self._temp = self._file = None
+        elif not self.append and os.path.exists(self.path):
+            atomic_write(self.path, b"")  # a fresh run with no rejects leaves an empty badeqn.txt like before
+
+    def abort(self) -> None:
+        if self._temp is not None:
+            self._file.close()
+            os.remove(self._temp)
+            self._temp = self._file = None
+
+
+class ArchiveSink:
+    """All files in one zip or tar, renamed into place by finish()."""
+
+    output_format = None
+
+    def __init__(self, path: str, kind: str) -> None:
+        self.path = path
+        self.kind = kind  # "zip" or a tarfile mode
+        self.written = 0
+        self.rejects = RejectStream()
+        self._temp = temp_path(path)
+        if kind == "zip":
+            self._archive = zipfile.ZipFile(self._temp, "w", zipfile.ZIP_DEFLATED)
+        else:
+            self._archive = tarfile.open(self._temp, kind)
+
+    def _add(self, filename: str, data: bytes) -> None:
+        if self.kind == "zip":
+            self._archive.writestr(filename, data)
+        else:
+            info = tarfile.TarInfo(filename)
+            info.size, info.mtime = len(data), int(time.time())
+            self._archive.addfile(info, io.BytesIO(data))
+
+    def write(self, filename: str, data: bytes) -> bool:
+        self._add(filename, data)
+        self.written += 1
+        return True
+
+    def finish(self) -> None:
+        if self.rejects.count:
+            self._add(REJECTS_NAME, self.rejects.getvalue().encode())
+        self._archive.close()
+        os.replace(self._temp, self.path)
+
+    def abort(self) -> None:
+        self._archive.close()
+        os.remove(self._temp)
+
+    def stats(self) -> str:
+        return f"FILES: {self.written} written to {self.path}"
+
+
+class ConcatSink:
+    """Every program's text in one file (or stream), each under a "# programN.txt" line."""
+
+    output_format = "txt"
+
+    def __init__(self, path: Optional[str] = None, stream: Optional[TextIO] = None,
+                 append_rejects: bool = True) -> None:
+        self.path = path
+        self.written = 0
+        if path is None:
+            self._temp = None
+            self._file: BinaryIO = (stream or sys.stdout).buffer
+            self.rejects = RejectStream(stream=sys.stderr)
+        else:
+            self._temp = temp_path(path)
+            self._file = open(self._temp, "wb", buffering=BUFFER)
+            self.rejects = RejectStream(os.path.join(os.path.dirname(path), REJECTS_NAME), append_rejects)
+
+    def write(self, filename: str, data: bytes) -> bool:
+        self._file.write(f"# {filename}\n".encode() + data + b"\n")
+        self.written += 1
+        return True
+
+    def finish(self) -> None:
+        self.rejects.close()
+        if self._temp is None:
+            self._file.flush()
+            return
+        self._file.close()
+        os.replace(self._temp, self.path)
+
+    def abort(self) -> None:
+        self.rejects.abort()
+        if self._temp is not None:
+            self._file.close()
+            os.remove(self._temp)
+
+    def stats(self) -> str:
+        return f"FILES: {self.written} programs written to {self.path or 'stdout'}"
+
+
+def _kind(name: str) -> str:
+    """"stdout", "zip", a tarfile mode or "txt" for a --bundle name. Raises ValueError."""
+    if name == "-":
+        return "stdout"
+    lower = name.lower()
+    if lower.endswith(".zip"):
+        return "zip"
+    for extension, mode in TAR_MODES.items():
+        if lower.endswith(extension):
+            return mode
+    if lower.endswith(".txt"):
+        return "txt"
+    raise ValueError(f"can't tell what kind of bundle {name!r} is (.zip, .tar[.gz|.xz], .tgz, .txt or -)")
+
+
+def bundle(text: str) -> str:
+    """--bundle's argparse type, so a bad name fails before any work is done."""
+    _kind(text)
+    return text
+
+
+def open_sink(bundle: Optional[str] = None, out_dir: str = ".", append_rejects: bool = True):
+    """The sink for --bundle (see the top of this file), or a manifest.Manifest for out_dir without one."""
+    if bundle is None:
+        return manifest.Manifest(out_dir, append_rejects=append_rejects)
+    kind = _kind(bundle)
+    if kind == "stdout":
+        return ConcatSink()
+    if kind == "txt":
+        return ConcatSink(bundle, append_rejects=append_rejects)
+    return ArchiveSink(bundle, kind)
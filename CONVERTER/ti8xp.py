@@ -0,0 +1,121 @@
+""".8xp writer: tokenizes the TI-BASIC text CONVERTERv3 emits and wraps it in a program file.
+
+Only knows the tokens our programs use (piecewise(, ->, GraphColor(, Line(, the colors,
+DelVar, RecallPic, ... plus numbers, letters and the math exprparse.py writes),
+anything else raises TokenizeError instead of ending up as garbage on the calculator.
+Text is matched longest token first, like the TI-BASIC compilers do, so "Y0" is the
+Y0 equation variable and "e^(" is one token, not e, ^, (.
+
+    data = program_bytes("EQ1", 'piecewise(X,0<=X)->Y0\\nDispGraph')
+    open("program1.8xp", "wb").write(data)
+
+Run this file (or check_golden(), bench.py does) to check the writer against the
+golden files in golden/; it exits with 1 if one doesn't match.
+"""
+import os
+import re
+import struct
+from typing import Dict
+
+# text -> token bytes (TI-83 Plus / TI-84 Plus CE token sheet)
+TOKENS: Dict[str, bytes] = {
+    # program structure
+    "\n": b"\x3f", "->": b"\x04", '"': b"\x2a", ",": b"\x2b", "(": b"\x10", ")": b"\x11", " ": b"\x29",
+    "DispGraph": b"\xdf", "ClrDraw": b"\x85", "RecallPic ": b"\x99", "StorePic ": b"\x98",
+    "DelVar ": b"\xbb\x54", "GraphColor(": b"\xef\x65", "piecewise(": b"\xef\xa6",
+    "Line(": b"\x9c",
+    # comparisons and logic
+    "=": b"\x6a", "<": b"\x6b", ">": b"\x6c", "<=": b"\x6d", ">=": b"\x6e", "!=": b"\x6f",
+    " and ": b"\x40", " or ": b"\x3c",
+    # arithmetic
+    "+": b"\x70", "-": b"\x71", "*": b"\x82", "/": b"\x83", "^": b"\xf0", ".": b"\x3a",
+    # functions
+    "sqrt(": b"\xbc", "abs(": b"\xb2", "ln(": b"\xbe", "e^(": b"\xbf", "log(": b"\xc0", "10^(": b"\xc1",
+    "sin(": b"\xc2", "sin^-1(": b"\xc3", "cos(": b"\xc4", "cos^-1(": b"\xc5", "tan(": b"\xc6", "tan^-1(": b"\xc7",
+    "sinh(": b"\xc8", "cosh(": b"\xca", "tanh(": b"\xcc", "min(": b"\x1a", "max(": b"\x19",
+    # constants
+    "pi": b"\xac", "e": b"\xbb\x31",
+    # colors
+    "BLUE": b"\xef\x41", "RED": b"\xef\x42", "BLACK": b"\xef\x43", "MAGENTA": b"\xef\x44",
+    "GREEN": b"\xef\x45", "ORANGE": b"\xef\x46", "BROWN": b"\xef\x47", "NAVY": b"\xef\x48",
+    "LTBLUE": b"\xef\x49", "YELLOW": b"\xef\x4a", "WHITE": b"\xef\x4b", "LTGRAY": b"\xef\x4c",
+    "MEDGRAY": b"\xef\x4d", "GRAY": b"\xef\x4e", "DARKGRAY": b"\xef\x4f",
+    # Y1..Y9, Y0 equation variables
+    **{f"Y{k}": bytes([0x5e, 0x10 + (k - 1) % 10]) for k in range(10)},
+    # digits and upper case letters are their own ASCII codes
+    **{c: c.encode() for c in "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"},
+}
+
+_TOKEN_PATTERN = re.compile("|".join(re.escape(text) for text in sorted(TOKENS, key=len, reverse=True)) + "|(.)",
+                            re.DOTALL)
+
+SIGNATURE = b"**TI83F*\x1a\x0a\x00"
+COMMENT = "Created by MATHAA"
+PROGRAM_TYPE = 0x05
+NAME_PATTERN = re.compile(r'[A-Z][A-Z0-9]{0,7}')
+
+# entry version byte = oldest OS that has every token used: piecewise( needs the CE's OS 5.3,
+# GraphColor( and the colors the 84+CSE's OS 4.0, the rest are all there since the 83+
+VERSIONS = [(b"\xef\xa6", 0x0C), (b"\xef", 0x0A)]
+# .txt programs and the .8xp files they have to tokenize to, for check_golden()
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+
+
+class TokenizeError(ValueError):
+    """The program text has something we don't have a token for."""
+
+
+def tokenize(text: str) -> bytes:
+    """Turn TI-BASIC text into token bytes."""
+    out = []
+    for match in _TOKEN_PATTERN.finditer(text):
+        if match.group(1) is not None:
+            raise TokenizeError(f"no token for {match.group(1)!r} at {match.start()} in {text[:40]!r}")
+        out.append(TOKENS[match.group()])
+    return b"".join(out)
+
+
+def version(tokens: bytes) -> int:
+    # only the EF page tokens (first byte 0xEF) need a newer OS, and 0xEF is never a second byte in TOKENS
+    for marker, value in VERSIONS:
+        if marker in tokens:
+            return value
+    return 0x00
+
+
+def program_file(name: str, tokens: bytes, comment: str = COMMENT, archived: bool = False) -> bytes:
+    """Wrap token bytes in an .8xp: file header, one variable entry, checksum of the entry."""
+    if not NAME_PATTERN.fullmatch(name):
+        raise ValueError(f"program name must be 1-8 of A-Z/0-9 starting with a letter: {name!r}")
+    data = struct.pack("<H", len(tokens)) + tokens
+    entry = struct.pack("<HHB8sBBH", 0x0D, len(data), PROGRAM_TYPE, name.encode(),
+                        version(tokens), 0x80 if archived else 0, len(data)) + data
+    header = SIGNATURE + comment.encode("ascii")[:42].ljust(42, b"\0") + struct.pack("<H", len(entry))
+    return header + entry + struct.pack("<H", sum(entry) & 0xFFFF)
+
+
+def program_bytes(name: str, text: str) -> bytes:
+    """.8xp file contents for a program called name with the given TI-BASIC text."""
+    return program_file(name, tokenize(text))
+
+
+def check_golden(golden: str = GOLDEN_DIR) -> Dict[str, bool]:
+    """{name: whether it matches} for every name.txt in golden, tokenized against its name.8xp."""
+    results = {}
+    for file in sorted(os.listdir(golden)):
+        if not file.endswith(".txt"):
+            continue
+        stem = file[:-4]
+        with open(os.path.join(golden, file)) as f:
+            text = f.read()
+        with open(os.path.join(golden, stem + ".8xp"), "rb") as f:
+            expected = f.read()
+        results[stem] = program_bytes(stem.upper(), text) == expected
+    return results
+
+
+if __name__ == "__main__":
+    results = check_golden()
+    for stem, ok in results.items():
+        print(f"{'ok  ' if ok else 'FAIL'} {stem}")
+    raise SystemExit(0 if all(results.values()) else 1)
@@ -1,5 +1,8 @@
 import re
-from pylatexenc.latex2text import LatexNodes2Text
+import convcache
+import fastlatex
+import runstats
+import textrules
 
 # Map of Unicode math symbols to ASCII equivalents
 unicode_to_ascii = {
@@ -9,7 +12,7 @@ unicode_to_ascii = {
     '≈': '~=',
     '→': '->',
     '∞': 'infinity',
-    'π': '3.1415',
+    'π': 'pi',  # the calculator's pi token, not 3.1415
     '∑': 'sum',
     '−': '-',   # minus (U+2212) to hyphen-minus
     '×': '*',
@@ -33,21 +36,167 @@ def remove_extra_spaces(text):
     text = re.sub(r'(?<=\\)(\s+)', '', text)  # Remove spaces after a backslash
     return text
 
-f = open("expressions.txt", "r")
-out = open("output.txt", "w")
-
-for x in f:
-    x = x.strip()
-    if not x:
-        continue
-    print("LaTeX Equation: ", x)
-    x = x.replace('\\\\', '\\ \\')
-    text = LatexNodes2Text().latex_to_text(x)
-    text = replace_unicode_with_ascii(text)
-    text = remove_extra_spaces(text).strip()  # Stripping unnecessary spaces here
-    print("ASCII Equation: ", text)
-    out.write(text + "\n")
-    
-print("OUTPUT SAVED TO: OUTPUT.TXT")
-f.close()
-out.close()
+# Both of the above compiled into one rule set (add new cleanup rules here, not new passes)
+# collapsing every run first and then dropping the space after a backslash is the same as the two regexes
+LATEX_CLEANUP = textrules.RuleSet()
+LATEX_CLEANUP.add_chars(unicode_to_ascii)
+LATEX_CLEANUP.add_regex(r'\s+', ' ')  # Replace any consecutive spaces with a single space
+LATEX_CLEANUP.add_literal('\\ ', '\\')  # Remove spaces after a backslash
+
+# How many lines the fast path couldn't handle and had to go through pylatexenc
+fallback_count = 0
+_converter = None
+
+# pylatexenc only gets imported (and its converter built, once per process) when a line needs it
+def get_converter():
+    global _converter
+    if _converter is None:
+        from pylatexenc.latex2text import LatexNodes2Text
+        _converter = LatexNodes2Text()
+    return _converter
+
+# Convert one (already stripped) LaTeX line into an ASCII equation
+# tries the fastlatex subset translator first unless fast=False
+def latex_to_ascii(line, fast=True):
+    global fallback_count
+    line = line.replace('\\\\', '\\ \\')
+    if fast:
+        try:
+            return fastlatex.latex_to_ascii(line)
+        except fastlatex.Unsupported:
+            fallback_count += 1
+    text = get_converter().latex_to_text(line)
+    return LATEX_CLEANUP.apply(text).strip()  # Stripping unnecessary spaces here
+
+# Bump whenever latex_to_ascii output changes so cached lines from older runs miss
+CONVERTER_VERSION = 2
+CACHE_KIND = f"latex-{CONVERTER_VERSION}"
+
+# Serial conversion, yields (latex, ascii) pairs; cached lines cost one lookup
+def convert_serial(f, fast=True, cache=None, stats=runstats.NULL_STATS):
+    for x in f:
+        x = x.strip()
+        if not x:
+            continue
+        with stats.stage("cache"):
+            text = cache.get(CACHE_KIND, x) if cache else None
+        if text is None:
+            with stats.stage("latex"):
+                text = latex_to_ascii(x, fast)
+            if cache:
+                with stats.stage("cache"):
+                    cache.put(CACHE_KIND, x, text)
+        yield x, text
+
+# Parallel mode -- workers send back their fallback count with every chunk
+def _convert_chunk(task):
+    chunk, fast = task
+    before = fallback_count
+    texts = [latex_to_ascii(line, fast) for line in chunk]
+    return texts, fallback_count - before
+
+# Yield lists of up to chunk_size stripped, non-empty lines
+def read_chunks(f, chunk_size):
+    chunk = []
+    for x in f:
+        x = x.strip()
+        if not x:
+            continue
+        chunk.append(x)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# Convert lines on a process pool, yields (latex, ascii) pairs in the original line order
+# the cache is only touched from this process, workers just get the lines that missed
+# (with stats, "workers" is the time spent waiting on them)
+def convert_parallel(f, workers=None, chunk_size=500, fast=True, cache=None, stats=runstats.NULL_STATS):
+    from collections import deque
+    from multiprocessing import Pool
+    from os import cpu_count
+
+    window = 2 * (workers or cpu_count() or 1)  # chunks in flight, keeps memory bounded
+    pending = deque()
+    with Pool(workers) as pool:
+        for chunk in read_chunks(f, chunk_size):
+            with stats.stage("cache"):
+                texts = [cache.get(CACHE_KIND, x) for x in chunk] if cache else [None] * len(chunk)
+            misses = [x for x, text in zip(chunk, texts) if text is None]
+            result = pool.apply_async(_convert_chunk, ((misses, fast),)) if misses else None
+            pending.append((chunk, texts, result))
+            if len(pending) > window:
+                yield from _finish_chunk(*pending.popleft(), cache, stats)
+        while pending:
+            yield from _finish_chunk(*pending.popleft(), cache, stats)
+
+def _finish_chunk(chunk, texts, result, cache, stats=runstats.NULL_STATS):
+    global fallback_count
+    if result is not None:
+        with stats.stage("workers"):
+            converted, fallbacks = result.get()
+        fallback_count += fallbacks
+        converted = iter(converted)
+        for i, x in enumerate(chunk):
+            if texts[i] is None:
+                texts[i] = next(converted)
+                if cache:
+                    cache.put(CACHE_KIND, x, texts[i])
+    return zip(chunk, texts)
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert LaTeX equations in expressions.txt into ASCII in output.txt.")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="worker processes, 0 = one per CPU (default 1, no pool)")
+    parser.add_argument("--chunk-size", type=int, default=500, help="lines per task handed to a worker (default 500)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="don't print every equation")
+    parser.add_argument("--no-fast", action="store_true", help="send every line through pylatexenc")
+    parser.add_argument("--no-cache", action="store_true", help=f"don't read or write {convcache.DEFAULT_PATH}")
+    parser.add_argument("--clear-cache", action="store_true", help="empty the cache before converting")
+    parser.add_argument("--cache-size", type=int, default=convcache.DEFAULT_MAX_ENTRIES,
+                        help=f"max cached lines before the least recently used get dropped (default {convcache.DEFAULT_MAX_ENTRIES})")
+    parser.add_argument("--stats", action="store_true",
+                        help="print time per stage (pylatexenc/fastlatex, cache, printing, writing), lines/s and peak memory")
+    parser.add_argument("--stats-json", metavar="PATH", help="write the --stats numbers to PATH as JSON")
+    parser.add_argument("--profile", metavar="PATH", help="run under cProfile and dump the profile to PATH")
+    args = parser.parse_args(argv)
+
+    cache = convcache.open_cache(args.no_cache, args.clear_cache, max_entries=args.cache_size)
+    stats = runstats.open_stats(args.stats or bool(args.stats_json))
+
+    f = open("expressions.txt", "r")
+    out = open("output.txt", "w")
+    runstats.profiled(args.profile, convert, f, out, args, cache, stats)
+
+    if not args.no_fast:
+        print(f"PYLATEXENC FALLBACK: {fallback_count} LINES")
+    if cache:
+        cache.close()
+        print(cache.stats())
+    if stats.enabled:
+        stats.count("pylatexenc fallback", fallback_count)
+        stats.finish(cache).report(args.stats, args.stats_json)
+    print("OUTPUT SAVED TO: OUTPUT.TXT")
+    f.close()
+    out.close()
+
+# The main loop: convert f into out, printing every line unless --quiet
+def convert(f, out, args, cache=None, stats=runstats.NULL_STATS):
+    if args.jobs == 1:
+        pairs = convert_serial(f, not args.no_fast, cache, stats)
+    else:
+        pairs = convert_parallel(f, args.jobs or None, args.chunk_size, not args.no_fast, cache, stats)
+
+    for x, text in pairs:
+        stats.count("lines")
+        if not args.quiet:
+            with stats.stage("print"):
+                print("LaTeX Equation: ", x)
+                print("ASCII Equation: ", text)
+        with stats.stage("write"):
+            out.write(text + "\n")
+
+if __name__ == "__main__":
+    main()
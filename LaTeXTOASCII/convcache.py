@@ -0,0 +1,102 @@
+"""On-disk cache for converted lines.
+
+Entries live in a small sqlite file in the working directory, keyed by a hash
+of (kind, raw line). The kind carries the converter version, so bumping the
+version makes old entries miss instead of coming back wrong. Recency is a
+counter bumped on every hit/put; when the cache grows past max_entries the
+least recently used rows are dropped on flush().
+"""
+import hashlib
+import os
+import sqlite3
+from typing import Dict, Optional
+
+DEFAULT_PATH = ".mathaa-cache.sqlite"
+DEFAULT_MAX_ENTRIES = 500_000
+
+
+class ConversionCache:
+    """Persistent LRU cache mapping (kind, raw line) -> converted text."""
+
+    def __init__(self, path: str = DEFAULT_PATH, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._touched: Dict[bytes, int] = {}
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key BLOB PRIMARY KEY, value TEXT NOT NULL, used INTEGER NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS cache_used ON cache (used)")
+        self._tick = self.db.execute("SELECT COALESCE(MAX(used), 0) FROM cache").fetchone()[0]
+
+    @staticmethod
+    def key(kind: str, text: str) -> bytes:
+        return hashlib.blake2b(f"{kind}\0{text}".encode(), digest_size=16).digest()
+
+    def get(self, kind: str, text: str) -> Optional[str]:
+        """Return the cached value or None. Hits only get their recency bumped on flush()."""
+        key = self.key(kind, text)
+        row = self.db.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._tick += 1
+        self._touched[key] = self._tick
+        return row[0]
+
+    def put(self, kind: str, text: str, value: str) -> None:
+        key = self.key(kind, text)
+        self._tick += 1
+        self._touched.pop(key, None)
+        self.db.execute("INSERT OR REPLACE INTO cache (key, value, used) VALUES (?, ?, ?)", (key, value, self._tick))
+
+    def count(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def flush(self) -> None:
+        """Write back recency of hits, evict least recently used rows over the limit, commit."""
+        if self._touched:
+            self.db.executemany("UPDATE cache SET used = ? WHERE key = ?",
+                                ((used, key) for key, used in self._touched.items()))
+            self._touched.clear()
+        excess = self.count() - self.max_entries
+        if excess > 0:
+            self.db.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY used LIMIT ?)", (excess,)
+            )
+            self.evicted += excess
+        self.db.commit()
+
+    def clear(self) -> None:
+        self.db.execute("DELETE FROM cache")
+        self._touched.clear()
+        self.db.commit()
+
+    def close(self) -> None:
+        self.flush()
+        self.db.close()
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        rate = 100 * self.hits / total if total else 0.0
+        return f"CACHE: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate), {self.evicted} evicted"
+
+
+def open_cache(disabled: bool = False, clear: bool = False, path: str = DEFAULT_PATH,
+               max_entries: int = DEFAULT_MAX_ENTRIES) -> Optional[ConversionCache]:
+    """What the --no-cache/--clear-cache/--cache-size flags boil down to. None means don't cache."""
+    if disabled and not (clear and os.path.exists(path)):
+        return None
+    cache = ConversionCache(path, max_entries)
+    if clear:
+        cache.clear()
+    if disabled:
+        cache.close()
+        return None
+    return cache
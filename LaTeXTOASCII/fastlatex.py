@@ -0,0 +1,145 @@
+"""Fast path for the LaTeX that Desmos actually exports.
+
+One pass over the line, straight to the same ASCII that LatexNodes2Text +
+replace_unicode_with_ascii + remove_extra_spaces would give. Only knows the
+handful of constructs Desmos uses (\\frac, \\left/\\right, \\le/\\ge, \\ ,
+\\sqrt, \\sin and friends, \\pi ...) and raises Unsupported on anything else
+so the caller can fall back to pylatexenc. Doesn't import pylatexenc.
+"""
+
+
+class Unsupported(Exception):
+    """Raised when the line uses something the fast path doesn't know."""
+
+
+# Control words that take no arguments -> ASCII (already run through unicode_to_ascii)
+SYMBOLS = {
+    'le': '<=', 'leq': '<=', 'ge': '>=', 'geq': '>=', 'neq': '!=',
+    'pi': 'pi', 'infty': 'infinity', 'to': '->',
+    'times': '*', 'div': '/', 'cdot': '·', 'pm': '±', 'theta': 'θ',
+}
+
+# Function names pylatexenc prints as-is (\sec, \csc, \cot come out empty there, so they fall back)
+FUNCTIONS = {
+    'sin', 'cos', 'tan', 'arcsin', 'arccos', 'arctan', 'sinh', 'cosh', 'tanh',
+    'ln', 'log', 'exp', 'min', 'max',
+}
+
+# Control symbols: backslash + one non-letter
+CONTROL_SYMBOLS = {' ': ' ', '{': '{', '}': '}', ',': ' ', ';': ' ', '!': '', '%': '%'}
+
+# What \left and \right may be followed by
+DELIMITERS = {'(', ')', '[', ']', '|', '.'}
+
+# Characters with a special meaning in LaTeX that we don't handle (` also starts the !` ?` `` ligatures)
+SPECIAL = {'%', '~', '&', '$', '#', '`'}
+
+# Doubled characters pylatexenc turns into dashes/quotes (--, ---, '')
+LIGATURES = {'-', "'"}
+
+WHITESPACE = ' \t\r\n'
+
+
+def latex_to_ascii(line: str) -> str:
+    """Translate one LaTeX line to ASCII, or raise Unsupported."""
+    out = []
+    _parse(line, 0, out, False)
+    return " ".join("".join(out).split())
+
+
+def _skip_space(src: str, i: int) -> int:
+    while i < len(src) and src[i] in WHITESPACE:
+        i += 1
+    return i
+
+
+def _parse(src: str, i: int, out: list, in_group: bool) -> int:
+    """Translate src[i:] into out. Inside a group, stop at (and return the index of) the closing brace."""
+    n = len(src)
+    while i < n:
+        c = src[i]
+        if c == '\\':
+            i = _macro(src, i + 1, out)
+        elif c == '{':
+            i = _parse(src, i + 1, out, True) + 1
+        elif c == '}':
+            if in_group:
+                return i
+            raise Unsupported("unbalanced }")
+        elif c in SPECIAL or not c.isascii():
+            raise Unsupported(c)
+        elif c in LIGATURES and src.startswith(c, i + 1):
+            raise Unsupported(c + c)
+        else:
+            out.append(c)
+            i += 1
+    if in_group:
+        raise Unsupported("unbalanced {")
+    return i
+
+
+def _argument(src: str, i: int, out: list) -> int:
+    """Translate one macro argument: a {group}, a symbol macro or a single character."""
+    i = _skip_space(src, i)
+    if i >= len(src):
+        raise Unsupported("missing argument")
+    c = src[i]
+    if c == '{':
+        return _parse(src, i + 1, out, True) + 1
+    if c == '\\':
+        name, j = _control_word(src, i + 1)
+        if name not in SYMBOLS:
+            raise Unsupported('\\' + name)
+        out.append(SYMBOLS[name])
+        return j
+    if c == '}' or c == '[' or c in SPECIAL or not c.isascii():
+        raise Unsupported(c)
+    out.append(c)
+    return i + 1
+
+
+def _control_word(src: str, i: int):
+    """Read the letters of a control word starting at i, skip the spaces after it."""
+    j = i
+    while j < len(src) and src[j].isascii() and src[j].isalpha():
+        j += 1
+    return src[i:j], _skip_space(src, j)
+
+
+def _macro(src: str, i: int, out: list) -> int:
+    """Translate the macro whose backslash sits just before i."""
+    if i >= len(src):
+        raise Unsupported("trailing backslash")
+    if not (src[i].isascii() and src[i].isalpha()):
+        if src[i] not in CONTROL_SYMBOLS:
+            raise Unsupported('\\' + src[i])
+        out.append(CONTROL_SYMBOLS[src[i]])
+        return i + 1
+
+    name, i = _control_word(src, i)
+    if name in SYMBOLS:
+        out.append(SYMBOLS[name])
+        return i
+    if name in FUNCTIONS:
+        out.append(name)
+        return i
+    if name == 'frac':
+        i = _argument(src, i, out)
+        out.append('/')
+        return _argument(src, i, out)
+    if name == 'sqrt':
+        out.append('sqrt(')
+        i = _argument(src, i, out)
+        out.append(')')
+        return i
+    if name == 'operatorname' or name == 'mathrm':
+        return _argument(src, i, out)
+    if name == 'left' or name == 'right':
+        if i < len(src) and src[i] in DELIMITERS:
+            out.append(src[i])
+            return i + 1
+        if src.startswith('\\{', i) or src.startswith('\\}', i) or src.startswith('\\ ', i):
+            out.append(src[i + 1])
+            return i + 2
+        raise Unsupported('\\' + name)
+    raise Unsupported('\\' + name)
@@ -0,0 +1,208 @@
+"""Where the time goes: per-stage timings and counters for --stats, and the --profile hook.
+
+    stats = RunStats()
+    with stats.stage("parse"):
+        equation = parse_line(text)
+    stats.reject("bad expression")
+    print(stats.table())
+
+Stage times are exclusive: a stage entered inside another one pauses the outer
+one, so "pack" doesn't also count the "format" calls its generator pulls in and
+the column adds up to the total. iterate() times every next() of a generator as
+a stage, for the lazy parts of the pipeline.
+
+Turned off, code gets NULL_STATS, whose methods do nothing (a stage is one
+attribute lookup and an empty with block), so the instrumentation can stay in
+the hot loops. cProfile/pstats/json only get imported when --profile/--stats-json
+ask for them, every batch run imports this.
+"""
+import sys
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_memory() -> Optional[int]:
+    """Peak resident memory of this process in bytes, None where it can't be read cheaply."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class _Stage:
+    __slots__ = ("stats", "name")
+
+    def __init__(self, stats: "RunStats", name: str) -> None:
+        self.stats, self.name = stats, name
+
+    def __enter__(self) -> None:
+        self.stats._enter(self.name)
+
+    def __exit__(self, *exc) -> None:
+        self.stats._exit()
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+class RunStats:
+    """Wall time and calls per stage, plus counters, reject reasons and cache/memory numbers."""
+
+    enabled = True
+
+    def __init__(self) -> None:
+        self.seconds: Dict[str, float] = {}
+        self.calls: Counter = Counter()
+        self.counters: Counter = Counter()
+        self.rejects: Counter = Counter()
+        self.cache: Optional[Dict[str, int]] = None
+        self.peak_memory: Optional[int] = None
+        self._stack: List[list] = []
+        self._start = time.perf_counter()
+        self.total = 0.0
+
+    @property
+    def lines(self) -> int:
+        """Input lines, counted with count("lines")."""
+        return self.counters["lines"]
+
+    def stage(self, name: str) -> _Stage:
+        return _Stage(self, name)
+
+    def _enter(self, name: str) -> None:
+        now = time.perf_counter()
+        if self._stack:
+            outer = self._stack[-1]
+            self.seconds[outer[0]] = self.seconds.get(outer[0], 0.0) + now - outer[1]
+        self._stack.append([name, now])
+        self.calls[name] += 1
+
+    def _exit(self) -> None:
+        now = time.perf_counter()
+        name, since = self._stack.pop()
+        self.seconds[name] = self.seconds.get(name, 0.0) + now - since
+        if self._stack:
+            self._stack[-1][1] = now
+
+    def iterate(self, name: str, iterable: Iterable) -> Iterator:
+        """Yield from iterable, timing each step as stage name."""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] += n
+
+    def reject(self, reason: str) -> None:
+        self.rejects[reason] += 1
+
+    def finish(self, cache=None) -> "RunStats":
+        """Stop the clock and pick up cache hits and peak memory."""
+        self.total = time.perf_counter() - self._start
+        if cache is not None:
+            self.cache = {"hits": cache.hits, "misses": cache.misses, "evicted": cache.evicted}
+        self.peak_memory = peak_memory()
+        return self
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "total_seconds": round(self.total, 6),
+            "lines": self.lines,
+            "lines_per_s": round(self.lines / self.total, 1) if self.total else None,
+            "stages": {name: {"seconds": round(seconds, 6), "calls": self.calls[name],
+                              "calls_per_s": round(self.calls[name] / seconds, 1) if seconds else None}
+                       for name, seconds in self.seconds.items()},
+            "counters": {name: value for name, value in self.counters.items() if name != "lines"},
+            "rejects": dict(self.rejects),
+            "cache": self.cache,
+            "peak_memory_bytes": self.peak_memory,
+        }
+
+    def table(self) -> str:
+        rate = f" ({self.lines / self.total:,.0f} lines/s)" if self.total and self.lines else ""
+        rows = [f"STATS: {self.lines} lines in {self.total:.3f}s{rate}",
+                f"  {'stage':<12} {'seconds':>9} {'share':>6} {'calls':>9} {'calls/s':>12}"]
+        for name, seconds in sorted(self.seconds.items(), key=lambda item: -item[1]):
+            share = 100 * seconds / self.total if self.total else 0.0
+            per_s = f"{self.calls[name] / seconds:,.0f}" if seconds else "-"
+            rows.append(f"  {name:<12} {seconds:>9.3f} {share:>5.1f}% {self.calls[name]:>9} {per_s:>12}")
+        for name, value in self.counters.items():
+            if name != "lines":
+                rows.append(f"  {name}: {value}")
+        if self.rejects:
+            rows.append(f"  rejected: {sum(self.rejects.values())} "
+                        f"({', '.join(f'{count} {reason}' for reason, count in self.rejects.most_common())})")
+        if self.cache is not None:
+            rows.append(f"  cache: {self.cache['hits']} hits, {self.cache['misses']} misses")
+        if self.peak_memory is not None:
+            rows.append(f"  peak memory: {self.peak_memory / 2 ** 20:.1f} MiB")
+        return "\n".join(rows)
+
+    def report(self, show: bool = True, json_path: Optional[str] = None, file: Optional[TextIO] = None) -> None:
+        """What --stats / --stats-json do (the table goes to file, stdout by default)."""
+        if show:
+            print(self.table(), file=file)
+        if json_path:
+            import json
+            with open(json_path, "w") as f:
+                json.dump(self.as_dict(), f, indent=2)
+
+
+class _NullStats(RunStats):
+    """Stats turned off."""
+
+    enabled = False
+    _stage = _NullStage()
+
+    def stage(self, name: str) -> _NullStage:
+        return self._stage
+
+    def iterate(self, name: str, iterable: Iterable) -> Iterable:
+        return iterable
+
+    def count(self, name: str, n: int = 1) -> None:
+        pass
+
+    def reject(self, reason: str) -> None:
+        pass
+
+
+NULL_STATS = _NullStats()
+
+
+def open_stats(enabled: bool) -> RunStats:
+    """What the --stats/--stats-json flags boil down to."""
+    return RunStats() if enabled else NULL_STATS
+
+
+def profiled(path: Optional[str], func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run func under cProfile and dump the profile to path (for snakeviz/pstats), or just run it."""
+    if not path:
+        return func(*args, **kwargs)
+    import cProfile
+    import pstats
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(func, *args, **kwargs)
+    finally:
+        profile.dump_stats(path)
+        pstats.Stats(profile).sort_stats("cumulative").print_stats(15)
+        print(f"PROFILE SAVED TO: {path}")
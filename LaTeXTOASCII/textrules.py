@@ -0,0 +1,151 @@
+"""Compiled text rewrite rules.
+
+A RuleSet is an ordered list of rewrites that gets compiled once into a short
+plan of C-level string operations, instead of every caller doing its own chain
+of replace()/re.sub() passes:
+
+- character rules all go into one step that only touches the characters the
+  text actually contains (and is skipped outright for ASCII text when every
+  key is non-ASCII), so registering more characters never adds a pass
+- regex rules are one precompiled re.sub each, literal rules a str.replace
+
+Rules run in the order they were added. A single alternation regex over all
+the rules (it needs a Python callback per match to pick the replacement) and
+str.translate with multi-character values were both measured slower than the
+old replace() chains on our line lengths, which is why the plan looks like this.
+
+    rules = RuleSet()
+    rules.add_chars({'≤': '<='})
+    rules.add_regex(r'\\s+', ' ')
+    rules.apply('0 ≤  x')  # '0 <= x'
+
+Run this file to benchmark the compiled rules against the old functions.
+"""
+import re
+from typing import Callable, Dict, List, Match, Tuple, Union
+
+Replacement = Union[str, Callable[[Match], str]]
+
+CHARS, REGEX, LITERAL = "chars", "regex", "literal"
+
+# up to this many characters, just replace() each one instead of looking for which are there
+SMALL_MAP = 4
+
+
+class RuleSet:
+    """Ordered rewrites compiled into as few C-level passes as possible.
+
+    compile() (done on first use) rebinds apply on the instance to the compiled plan,
+    so rules.apply(text) costs one call plus the string operations themselves.
+    """
+
+    def __init__(self) -> None:
+        self._rules: List[Tuple[str, object, object]] = []
+
+    def add_chars(self, mapping: Dict[str, str]) -> "RuleSet":
+        """Rewrite single characters (keys must be one character long)."""
+        for char in mapping:
+            if len(char) != 1:
+                raise ValueError(f"character rule key must be one character: {char!r}")
+        return self._add((CHARS, dict(mapping), None))
+
+    def add_regex(self, pattern: str, replacement: Replacement, flags: int = 0) -> "RuleSet":
+        """Rewrite matches of pattern (same replacement rules as re.sub)."""
+        return self._add((REGEX, re.compile(pattern, flags), replacement))
+
+    def add_literal(self, old: str, new: str) -> "RuleSet":
+        """Rewrite every occurrence of a fixed string."""
+        return self._add((LITERAL, old, new))
+
+    def _add(self, rule) -> "RuleSet":
+        self._rules.append(rule)
+        self.__dict__.pop("apply", None)  # back to the compiling apply below
+        return self
+
+    def compile(self) -> Callable[[str], str]:
+        self.apply = _compile(self._rules)
+        return self.apply
+
+    def apply(self, text: str) -> str:
+        return self.compile()(text)
+
+    def __call__(self, text: str) -> str:
+        return self.apply(text)
+
+
+def _compile(rules) -> Callable[[str], str]:
+    plan = []
+    i = 0
+    while i < len(rules):
+        kind, arg, replacement = rules[i]
+        if kind == CHARS:
+            # every character rule up to the next non-character rule shares one step
+            mapping = {}
+            while i < len(rules) and rules[i][0] == CHARS:
+                for char, new in rules[i][1].items():
+                    mapping.setdefault(char, new)  # earlier rules win
+                i += 1
+            plan.append(_char_step(mapping))
+            continue
+        if kind == REGEX:
+            plan.append(lambda text, sub=arg.sub, r=replacement: sub(r, text))
+        else:
+            plan.append(lambda text, old=arg, new=replacement: text.replace(old, new))
+        i += 1
+
+    if not plan:
+        return lambda text: text
+    if len(plan) == 1:
+        return plan[0]
+
+    def run(text: str) -> str:
+        for step in plan:
+            text = step(text)
+        return text
+    return run
+
+
+def _char_step(mapping: Dict[str, str]) -> Callable[[str], str]:
+    if len(mapping) <= SMALL_MAP:
+        items = tuple(mapping.items())
+
+        def small_step(text: str) -> str:
+            for char, new in items:
+                text = text.replace(char, new)
+            return text
+        return small_step
+
+    keys = frozenset(mapping)
+    skip_ascii = not any(char.isascii() for char in keys)
+
+    def step(text: str) -> str:
+        if skip_ascii and text.isascii():
+            return text
+        for char in keys.intersection(text):
+            text = text.replace(char, mapping[char])
+        return text
+    return step
+
+
+if __name__ == "__main__":
+    import timeit
+    import LaTeXTOASCII
+
+    def best(func, items, number=5000):
+        return min(timeit.repeat(lambda: [func(*item) for item in items], number=number, repeat=5))
+
+    def report(name, old, new, items):
+        for item in items:
+            assert old(*item) == new(*item), item
+        t_old, t_new = best(old, items), best(new, items)
+        count = 5000 * len(items)
+        print(f"{name}: {count / t_old:>12,.0f} -> {count / t_new:>12,.0f} lines/s ({t_old / t_new:.2f}x)")
+
+    lines = [
+        (" {0.26 ≤x ≤0.4  }",), ("y  = 1/4x+0.7  {0.26 ≤x ≤0.71 }",), ("y = √(x) · π − 2 °",),
+        ("y =  -0.38 {-0.45 ≤x ≤-0.316 }",), ("y = sin(x)  \\  + 3×x ÷ 2",), ("y = 2x+1 {0<=x<=1}",),
+    ]
+    report("LaTeX cleanup      ",
+           lambda text: LaTeXTOASCII.remove_extra_spaces(LaTeXTOASCII.replace_unicode_with_ascii(text)),
+           LaTeXTOASCII.LATEX_CLEANUP, lines)
+